@@ -1,13 +1,167 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, session, g, has_request_context
+from flask import jsonify as flask_jsonify
 from flask_cors import CORS  # Add CORS support
 import re
-from io import StringIO
+from array import array
+from bisect import bisect_left
+import collections
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import base64
+import gzip
+import hashlib
+from io import BytesIO, StringIO
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import struct
 import sys
+import tempfile
+import threading
+import time
 import uuid
+import zlib
+
+from formats import pack_msgpack, pack_state, project
+from metrics import Counter, Gauge, Histogram, Registry
+from sessions import SessionStore, SQLiteSessionStore
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Server-side execution limits for /api/simulate. Requests may ask for
+# lower limits (max_instructions, time_limit in seconds) but never higher.
+app.config['MAX_INSTRUCTIONS'] = int(os.environ.get('MIPS_MAX_INSTRUCTIONS', 10_000_000))
+app.config['TIME_LIMIT'] = float(os.environ.get('MIPS_TIME_LIMIT', 10.0))
+
+# Times a basic block is interpreted before it is compiled; 0 disables
+# compilation and runs everything through the interpreter.
+app.config['JIT_THRESHOLD'] = int(os.environ.get('MIPS_JIT_THRESHOLD', 50))
+
+# Worker processes and maximum number of programs for /api/simulate-batch
+app.config['BATCH_WORKERS'] = int(os.environ.get('MIPS_BATCH_WORKERS', os.cpu_count() or 1))
+app.config['MAX_BATCH_SIZE'] = int(os.environ.get('MIPS_MAX_BATCH_SIZE', 500))
+
+# Asynchronous jobs (/api/jobs): worker threads, their own execution limits
+# and how long finished jobs are kept for polling
+app.config['JOB_WORKERS'] = int(os.environ.get('MIPS_JOB_WORKERS', 4))
+app.config['JOB_MAX_INSTRUCTIONS'] = int(os.environ.get('MIPS_JOB_MAX_INSTRUCTIONS', 1_000_000_000))
+app.config['JOB_TIME_LIMIT'] = float(os.environ.get('MIPS_JOB_TIME_LIMIT', 600.0))
+app.config['JOB_TTL'] = float(os.environ.get('MIPS_JOB_TTL', 3600.0))
+
+# Stepping sessions: idle seconds before a session is dropped, total memory
+# live sessions may hold, and optional hibernation of idle sessions to disk
+app.config['SESSION_TTL'] = float(os.environ.get('MIPS_SESSION_TTL', 3600.0))
+app.config['SESSION_MEMORY_BUDGET'] = int(os.environ.get('MIPS_SESSION_MEMORY_BUDGET', 256 << 20))
+app.config['SESSION_HIBERNATE_DIR'] = os.environ.get('MIPS_SESSION_HIBERNATE_DIR')
+app.config['SESSION_HIBERNATE_AFTER'] = float(os.environ.get('MIPS_SESSION_HIBERNATE_AFTER', 300.0))
+# Where sessions live: 'memory' (this process only) or 'sqlite', a database
+# file that several server processes can share
+app.config['SESSION_BACKEND'] = os.environ.get('MIPS_SESSION_BACKEND', 'memory')
+app.config['SESSION_DATABASE'] = os.environ.get('MIPS_SESSION_DATABASE', 'mips-sessions.sqlite3')
+# Bytes of undo journal and checkpoints each session keeps for /api/step-back
+app.config['SESSION_HISTORY_BYTES'] = int(os.environ.get('MIPS_SESSION_HISTORY_BYTES', 8 << 20))
+
+# Console output kept per run, in characters; anything beyond is cut off
+# behind a truncation marker. Background jobs spill the rest to a
+# temporary file instead, up to JOB_OUTPUT_LIMIT characters in total.
+app.config['OUTPUT_LIMIT'] = int(os.environ.get('MIPS_OUTPUT_LIMIT', 1 << 20))
+app.config['JOB_OUTPUT_LIMIT'] = int(os.environ.get('MIPS_JOB_OUTPUT_LIMIT', 64 << 20))
+
+# Largest window /api/memory returns, in bytes for a dense window and in
+# entries for a list of the non-zero ones
+app.config['MEMORY_WINDOW_LIMIT'] = int(os.environ.get('MIPS_MEMORY_WINDOW_LIMIT', 64 << 10))
+
+# Responses of at least this many bytes are gzipped for clients that
+# accept it; a negative value turns compression off
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('MIPS_COMPRESS_MIN_SIZE', 1024))
+
+# Per-phase request timings (Server-Timing header and /api/metrics)
+app.config['METRICS_ENABLED'] = os.environ.get('MIPS_METRICS', '1') != '0'
+
+# Number of assembled programs kept in the in-process LRU cache
+app.config['PROGRAM_CACHE_SIZE'] = int(os.environ.get('MIPS_PROGRAM_CACHE_SIZE', 256))
+
+# Instructions executed between wall-clock deadline checks
+WATCHDOG_INTERVAL = 1 << 16
+
+def record_phase(name, seconds):
+    """Add ``seconds`` to the current request's ``name`` phase. Does nothing
+    outside a request (job threads, batch workers)."""
+    if has_request_context() and app.config['METRICS_ENABLED']:
+        timings = g.setdefault('phase_timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+class phase:
+    """Time a block as a request phase: ``with phase('execute') as timer:``;
+    the duration is left in ``timer.seconds``."""
+    __slots__ = ('name', 'started', 'seconds')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.started
+        record_phase(self.name, self.seconds)
+
+# Response encodings a client can ask for in its Accept header; JSON
+# unless it prefers another (see formats.py)
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+STATE_MIMETYPE = 'application/vnd.mips-state'
+RESPONSE_MIMETYPES = (JSON_MIMETYPE,) + MSGPACK_MIMETYPES + (STATE_MIMETYPE,)
+
+def requested_fields():
+    """Return the 'fields' query parameter as a list, or None."""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+def response_mimetype():
+    return request.accept_mimetypes.best_match(RESPONSE_MIMETYPES, default=JSON_MIMETYPE)
+
+def render(body):
+    """Encode a response body as the request asks: narrowed to ``fields=``
+    and as JSON, MessagePack or (for bodies with a register snapshot) the
+    packed state layout."""
+    fields = requested_fields()
+    if fields is not None:
+        body = project(body, fields)
+    mimetype = response_mimetype()
+    data = body.get('data')
+    if mimetype in MSGPACK_MIMETYPES:
+        response = Response(pack_msgpack(body), mimetype=mimetype)
+    elif mimetype == STATE_MIMETYPE and isinstance(data, dict) and 'registers' in data:
+        response = Response(pack_state(data, REG_NAMES, seq=body.get('seq', 0),
+                                       delta=body.get('delta', False),
+                                       completed=body.get('completed', False)),
+                            mimetype=mimetype)
+    else:
+        response = flask_jsonify(body)
+    response.vary.add('Accept')
+    return response
+
+def jsonify(*args, **kwargs):
+    """flask.jsonify, timed as the request's 'serialize' phase. A single
+    dict body is encoded by render() for the current request."""
+    with phase('serialize'):
+        if has_request_context() and len(args) == 1 and not kwargs and isinstance(args[0], dict):
+            return render(args[0])
+        return flask_jsonify(*args, **kwargs)
+
+# /api/simulate-stream: events buffered before the simulation blocks, and
+# seconds between progress events and between keep-alive comments
+STREAM_QUEUE_SIZE = 256
+STREAM_PROGRESS_INTERVAL = 0.25
+STREAM_KEEPALIVE = 15.0
+
 # Register mapping from names to numbers (same as original)
 reg_map = {
     'zero': 0, 'at': 1,
@@ -21,8 +175,8 @@ reg_map = {
     'gp':28,  'sp':29,  'fp':30,  'ra':31
 }
 
-# Add a dictionary to store execution states
-execution_states = {}
+# Register names indexed by number
+REG_NAMES = tuple(sorted(reg_map, key=reg_map.get))
 
 # Original helper functions remain the same
 def get_register_number(reg_name):
@@ -35,11 +189,199 @@ def get_register_number(reg_name):
         raise ValueError(f"Unknown register name {reg_name}")
 
 def get_register_name(num):
-    for name, n in reg_map.items():
-        if n == num:
-            return name
+    if 0 <= num < len(REG_NAMES):
+        return REG_NAMES[num]
     raise ValueError(f"Unknown register number {num}")
 
+def to_int32(value):
+    """Wrap an arbitrary Python int to a signed 32-bit value."""
+    return ((value + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+class RegisterFile:
+    """The 32 general-purpose registers, indexed by number.
+
+    Values are kept as signed 32-bit ints in a fixed array; writes wrap
+    around and writes to $zero are ignored. The name-keyed dict the API
+    returns is only built by to_dict() when a response is serialized.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        self.values = array('i', bytes(128)) if values is None else array('i', values)
+        if values is None:
+            self.values[reg_map['sp']] = 0x7FFFFFFC
+
+    def __getitem__(self, num):
+        return self.values[num]
+
+    def __setitem__(self, num, value):
+        if num:
+            self.values[num] = to_int32(value)
+
+    def to_list(self):
+        return self.values.tolist()
+
+    def load(self, values):
+        values[0] = 0
+        self.values = array('i', values)
+
+    def to_dict(self):
+        return dict(zip(REG_NAMES, self.values))
+
+DATA_BASE = 0x10010000  # Start of the .data section
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS  # 4 KiB
+PAGE_MASK = PAGE_SIZE - 1
+WORD = struct.Struct('<i')
+
+class Memory:
+    """Sparse, byte-addressable, little-endian memory.
+
+    Storage is a dict of 4 KiB bytearray pages keyed by page number and
+    allocated on first write; reads of untouched memory return zero without
+    allocating. Addresses are taken modulo 2**32. Pages are never freed, so
+    the sorted index of page numbers only needs rebuilding after a page was
+    allocated.
+    """
+    __slots__ = ('pages', 'index')
+
+    def __init__(self):
+        self.pages = {}
+        self.index = []
+
+    def _page(self, number):
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = bytearray(PAGE_SIZE)
+        return page
+
+    def load_byte(self, addr):
+        addr &= 0xFFFFFFFF
+        page = self.pages.get(addr >> PAGE_BITS)
+        return page[addr & PAGE_MASK] if page is not None else 0
+
+    def store_byte(self, addr, value):
+        addr &= 0xFFFFFFFF
+        self._page(addr >> PAGE_BITS)[addr & PAGE_MASK] = value & 0xFF
+
+    def load_word(self, addr):
+        addr &= 0xFFFFFFFF
+        offset = addr & PAGE_MASK
+        if offset <= PAGE_SIZE - 4:
+            page = self.pages.get(addr >> PAGE_BITS)
+            return WORD.unpack_from(page, offset)[0] if page is not None else 0
+        return WORD.unpack(self.read(addr, 4))[0]
+
+    def store_word(self, addr, value):
+        addr &= 0xFFFFFFFF
+        offset = addr & PAGE_MASK
+        value = to_int32(value)
+        if offset <= PAGE_SIZE - 4:
+            WORD.pack_into(self._page(addr >> PAGE_BITS), offset, value)
+        else:
+            self.write(addr, WORD.pack(value))
+
+    def read(self, addr, length):
+        """Return ``length`` bytes starting at ``addr``."""
+        addr &= 0xFFFFFFFF
+        chunks = []
+        while length > 0:
+            offset = addr & PAGE_MASK
+            count = min(length, PAGE_SIZE - offset)
+            page = self.pages.get(addr >> PAGE_BITS)
+            chunks.append(page[offset:offset + count] if page is not None else bytes(count))
+            addr = (addr + count) & 0xFFFFFFFF
+            length -= count
+        return b''.join(chunks)
+
+    def write(self, addr, data):
+        """Copy ``data`` into memory starting at ``addr``."""
+        addr &= 0xFFFFFFFF
+        view = memoryview(data)
+        while view:
+            offset = addr & PAGE_MASK
+            count = min(len(view), PAGE_SIZE - offset)
+            self._page(addr >> PAGE_BITS)[offset:offset + count] = view[:count]
+            addr = (addr + count) & 0xFFFFFFFF
+            view = view[count:]
+
+    def fill(self, addr, data):
+        """Like write() into untouched memory, but all-zero pages are left
+        unallocated."""
+        addr &= 0xFFFFFFFF
+        view = memoryview(data)
+        while view:
+            count = min(len(view), PAGE_SIZE - (addr & PAGE_MASK))
+            chunk = view[:count]
+            if chunk.tobytes().count(0) != count:
+                self.write(addr, chunk)
+            addr = (addr + count) & 0xFFFFFFFF
+            view = view[count:]
+
+    def fill_repeated(self, addr, value, count):
+        """fill() with ``value`` repeated ``count`` times, built one page at
+        a time. ``addr`` must be a multiple of len(value)."""
+        addr &= 0xFFFFFFFF
+        block = value * (PAGE_SIZE // len(value))
+        remaining = len(value) * count
+        while remaining:
+            offset = addr & PAGE_MASK
+            length = min(PAGE_SIZE - offset, remaining)
+            self.fill(addr, block[offset:offset + length])
+            addr = (addr + length) & 0xFFFFFFFF
+            remaining -= length
+
+    def read_cstring(self, addr):
+        """Return the bytes from ``addr`` up to (not including) the next NUL."""
+        addr &= 0xFFFFFFFF
+        chunks = []
+        while True:
+            page = self.pages.get(addr >> PAGE_BITS)
+            if page is None:
+                break
+            offset = addr & PAGE_MASK
+            end = page.find(0, offset)
+            if end >= 0:
+                chunks.append(page[offset:end])
+                break
+            chunks.append(page[offset:])
+            addr = (addr + PAGE_SIZE - offset) & 0xFFFFFFFF
+        return b''.join(chunks)
+
+    def page_numbers(self):
+        """Return the numbers of the allocated pages in ascending order."""
+        if len(self.index) != len(self.pages):
+            self.index = sorted(self.pages)
+        return self.index
+
+    def items(self, start=0, end=1 << 32):
+        """Yield (address, byte) for every non-zero byte in [start, end), in
+        address order. Unallocated pages are skipped via the page index, so
+        a range costs O(log pages) plus the pages it covers."""
+        index = self.page_numbers()
+        first = bisect_left(index, start >> PAGE_BITS)
+        last = bisect_left(index, (end + PAGE_MASK) >> PAGE_BITS)
+        for number in index[first:last]:
+            base = number << PAGE_BITS
+            page = self.pages[number]
+            low = max(start - base, 0)
+            high = min(end - base, PAGE_SIZE)
+            if page.count(0, low, high) == high - low:
+                continue
+            for offset in range(low, high):
+                value = page[offset]
+                if value:
+                    yield base + offset, value
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def copy(self):
+        clone = Memory()
+        clone.pages = {number: bytearray(page) for number, page in self.pages.items()}
+        return clone
+
 # Modified to accept string content instead of file
 def read_asm_content(content):
     # Normalize line endings
@@ -53,13 +395,67 @@ def read_asm_content(content):
             instructions.append(line)
     return instructions
 
+# Data directives that store integers: element size and struct format.
+# Their data is aligned to the element size, as in SPIM and MARS.
+DATA_INTEGERS = {'.byte': (1, 'B'), '.half': (2, 'H'), '.word': (4, 'I')}
+DATA_LABEL = re.compile(r'([A-Za-z_][\w.]*)\s*:(.*)')
+MAX_ALIGN = 12  # .align n aligns to 2**n bytes, at most a page
+# Bytes of a program's .data that ``value:count`` repeats of non-zero values
+# may initialize in total (zero repeats, like .space, store nothing)
+MAX_DATA_REPEAT = 64 << 20
+
+def parse_data_value(text):
+    """Parse a numeric data operand: decimal (leading zeros allowed) or
+    with a 0x/0o/0b prefix."""
+    text = text.strip()
+    try:
+        return int(text, 0)
+    except ValueError:
+        return int(text)
+
+def data_items(operands, size, code):
+    """Return a .byte/.half/.word operand list as packed bytes objects,
+    ints (a number of zero bytes) and (packed value, count) pairs. An
+    operand ``value:count`` repeats the value ``count`` times; repeats are
+    never expanded here."""
+    mask = (1 << 8 * size) - 1
+    operands = operands.split(',')
+    if not any(':' in operand for operand in operands):
+        # A plain literal list, converted in one pass
+        try:
+            values = list(map(int, operands))
+        except ValueError:
+            values = [parse_data_value(operand) for operand in operands]
+        return [struct.pack(f'<{len(values)}{code}', *[value & mask for value in values])]
+    items = []
+    values = []
+    for operand in operands:
+        value, repeat, count = operand.partition(':')
+        value = parse_data_value(value) & mask
+        if not repeat:
+            values.append(value)
+            continue
+        count = parse_data_value(count)
+        if count < 0:
+            raise ValueError('negative repeat count')
+        if values:
+            items.append(struct.pack(f'<{len(values)}{code}', *values))
+            values = []
+        items.append(count * size if value == 0 else (struct.pack(f'<{code}', value), count))
+    if values:
+        items.append(struct.pack(f'<{len(values)}{code}', *values))
+    return items
+
 def parse_labels_and_instructions(instructions):
     labels = {}
     parsed_instructions = []
     pc = 0
     data_mode = False
-    memory = {}
-    current_address = 0x10010000  # Starting address for data section
+    memory = Memory()
+    current_address = DATA_BASE  # Starting address for data section
+    # Labels not yet followed by data; they move along if the data is aligned
+    pending_labels = []
+    repeated = 0  # bytes initialized by non-zero repeats so far
 
     for line in instructions:
         if line.startswith(".data"):
@@ -71,35 +467,68 @@ def parse_labels_and_instructions(instructions):
             continue
 
         if data_mode:
-            if ':' in line:
-                label, line_part = line.split(':', 1)
-                labels[label.strip()] = current_address
-                line = line_part.strip()
-            if line.startswith('.asciiz'):
-                # Extract the string content between quotes
-                match = re.search(r'\.asciiz\s*"([^"]*)"', line)
-                if match:
-                    string_data = match.group(1)
-                    # Process the string character by character
-                    i = 0
-                    while i < len(string_data):
-                        if string_data[i:i+2] == '\\n':
-                            # Store actual newline character
-                            memory[current_address] = ord('\n')
-                            i += 2
+            match = DATA_LABEL.match(line)
+            if match:
+                label, line = match.group(1), match.group(2).strip()
+                labels[label] = current_address
+                pending_labels.append(label)
+            if not line:
+                continue
+            directive, *operands = line.split(None, 1)
+            operands = operands[0] if operands else ''
+            try:
+                alignment = 1
+                if directive in DATA_INTEGERS:
+                    alignment = DATA_INTEGERS[directive][0]
+                elif directive == '.align':
+                    power = parse_data_value(operands)
+                    if not 0 <= power <= MAX_ALIGN:
+                        raise ValueError(f'alignment must be between 0 and {MAX_ALIGN}')
+                    alignment = 1 << power
+                current_address = -(-current_address // alignment) * alignment
+                for label in pending_labels:
+                    labels[label] = current_address
+                if directive in ('.asciiz', '.ascii'):
+                    # Extract the string content between quotes
+                    match = re.search(r'\.asciiz?\s*"([^"]*)"', line)
+                    if match:
+                        # Store the string with actual newline characters
+                        string_data = match.group(1).replace('\\n', '\n')
+                        data = string_data.encode('utf-8')
+                        if directive == '.asciiz':
+                            data += b'\0'
+                        memory.write(current_address, data)
+                        current_address += len(data)
+                elif directive in DATA_INTEGERS:
+                    size, code = DATA_INTEGERS[directive]
+                    for item in data_items(operands, size, code):
+                        if isinstance(item, int):
+                            # Untouched memory reads as zero: nothing to store
+                            current_address += item
+                        elif isinstance(item, tuple):
+                            value, count = item
+                            length = len(value) * count
+                            repeated += length
+                            if repeated > MAX_DATA_REPEAT:
+                                raise ValueError(f'repeats may initialize at most '
+                                                 f'{MAX_DATA_REPEAT} bytes')
+                            if current_address + length > 0x100000000:
+                                raise ValueError('repeat runs past the end of memory')
+                            memory.fill_repeated(current_address, value, count)
+                            current_address += length
                         else:
-                            memory[current_address] = ord(string_data[i])
-                            i += 1
-                        current_address += 1
-                    # Null terminate the string
-                    memory[current_address] = 0
-                    current_address += 1
-            elif line.startswith('.word'):
-                line = line.replace('.word', '').strip()
-                values = line.split(',')
-                for value in values:
-                    memory[current_address] = int(value)
-                    current_address += 4
+                            memory.fill(current_address, item)
+                            current_address += len(item)
+                elif directive == '.space':
+                    length = parse_data_value(operands)
+                    if length < 0:
+                        raise ValueError('negative size')
+                    current_address += length
+            except ValueError as e:
+                raise ValueError(f"Invalid data directive: {line} ({e})") from None
+            if current_address > 0xFFFFFFFF:
+                raise ValueError(f"Data section too large at: {line}")
+            pending_labels = []
         else:
             if ':' in line:
                 label, line_part = line.split(':', 1)
@@ -111,182 +540,6 @@ def parse_labels_and_instructions(instructions):
 
     return parsed_instructions, labels, memory
 
-def convert_to_binary(instruction, labels, current_pc):
-    opcodes = {
-        "addi": "001000",
-        "andi": "001100",
-        "ori": "001101",
-        "beq": "000100",
-        "bne": "000101",
-        "j": "000010",
-        "jal": "000011",
-        "lw": "100011",
-        "sw": "101011",
-        "lui": "001111",
-        "and": "000000",
-        "or": "000000",
-        "slt": "000000",
-        "add": "000000",
-        "sub": "000000",
-        "mul": "011100",  # Special MIPS opcode for multiplication
-        "sll": "000000",
-        "srl": "000000",
-        "jr": "000000",
-        "xor": "000000",
-        "nor": "000000",
-        "syscall": "000000",
-    }
-    functs = {
-        "and": "100100",
-        "or": "100101",
-        "slt": "101010",
-        "add": "100000",
-        "sub": "100010",
-        "mul": "000010",    # Function code for mul
-        "sll": "000000",
-        "srl": "000010",
-        "jr": "001000",
-        "xor": "100110",
-        "nor": "100111",
-        "syscall": "001100"
-    }
-
-    parts = re.split(r'[,\s()]+', instruction)
-    parts = [p for p in parts if p]  # Remove empty strings
-    op = parts[0]
-
-    try:
-        if op == "la":  # Handle load address instruction
-            rt_num = get_register_number(parts[1])
-            label = parts[2].strip()  # Remove any whitespace
-            if label not in labels:
-                raise ValueError(f"Label {label} not found")
-                
-            label_address = labels[label]
-            # Split into lui and ori instructions
-            upper = (label_address >> 16) & 0xFFFF
-            lower = label_address & 0xFFFF
-            
-            # Create lui instruction for upper bits
-            lui_inst = f"{opcodes['lui']}00000{format(rt_num, '05b')}{format(upper, '016b')}"
-            # Create ori instruction for lower bits
-            ori_inst = f"{opcodes['ori']}{format(rt_num, '05b')}{format(rt_num, '05b')}{format(lower, '016b')}"
-            
-            return [lui_inst, ori_inst]
-            
-        elif op == "li":
-            rd_num = get_register_number(parts[1])
-            imm_value = int(parts[2])
-            if -32768 <= imm_value <= 65535:
-                # Use addi with $zero
-                rs = format(0, '05b')  # $zero register
-                rd = format(rd_num, '05b')
-                imm = format(imm_value & 0xFFFF, '016b')
-                return f"{opcodes['addi']}{rs}{rd}{imm}"
-            else:
-                # For larger immediates, need lui and ori
-                # First instruction: lui rd, upper 16 bits
-                upper = (imm_value >> 16) & 0xFFFF
-                lower = imm_value & 0xFFFF
-                rd = format(rd_num, '05b')
-                rs = format(0, '05b')
-                lui_inst = f"{opcodes['lui']}{rs}{rd}{format(upper, '016b')}"
-                # Second instruction: ori rd, rd, lower 16 bits
-            ori_inst = f"{opcodes['ori']}{rd}{rd}{format(lower, '016b')}"
-            return [lui_inst, ori_inst]
-        elif op == "syscall":
-            return f"{opcodes[op]}00000000000000000000{functs[op]}"
-        elif op in ["addi", "andi", "ori"]:
-            rt_num = get_register_number(parts[1])
-            rs_num = get_register_number(parts[2])
-            imm = int(parts[3])
-            rs = format(rs_num, '05b')
-            rt = format(rt_num, '05b')
-            imm = format(imm & 0xFFFF, '016b')
-            return f"{opcodes[op]}{rs}{rt}{imm}"
-        elif op in ["lw", "sw"]:
-            rt_num = get_register_number(parts[1])
-            if len(parts) == 4:
-                # Format: lw $rt, offset($rs)
-                offset = int(parts[2])
-                base_num = get_register_number(parts[3])
-                rs = format(base_num, '05b')
-                rt = format(rt_num, '05b')
-                imm = format(offset & 0xFFFF, '016b')
-                return f"{opcodes[op]}{rs}{rt}{imm}"
-            elif len(parts) == 3:
-                # Format: lw $rt, label
-                address = labels.get(parts[2])
-                if address is None:
-                    raise ValueError(f"Label {parts[2]} not found")
-                rs = format(0, '05b')  # Using $zero as base
-                rt = format(rt_num, '05b')
-                imm = format(address & 0xFFFF, '016b')
-                return f"{opcodes[op]}{rs}{rt}{imm}"
-            else:
-                raise ValueError("Invalid lw/sw instruction format")
-        elif op in ["beq", "bne"]:
-            rs_num = get_register_number(parts[1])
-            rt_num = get_register_number(parts[2])
-            label = parts[3]
-            if label in labels:
-                offset = ((labels[label] - (current_pc + 4)) >> 2)
-                imm = format(offset & 0xFFFF, '016b')
-            else:
-                imm = "0000000000000000"
-            rs = format(rs_num, '05b')
-            rt = format(rt_num, '05b')
-            return f"{opcodes[op]}{rs}{rt}{imm}"
-        elif op == "j" or op == "jal":
-            label = parts[1]
-            if label in labels:
-                address = labels[label] >> 2
-                return f"{opcodes[op]}{format(address, '026b')}"
-            else:
-                return None
-        elif op in ["sll", "srl"]:
-            rd_num = get_register_number(parts[1])
-            rt_num = get_register_number(parts[2])
-            shamt = int(parts[3])
-            rs = format(0, '05b')
-            rt = format(rt_num, '05b')
-            rd = format(rd_num, '05b')
-            shamt = format(shamt & 0x1F, '05b')
-            funct = functs[op]
-            return f"{opcodes[op]}{rs}{rt}{rd}{shamt}{funct}"
-        elif op == "jr":
-            rs_num = get_register_number(parts[1])
-            rs = format(rs_num, '05b')
-            rt = "00000"
-            rd = "00000"
-            shamt = "00000"
-            funct = functs[op]
-            return f"{opcodes[op]}{rs}{rt}{rd}{shamt}{funct}"
-        elif op == "mul":
-            rd_num = get_register_number(parts[1])
-            rs_num = get_register_number(parts[2])
-            rt_num = get_register_number(parts[3])
-            rs = format(rs_num, '05b')
-            rt = format(rt_num, '05b')
-            rd = format(rd_num, '05b')
-            shamt = "00000"
-            funct = functs[op]
-            return f"{opcodes[op]}{rs}{rt}{rd}{shamt}{funct}"
-        else:
-            # R-type instructions (add, sub, and, or, slt, etc.)
-            rd_num = get_register_number(parts[1])
-            rs_num = get_register_number(parts[2])
-            rt_num = get_register_number(parts[3])
-            rs = format(rs_num, '05b')
-            rt = format(rt_num, '05b')
-            rd = format(rd_num, '05b')
-            shamt = "00000"
-            funct = functs[op]
-            return f"{opcodes[op]}{rs}{rt}{rd}{shamt}{funct}"
-    except Exception as e:
-        print(f"Error converting instruction: {instruction} -> {e}")
-        return None
-
 def generate_control_signals(op_code):
     signals = {
         'RegWrite': False,
@@ -347,24 +600,468 @@ def generate_control_signals(op_code):
         raise ValueError(f"Unsupported operation {op_code}")
     return signals
 
+# Pre-decoded instruction records.
+#
+# Every source line is decoded once at load time into an (op, a, b, c) tuple:
+# op is a small integer opcode id, a/b/c are register numbers, immediates or
+# absolute branch/jump targets depending on the opcode. The interpreter loop
+# only ever sees these tuples, never the instruction text.
+OPCODES = (
+    'add', 'sub', 'and', 'or', 'slt', 'mul', 'xor', 'nor', 'sll', 'srl',
+    'addi', 'andi', 'ori', 'li', 'lui', 'la', 'move',
+    'lw', 'sw', 'beq', 'bne', 'j', 'jal', 'jr', 'syscall',
+    'trap',  # internal: raises the decode error when executed
+    'nop',   # internal: register write to $zero
+    'break', # internal: debugger stop patched in by run_session
+)
+(OP_ADD, OP_SUB, OP_AND, OP_OR, OP_SLT, OP_MUL, OP_XOR, OP_NOR, OP_SLL, OP_SRL,
+ OP_ADDI, OP_ANDI, OP_ORI, OP_LI, OP_LUI, OP_LA, OP_MOVE,
+ OP_LW, OP_SW, OP_BEQ, OP_BNE, OP_J, OP_JAL, OP_JR, OP_SYSCALL,
+ OP_TRAP, OP_NOP, OP_BREAK) = range(len(OPCODES))
+OPCODE_IDS = {name: op for op, name in enumerate(OPCODES)}
+
+R_TYPE_OPS = frozenset((OP_ADD, OP_SUB, OP_AND, OP_OR, OP_SLT, OP_MUL, OP_XOR, OP_NOR))
+# Opcodes whose first operand is the destination register
+REG_WRITE_OPS = R_TYPE_OPS | {OP_SLL, OP_SRL, OP_ADDI, OP_ANDI, OP_ORI,
+                              OP_LI, OP_LUI, OP_LA, OP_MOVE, OP_LW}
+
+OPERAND_SPLIT = re.compile(r'[,\s()]+')
+
+def split_instruction(instruction):
+    return [p for p in OPERAND_SPLIT.split(instruction) if p]
+
+def _label_address(labels, label):
+    if label not in labels:
+        raise ValueError(f"Label {label} not found")
+    return labels[label]
+
+def _decode_operands(op, parts, labels):
+    reg = get_register_number
+    if op in R_TYPE_OPS:
+        return (op, reg(parts[1]), reg(parts[2]), reg(parts[3]))
+    elif op == OP_SLL or op == OP_SRL:
+        return (op, reg(parts[1]), reg(parts[2]), int(parts[3]))
+    elif op == OP_ADDI or op == OP_ANDI or op == OP_ORI:
+        return (op, reg(parts[1]), reg(parts[2]), to_int32(int(parts[3])))
+    elif op == OP_LI:
+        return (op, reg(parts[1]), to_int32(int(parts[2])), 0)
+    elif op == OP_LUI:
+        return (op, reg(parts[1]), to_int32(int(parts[2]) << 16), 0)
+    elif op == OP_LA:
+        return (op, reg(parts[1]), _label_address(labels, parts[2].strip()), 0)
+    elif op == OP_MOVE:
+        return (op, reg(parts[1]), reg(parts[2]), 0)
+    elif op == OP_LW or op == OP_SW:
+        if len(parts) == 4:
+            # Format: lw $rt, offset($rs)
+            return (op, reg(parts[1]), reg(parts[3]), int(parts[2]))
+        elif len(parts) == 3:
+            # Format: lw $rt, label (absolute address off $zero)
+            return (op, reg(parts[1]), 0, _label_address(labels, parts[2]))
+        raise ValueError(f"Invalid {parts[0]} instruction format")
+    elif op == OP_BEQ or op == OP_BNE:
+        return (op, reg(parts[1]), reg(parts[2]), _label_address(labels, parts[3]))
+    elif op == OP_J or op == OP_JAL:
+        return (op, _label_address(labels, parts[1]), 0, 0)
+    elif op == OP_JR:
+        return (op, reg(parts[1]), 0, 0)
+    return (op, 0, 0, 0)
+
+def decode_instruction(instruction, labels):
+    """Decode one source line into an (op, a, b, c) record.
+
+    Raises ValueError for empty lines, unsupported opcodes, shift amounts
+    outside 0..31 (which the machine-code encoding cannot hold) and
+    negative andi/ori immediates (which machine code zero-extends).
+    Other malformed operands (unknown registers or labels, bad immediates)
+    do not fail the load; they decode to a trap record that reports the
+    error only if the instruction is actually executed, as the text
+    interpreter used to.
+    """
+    parts = split_instruction(instruction)
+    if not parts:
+        raise ValueError('Empty instruction found')
+    op_code = parts[0]
+    generate_control_signals(op_code)  # Rejects unsupported operations
+    try:
+        record = _decode_operands(OPCODE_IDS[op_code], parts, labels)
+    except (ValueError, IndexError) as e:
+        return (OP_TRAP, str(e), 0, 0)
+    if (record[0] == OP_SLL or record[0] == OP_SRL) and not 0 <= record[3] <= 31:
+        raise ValueError(f"Shift amount must be between 0 and 31: {instruction}")
+    if (record[0] == OP_ANDI or record[0] == OP_ORI) and record[3] < 0:
+        raise ValueError(f"Logical immediate must not be negative: {instruction}")
+    if record[0] in REG_WRITE_OPS and record[1] == 0:
+        return (OP_NOP, 0, 0, 0)  # $zero is hardwired
+    return record
+
+def decode_program(parsed_instructions, labels):
+    return [decode_instruction(inst, labels) for inst in parsed_instructions]
+
+# Machine code. Decoded records are encoded into 32-bit MIPS words with the
+# text segment at address 0. Pseudo-instructions that need a full 32-bit
+# value (li with a large immediate, la, lw/sw of a label) expand to two
+# words, so text addresses in the image are not the simulator's pcs.
+
+# Primary opcode and funct field per OP_* id (0 where unused)
+OPCODE_FIELDS = [0] * len(OPCODES)
+FUNCT_FIELDS = [0] * len(OPCODES)
+for _op, _opcode in ((OP_ADDI, 0x08), (OP_ANDI, 0x0C), (OP_ORI, 0x0D), (OP_LUI, 0x0F),
+                     (OP_LW, 0x23), (OP_SW, 0x2B), (OP_BEQ, 0x04), (OP_BNE, 0x05),
+                     (OP_J, 0x02), (OP_JAL, 0x03), (OP_MUL, 0x1C)):
+    OPCODE_FIELDS[_op] = _opcode
+for _op, _funct in ((OP_ADD, 0x20), (OP_SUB, 0x22), (OP_AND, 0x24), (OP_OR, 0x25),
+                    (OP_SLT, 0x2A), (OP_XOR, 0x26), (OP_NOR, 0x27), (OP_MUL, 0x02),
+                    (OP_SLL, 0x00), (OP_SRL, 0x02), (OP_JR, 0x08), (OP_SYSCALL, 0x0C),
+                    (OP_MOVE, 0x21)):  # move is addu rd, rs, $zero
+    FUNCT_FIELDS[_op] = _funct
+REG_AT = 1
+
+def _fits_int16(value):
+    return -0x8000 <= value <= 0x7FFF
+
+def _word_count(record):
+    op, a, b, c = record
+    if op == OP_LI:
+        return 1 if -0x8000 <= b <= 0xFFFF else 2
+    if op == OP_LA:
+        return 2
+    if (op == OP_LW or op == OP_SW) and b == 0 and not _fits_int16(c):
+        return 2  # Label form: lui $at, hi; lw/sw $rt, lo($at)
+    return 1
+
+def encode_program(program, labels):
+    """Encode decoded ``program`` into machine code.
+
+    Returns (words, origins, image_labels): words is an array('I') holding
+    the text segment, origins[i] is the index of the instruction that word
+    i came from, and image_labels maps labels to their image addresses.
+    Raises ValueError for an instruction that cannot be encoded, such as
+    one whose immediate does not fit its 16-bit field (signed for addi and
+    lw/sw offsets, unsigned for andi/ori).
+    """
+    n = len(program)
+    # Word offset of every instruction (and of the end of the text segment)
+    offsets = array('I', bytes(4 * (n + 1)))
+    total = 0
+    for idx, record in enumerate(program):
+        offsets[idx] = total
+        total += _word_count(record)
+    offsets[n] = total
+    text_end = n << 2
+
+    def image_address(address):
+        if 0 <= address <= text_end and not address & 3:
+            return offsets[address >> 2] << 2
+        return address
+
+    opcode_fields = OPCODE_FIELDS
+    funct_fields = FUNCT_FIELDS
+    words = array('I', bytes(4 * total))
+    origins = array('I', bytes(4 * total))
+    for idx, (op, a, b, c) in enumerate(program):
+        at = offsets[idx]
+        second = None
+        if op in R_TYPE_OPS:
+            word = opcode_fields[op] << 26 | b << 21 | c << 16 | a << 11 | funct_fields[op]
+        elif op == OP_ADDI or op == OP_ANDI or op == OP_ORI:
+            if not (_fits_int16(c) if op == OP_ADDI else 0 <= c <= 0xFFFF):
+                raise ValueError(f"Immediate out of range in instruction {idx}")
+            word = opcode_fields[op] << 26 | b << 21 | a << 16 | (c & 0xFFFF)
+        elif op == OP_LW or op == OP_SW:
+            if offsets[idx + 1] - at == 2:
+                address = image_address(c) & 0xFFFFFFFF
+                low = ((address & 0xFFFF) ^ 0x8000) - 0x8000  # Sign-extended by lw/sw
+                word = OPCODE_FIELDS[OP_LUI] << 26 | REG_AT << 16 | ((address - low) >> 16 & 0xFFFF)
+                second = opcode_fields[op] << 26 | REG_AT << 21 | a << 16 | (low & 0xFFFF)
+            else:
+                if not _fits_int16(c):
+                    raise ValueError(f"Offset out of range in instruction {idx}")
+                word = opcode_fields[op] << 26 | b << 21 | a << 16 | (c & 0xFFFF)
+        elif op == OP_BEQ or op == OP_BNE:
+            offset = (image_address(c) - ((at + 1) << 2)) >> 2
+            if not _fits_int16(offset):
+                raise ValueError(f"Branch target out of range in instruction {idx}")
+            word = opcode_fields[op] << 26 | a << 21 | b << 16 | (offset & 0xFFFF)
+        elif op == OP_J or op == OP_JAL:
+            word = opcode_fields[op] << 26 | (image_address(a) >> 2 & 0x3FFFFFF)
+        elif op == OP_LI:
+            if _fits_int16(b):
+                word = OPCODE_FIELDS[OP_ADDI] << 26 | a << 16 | (b & 0xFFFF)
+            elif 0 <= b <= 0xFFFF:
+                word = OPCODE_FIELDS[OP_ORI] << 26 | a << 16 | b
+            else:
+                word = OPCODE_FIELDS[OP_LUI] << 26 | a << 16 | (b >> 16 & 0xFFFF)
+                second = OPCODE_FIELDS[OP_ORI] << 26 | a << 21 | a << 16 | (b & 0xFFFF)
+        elif op == OP_LA:
+            address = image_address(b)
+            word = OPCODE_FIELDS[OP_LUI] << 26 | a << 16 | (address >> 16 & 0xFFFF)
+            second = OPCODE_FIELDS[OP_ORI] << 26 | a << 21 | a << 16 | (address & 0xFFFF)
+        elif op == OP_LUI:
+            word = opcode_fields[op] << 26 | a << 16 | (b >> 16 & 0xFFFF)
+        elif op == OP_SLL or op == OP_SRL:
+            # decode_instruction has checked the shift amount
+            word = b << 16 | a << 11 | c << 6 | funct_fields[op]
+        elif op == OP_MOVE:
+            word = b << 21 | a << 11 | funct_fields[op]
+        elif op == OP_JR:
+            word = a << 21 | funct_fields[op]
+        elif op == OP_SYSCALL:
+            word = funct_fields[op]
+        elif op == OP_NOP:
+            word = 0
+        else:
+            raise ValueError(a if op == OP_TRAP else f"Cannot encode instruction {idx}")
+        words[at] = word
+        origins[at] = idx
+        if second is not None:
+            words[at + 1] = second
+            origins[at + 1] = idx
+
+    image_labels = {label: image_address(address) for label, address in labels.items()}
+    return words, origins, image_labels
+
+def source_line_numbers(content):
+    """Return the 1-based source line of each instruction, in the order
+    parse_labels_and_instructions() returns them."""
+    numbers = []
+    data_mode = False
+    for number, line in enumerate(content.replace('\r\n', '\n').split('\n'), 1):
+        line = line.partition('#')[0].strip()
+        if line.startswith('.data'):
+            data_mode = True
+        elif line.startswith('.text'):
+            data_mode = False
+        elif line and not data_mode:
+            if ':' in line:
+                line = line.split(':', 1)[1].strip()
+            if line:
+                numbers.append(number)
+    return numbers
+
+# Decoding machine words back into records. Decoded words are cached by
+# value; branch records are cached with a word offset in place of the
+# target, which decode_image() turns into an absolute address.
+_R_TYPE_FUNCTS = {0x20: OP_ADD, 0x21: OP_ADD, 0x22: OP_SUB, 0x24: OP_AND, 0x25: OP_OR,
+                  0x2A: OP_SLT, 0x26: OP_XOR, 0x27: OP_NOR}
+_I_TYPE_OPCODES = {0x08: OP_ADDI, 0x09: OP_ADDI, 0x0C: OP_ANDI, 0x0D: OP_ORI,
+                   0x23: OP_LW, 0x2B: OP_SW, 0x04: OP_BEQ, 0x05: OP_BNE}
+DECODED_WORD_CACHE_SIZE = 1 << 16
+_decoded_words = {}
+
+def decode_word(word):
+    """Decode a machine word into an (op, a, b, c) record; beq/bne get the
+    signed word offset as their target."""
+    opcode = word >> 26
+    rs = word >> 21 & 0x1F
+    rt = word >> 16 & 0x1F
+    rd = word >> 11 & 0x1F
+    imm = word & 0xFFFF
+    simm = (imm ^ 0x8000) - 0x8000
+    if opcode == 0:
+        funct = word & 0x3F
+        op = _R_TYPE_FUNCTS.get(funct)
+        if op is not None:
+            record = (op, rd, rs, rt)
+        elif funct == 0x00 or funct == 0x02:
+            record = (OP_SLL if funct == 0x00 else OP_SRL, rd, rt, word >> 6 & 0x1F)
+        elif funct == 0x08:
+            record = (OP_JR, rs, 0, 0)
+        elif funct == 0x0C:
+            record = (OP_SYSCALL, 0, 0, 0)
+        else:
+            record = None
+    elif opcode == 0x1C and word & 0x3F == 0x02:
+        record = (OP_MUL, rd, rs, rt)
+    elif opcode == 0x0F:
+        record = (OP_LUI, rt, to_int32(imm << 16), 0)
+    elif opcode == 0x02 or opcode == 0x03:
+        record = (OP_J if opcode == 0x02 else OP_JAL, (word & 0x3FFFFFF) << 2, 0, 0)
+    else:
+        op = _I_TYPE_OPCODES.get(opcode)
+        if op is None:
+            record = None
+        elif op == OP_BEQ or op == OP_BNE:
+            record = (op, rs, rt, simm)
+        else:
+            # andi/ori zero-extend their immediate
+            record = (op, rt, rs, imm if op == OP_ANDI or op == OP_ORI else simm)
+    if record is None:
+        return (OP_TRAP, f"Unknown instruction word 0x{word:08x}", 0, 0)
+    if record[0] in REG_WRITE_OPS and record[1] == 0:
+        return (OP_NOP, 0, 0, 0)  # $zero is hardwired
+    return record
+
+def decode_image(words):
+    """Decode a text segment of machine words into a program of records."""
+    cache = _decoded_words
+    program = []
+    append = program.append
+    for idx, word in enumerate(words):
+        record = cache.get(word)
+        if record is None:
+            if len(cache) >= DECODED_WORD_CACHE_SIZE:
+                cache.clear()
+            record = cache[word] = decode_word(word)
+        op = record[0]
+        if op == OP_BEQ or op == OP_BNE:
+            record = (op, record[1], record[2], (idx + 1 + record[3]) << 2)
+        append(record)
+    return program
+
+def data_segment(memory):
+    """Return the initialised .data bytes, up to the last non-zero byte."""
+    numbers = [number for number in memory.pages if number >= DATA_BASE >> PAGE_BITS]
+    if not numbers:
+        return b''
+    end = (max(numbers) + 1) << PAGE_BITS
+    return memory.read(DATA_BASE, end - DATA_BASE).rstrip(b'\0')
+
+# The immutable result of assembling a source file. ``memory`` is the initial
+# data image and must be copied before a program runs against it; ``blocks``
+# holds the program's compiled basic blocks (None when compilation is off).
+AssembledProgram = namedtuple('AssembledProgram', 'instructions labels program memory blocks')
+
+# A machine-code image as a cache key and load_image() input: the text
+# segment's length, its little-endian words, then the .data bytes
+IMAGE_HEADER = struct.Struct('<I')
+
+def image_blob(binary):
+    """Pack a machine-code image given in the /api/assemble output format
+    ('format', 'image' and optional 'data_image'). Raises ValueError."""
+    if not isinstance(binary, dict):
+        raise ValueError('binary must be an object')
+    output_format = binary.get('format', 'hex')
+    image = binary.get('image')
+    data = binary.get('data_image') or ''
+    try:
+        if output_format == 'hex' and isinstance(image, list) and isinstance(data, str):
+            text = array('I', (int(word, 16) for word in image))
+            if sys.byteorder != 'little':
+                text.byteswap()
+            text = text.tobytes()
+            data = bytes.fromhex(data)
+        elif output_format == 'base64' and isinstance(image, str) and isinstance(data, str):
+            text = base64.b64decode(image, validate=True)
+            data = base64.b64decode(data, validate=True)
+        else:
+            raise ValueError
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError(f"Invalid {output_format} machine-code image") from None
+    if len(text) % 4:
+        raise ValueError('Text image is not a whole number of words')
+    return IMAGE_HEADER.pack(len(text)) + text + data
+
+def load_image(blob):
+    """Build an AssembledProgram from image_blob() output, bypassing the
+    source parser. Instructions are listed as their hex words."""
+    text_len, = IMAGE_HEADER.unpack_from(blob)
+    offset = IMAGE_HEADER.size
+    words = array('I', blob[offset:offset + text_len])
+    if sys.byteorder != 'little':
+        words.byteswap()
+    memory = Memory()
+    memory.fill(DATA_BASE, blob[offset + text_len:])
+    program = tuple(decode_image(words))
+    return AssembledProgram(tuple(f'0x{word:08x}' for word in words), {}, program, memory,
+                            make_blocks(program))
+
+def load_program(code):
+    """Return the cached AssembledProgram for source code, or for a
+    machine-code image (a dict, see image_blob). Raises ValueError."""
+    if isinstance(code, dict):
+        return program_cache.get(image_blob(code), load_image)
+    return program_cache.get(code)
+
+def make_blocks(program):
+    threshold = app.config['JIT_THRESHOLD']
+    return BasicBlocks(program, threshold) if threshold > 0 else None
+
+def assemble(content):
+    """Parse and decode source code. Raises ValueError for invalid programs."""
+    with phase('read'):
+        instructions = read_asm_content(content)
+    with phase('parse'):
+        parsed_instructions, labels, memory = parse_labels_and_instructions(instructions)
+    try:
+        with phase('decode'):
+            program = decode_program(parsed_instructions, labels)
+    except ValueError as e:
+        raise ValueError(f"Invalid instruction: {str(e)}") from e
+    program = tuple(program)
+    return AssembledProgram(tuple(parsed_instructions), labels, program, memory,
+                            make_blocks(program))
+
+class ProgramCache:
+    """Thread-safe LRU cache of AssembledProgram keyed by a source hash.
+
+    Keys may also be bytes (a machine-code image), which are hashed as-is.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(content):
+        if isinstance(content, bytes):
+            return hashlib.blake2b(content, digest_size=16, person=b'image').digest()
+        # Line endings and surrounding whitespace never change the program
+        normalized = content.replace('\r\n', '\n').strip()
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, content, load=assemble):
+        """Return the assembled program for ``content``, building it with
+        ``load`` on a miss."""
+        key = self.key(content)
+        with self.lock:
+            assembled = self.entries.get(key)
+            if assembled is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return assembled
+            self.misses += 1
+        # Assemble outside the lock; a concurrent miss on the same source
+        # just assembles it twice.
+        assembled = load(content)
+        with self.lock:
+            self.entries[key] = assembled
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return assembled
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+program_cache = ProgramCache(app.config['PROGRAM_CACHE_SIZE'])
+
 def display_registers(reg):
     print("Registers:")
     for i in range(0, 32, 4):
-        reg_names = []
-        for num in range(i, i+4):
-            name = get_register_name(num)
-            reg_names.append(name)
-        print(f"${reg_names[0]:<3}: {reg[reg_names[0]]:10} | "
-              f"${reg_names[1]:<3}: {reg[reg_names[1]]:10} | "
-              f"${reg_names[2]:<3}: {reg[reg_names[2]]:10} | "
-              f"${reg_names[3]:<3}: {reg[reg_names[3]]:10}")
+        print(" | ".join(f"${get_register_name(num):<3}: {reg[num]:10}"
+                         for num in range(i, i+4)))
     print()
 
 def display_memory(memory):
     print("Memory:")
-    addresses = sorted(memory.keys())
-    for addr in addresses:
-        value = memory[addr]
+    for addr, value in memory.items():
         if 32 <= value <= 126:
             display_value = f"{value} ('{chr(value)}')"
         else:
@@ -372,46 +1069,134 @@ def display_memory(memory):
         print(f"Address {addr:08x}: {display_value}")
     print()
 
-def syscall(reg, memory, output_capture):
-    syscall_num = reg['v0']
-    if syscall_num == 1:  # print integer
-        output_capture.write(str(reg['a0']))
-    elif syscall_num == 4:  # print string
-        string_address = reg['a0']
-        # Read and output the string directly from memory
-        while memory.get(string_address, 0) != 0:
-            char_code = int(memory[string_address])
-            output_capture.write(chr(char_code))
-            string_address += 1
-    elif syscall_num == 10:  # exit
-        output_capture.write("Program exit\n")
-        return False
-    else:
-        output_capture.write(f"Unknown syscall: {syscall_num}\n")
-    return True
-
 # Modified syscall to capture output
+class InputBuffer:
+    """Pre-supplied standard input for the read syscalls, consumed a line
+    at a time from ``position``."""
+    __slots__ = ('text', 'position')
+
+    def __init__(self, text='', position=0):
+        self.text = text
+        self.position = position
+
+    def peek_line(self):
+        """The next line, including its newline, without consuming it."""
+        end = self.text.find('\n', self.position)
+        return self.text[self.position:] if end < 0 else self.text[self.position:end + 1]
+
+    def read_line(self):
+        line = self.peek_line()
+        self.position += len(line)
+        return line
+
 class OutputCapture:
-    def __init__(self):
+    """The console of a run: collects output and serves ``input``.
+
+    At most ``limit`` characters are kept in memory. With ``spill_limit``
+    the whole output (up to that many characters) also goes to a temporary
+    file from the moment the limit is first exceeded; spill_path names it
+    and close() removes it. Whatever does not fit is dropped, and
+    get_output() ends with a marker saying how much.
+    """
+
+    def __init__(self, input=None, limit=None, spill_limit=None):
+        self.input = input
+        self.limit = limit
+        self.spill_limit = spill_limit
         self.outputs = []
+        self.length = 0    # characters kept in outputs
+        self.dropped = 0   # characters not kept in outputs
+        self.spill = None
+        self.spill_path = None
+        self.spilled = 0
+
+    @property
+    def truncated(self):
+        return self.dropped > 0
 
     def write(self, text):
-        self.outputs.append(text)
+        length = self.length + len(text)
+        if self.limit is None or length <= self.limit:
+            self.outputs.append(text)
+            self.length = length
+            return
+        room = max(self.limit - self.length, 0)
+        if room:
+            self.outputs.append(text[:room])
+            self.length += room
+        self.dropped += len(text) - room
+        if self.spill_limit is not None:
+            if self.spill is None:
+                fd, self.spill_path = tempfile.mkstemp(prefix='mips-output-', suffix='.txt')
+                self.spill = open(fd, 'w', encoding='utf-8', newline='')
+                self._spill(''.join(self.outputs))
+                self._spill(text[room:])
+            else:
+                self._spill(text)
+
+    def _spill(self, text):
+        text = text[:max(self.spill_limit - self.spilled, 0)]
+        self.spill.write(text)
+        self.spilled += len(text)
 
     def get_output(self):
-        return ''.join(self.outputs)
+        output = ''.join(self.outputs)
+        if self.dropped:
+            output += f"\n[Output truncated: {self.dropped} more characters]\n"
+        return output
+
+    def read_spill(self):
+        """Yield the spilled output in chunks."""
+        self.spill.flush()
+        with open(self.spill_path, encoding='utf-8', newline='') as f:
+            while True:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    return
+                yield chunk
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            os.remove(self.spill_path)
+            self.spill = None
+
+def read_string_bytes(input, length):
+    """The bytes read string (syscall 8) stores for a buffer of ``length``
+    bytes: as many whole characters of the next line as fit in length - 1
+    bytes of UTF-8, then a NUL."""
+    if length <= 0:
+        return b''
+    line = input.peek_line() if input is not None else ''
+    data = line[:length - 1].encode('utf-8', 'replace')[:length - 1]
+    # Drop a character cut in half by the buffer size
+    return data.decode('utf-8', 'ignore').encode('utf-8') + b'\0'
 
 def syscall(reg, memory, output_capture):
-    syscall_num = reg['v0']
+    """Run the syscall selected by $v0; ``reg`` is indexed by register number."""
+    syscall_num = reg[2]  # $v0
     if syscall_num == 1:  # print integer
-        output_capture.write(str(reg['a0']))
+        output_capture.write(str(reg[4]))  # $a0
     elif syscall_num == 4:  # print string
-        string_address = reg['a0']
         # Read and output the string directly from memory
-        while memory.get(string_address, 0) != 0:
-            char_code = int(memory[string_address])
-            output_capture.write(chr(char_code))
-            string_address += 1
+        output_capture.write(memory.read_cstring(reg[4]).decode('utf-8', 'replace'))
+    elif syscall_num == 5:  # read integer
+        input = output_capture.input
+        line = input.read_line() if input is not None else ''
+        if not line:
+            raise ValueError('read_int: no input left')
+        try:
+            reg[2] = to_int32(int(line.strip()))
+        except ValueError:
+            raise ValueError(f"read_int: not an integer: {line.strip()!r}") from None
+    elif syscall_num == 8:  # read string into $a0, a buffer of $a1 bytes
+        input = output_capture.input
+        data = read_string_bytes(input, reg[5])
+        if data:
+            memory.write(reg[4], data)
+            # What did not fit in the buffer is left for the next read
+            if input is not None:
+                input.position += len(data[:-1].decode('utf-8'))
     elif syscall_num == 10:  # exit
         output_capture.write("Program exit\n")
         return False
@@ -419,526 +1204,2772 @@ def syscall(reg, memory, output_capture):
         output_capture.write(f"Unknown syscall: {syscall_num}\n")
     return True
 
-# Modified simulation function to return results including PC value
-def run_simulation(parsed_instructions, labels, memory):
-    output_capture = OutputCapture()
-    reg = {name: 0 for name in reg_map}
-    reg['zero'] = 0
-    reg['sp'] = 0x7FFFFFFC
-    pc = 0
+class ExecutionError(Exception):
+    """Raised when an instruction fails; carries the pc it failed at."""
 
-    instructions_list = []
-    pc_counter = 0
-    for inst in parsed_instructions:
-            instructions_list.append((inst, None, pc_counter))
-            pc_counter += 4
+    def __init__(self, pc, executed, error):
+        super().__init__(str(error))
+        self.pc = pc
+        self.executed = executed
 
-    inD = {pc: (inst, mc) for inst, mc, pc in instructions_list}
+def execute_program(program, regs, memory, pc, output_capture, max_steps=None):
+    """Interpret decoded ``program`` starting at ``pc``.
 
-    while pc in inD:
-        current_instruction, _ = inD[pc]
-        parts = re.split(r'[,\s()]+', current_instruction)
-        parts = [p for p in parts if p]
-        op_code = parts[0]
+    ``regs`` is a RegisterFile and is updated in place, as is ``memory``.
+    Execution stops when the pc leaves the text segment, on the exit
+    syscall, or after ``max_steps`` instructions.
 
-        try:
-            control_signals = generate_control_signals(op_code)
-
-            if control_signals['Move']:  # Handle move instruction
-                rd_name = get_register_name(get_register_number(parts[1]))
-                rs_name = get_register_name(get_register_number(parts[2]))
-                reg[rd_name] = reg[rs_name]
-            elif control_signals['LoadAddress']:  # Handle la instruction
-                rt_name = get_register_name(get_register_number(parts[1]))
-                label = parts[2].strip()
-                if label not in labels:
-                    raise ValueError(f"Label {label} not found")
-                reg[rt_name] = labels[label]
-            elif control_signals['Syscall']:
-                if not syscall(reg, memory, output_capture):
-                    break
-            elif control_signals['Jump']:
-                if op_code == 'j' or op_code == 'jal':
-                    label = parts[1]
-                    if label in labels:
-                        if op_code == 'jal':
-                            reg['ra'] = pc + 4
-                        pc = labels[label]
-                        continue
-                    else:
-                        raise ValueError(f"Label {label} not found")
-                elif op_code == 'jr':
-                    rs_name = get_register_name(get_register_number(parts[1]))
-                    pc = reg[rs_name]
-                    continue
-            elif control_signals['Branch']:
-                rs_name = get_register_name(get_register_number(parts[1]))
-                rt_name = get_register_name(get_register_number(parts[2]))
-                label = parts[3]
-                if op_code == 'beq' and reg[rs_name] == reg[rt_name]:
-                    pc = labels[label]
+    Returns (pc, executed, finished), where finished is False only when the
+    step limit was reached with the program still running.
+    """
+    # Work on a plain list for speed; results that can leave the signed
+    # 32-bit range are wrapped inline, and decode already turned writes to
+    # $zero into nops, so the list can be stored back as-is.
+    r = regs.to_list()
+    try:
+        return _interpret(program, r, memory, pc, output_capture,
+                          -1 if max_steps is None else max_steps)
+    finally:
+        regs.load(r)
+
+def _interpret(program, r, memory, pc, output_capture, limit):
+    """The interpreter loop behind execute_program; ``r`` is a plain list and
+    a ``limit`` of -1 means no step limit."""
+    pages = memory.pages
+    load_word = memory.load_word
+    store_word = memory.store_word
+    unpack_word = WORD.unpack_from
+    pack_word = WORD.pack_into
+    n = len(program)
+    executed = 0
+    try:
+        while executed != limit:
+            idx = pc >> 2
+            if pc & 3 or idx < 0 or idx >= n:
+                return pc, executed, True
+            op, a, b, c = program[idx]
+            executed += 1
+            if op == OP_ADDI:
+                r[a] = ((r[b] + c + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_ADD:
+                r[a] = ((r[b] + r[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_LW:
+                # Word within one existing page: read it in place
+                addr = (r[b] + c) & 0xFFFFFFFF
+                page = pages.get(addr >> PAGE_BITS)
+                offset = addr & PAGE_MASK
+                if page is not None and offset <= PAGE_SIZE - 4:
+                    r[a] = unpack_word(page, offset)[0]
+                else:
+                    r[a] = load_word(addr)
+            elif op == OP_SW:
+                addr = (r[b] + c) & 0xFFFFFFFF
+                page = pages.get(addr >> PAGE_BITS)
+                offset = addr & PAGE_MASK
+                if page is not None and offset <= PAGE_SIZE - 4:
+                    pack_word(page, offset, r[a])
+                else:
+                    store_word(addr, r[a])
+            elif op == OP_BEQ:
+                if r[a] == r[b]:
+                    pc = c
                     continue
-                elif op_code == 'bne' and reg[rs_name] != reg[rt_name]:
-                    pc = labels[label]
+            elif op == OP_BNE:
+                if r[a] != r[b]:
+                    pc = c
                     continue
-            else:
-                ALU_result = 0
-                if control_signals['ALUSrc']:
-                    if op_code in ['addi', 'andi', 'ori']:
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        rs_name = get_register_name(get_register_number(parts[2]))
-                        imm = int(parts[3])
-                        if op_code == 'addi':
-                            ALU_result = reg[rs_name] + imm
-                        elif op_code == 'andi':
-                            ALU_result = reg[rs_name] & imm
-                        elif op_code == 'ori':
-                            ALU_result = reg[rs_name] | imm
-                        if control_signals['RegWrite']:
-                            reg[rt_name] = ALU_result
-                    elif op_code == 'lui':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        imm = int(parts[2])
-                        if control_signals['RegWrite']:
-                            reg[rt_name] = imm << 16
-                    elif op_code == 'li':
-                        rd_name = get_register_name(get_register_number(parts[1]))
-                        imm = int(parts[2])
-                        if control_signals['RegWrite']:
-                            reg[rd_name] = imm
-                    elif op_code == 'lw':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        if len(parts) == 4:
-                            offset = int(parts[2])
-                            base_name = get_register_name(get_register_number(parts[3]))
-                            address = reg[base_name] + offset
-                        elif len(parts) == 3:
-                            label = parts[2]
-                            address = labels.get(label)
-                            if address is None:
-                                raise ValueError(f"Label {label} not found")
-                        else:
-                            raise ValueError("Invalid lw instruction format")
-                        if control_signals['MemRead']:
-                            data = memory.get(address, 0)
-                            if control_signals['RegWrite']:
-                                reg[rt_name] = data
-                    elif op_code == 'sw':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        if len(parts) == 4:
-                            offset = int(parts[2])
-                            base_name = get_register_name(get_register_number(parts[3]))
-                            address = reg[base_name] + offset
-                        elif len(parts) == 3:
-                            label = parts[2]
-                            address = labels.get(label)
-                            if address is None:
-                                raise ValueError(f"Label {label} not found")
-                        else:
-                            raise ValueError("Invalid sw instruction format")
-                        if control_signals['MemWrite']:
-                            memory[address] = reg[rt_name]
-                else:
-                    rd_name = get_register_name(get_register_number(parts[1]))
-                    rs_name = get_register_name(get_register_number(parts[2]))
-                    rt_name = get_register_name(get_register_number(parts[3]))
-                    if op_code == 'add':
-                        ALU_result = reg[rs_name] + reg[rt_name]
-                    elif op_code == 'sub':
-                        ALU_result = reg[rs_name] - reg[rt_name]
-                    elif op_code == 'and':
-                        ALU_result = reg[rs_name] & reg[rt_name]
-                    elif op_code == 'or':
-                        ALU_result = reg[rs_name] | reg[rt_name]
-                    elif op_code == 'slt':
-                        ALU_result = 1 if reg[rs_name] < reg[rt_name] else 0
-                    elif op_code == 'mul':
-                        ALU_result = reg[rs_name] * reg[rt_name]
-                    elif op_code == 'xor':
-                        ALU_result = reg[rs_name] ^ reg[rt_name]
-                    elif op_code == 'nor':
-                        ALU_result = ~(reg[rs_name] | reg[rt_name])
-                    elif op_code == 'sll':
-                        rt_name = get_register_name(get_register_number(parts[2]))
-                        shamt = int(parts[3])
-                        ALU_result = reg[rt_name] << shamt
-                    elif op_code == 'srl':
-                        rt_name = get_register_name(get_register_number(parts[2]))
-                        shamt = int(parts[3])
-                        ALU_result = reg[rt_name] >> shamt
-                    else:
-                        raise ValueError(f"Unsupported ALU operation {op_code}")
-                    if control_signals['RegWrite']:
-                        reg[rd_name] = ALU_result
+            elif op == OP_SLT:
+                r[a] = 1 if r[b] < r[c] else 0
+            elif op == OP_SUB:
+                r[a] = ((r[b] - r[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_SLL:
+                r[a] = (((r[b] << c) + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_SRL:
+                r[a] = ((((r[b] & 0xFFFFFFFF) >> c) + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_MUL:
+                r[a] = ((r[b] * r[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            elif op == OP_AND:
+                r[a] = r[b] & r[c]
+            elif op == OP_OR:
+                r[a] = r[b] | r[c]
+            elif op == OP_XOR:
+                r[a] = r[b] ^ r[c]
+            elif op == OP_NOR:
+                r[a] = ~(r[b] | r[c])
+            elif op == OP_ANDI:
+                r[a] = r[b] & c
+            elif op == OP_ORI:
+                r[a] = r[b] | c
+            elif op == OP_LI or op == OP_LUI or op == OP_LA:
+                r[a] = b
+            elif op == OP_MOVE:
+                r[a] = r[b]
+            elif op == OP_J:
+                pc = a
+                continue
+            elif op == OP_JAL:
+                r[31] = pc + 4
+                pc = a
+                continue
+            elif op == OP_JR:
+                pc = r[a]
+                continue
+            elif op == OP_SYSCALL:
+                if not syscall(r, memory, output_capture):
+                    return pc, executed, True
+            elif op == OP_TRAP:
+                raise ValueError(a)
+            elif op == OP_BREAK:
+                return pc, executed - 1, False
+            pc += 4
+    except Exception as e:
+        raise ExecutionError(pc, executed, e) from e
+    return pc, executed, False
 
-        except Exception as e:
-            output_capture.write(f"Error executing instruction: {current_instruction} -> {e}\n")
-            break
+# Tiered execution. A program is split into basic blocks; each block is
+# interpreted until it has been entered JIT_THRESHOLD times and is then
+# compiled into a generated Python function that keeps the registers it
+# touches in locals, so a hot block costs one dispatch instead of one per
+# instruction.
 
-        pc += 4
+_WRAP = '(({} + 0x80000000) & 0xFFFFFFFF) - 0x80000000'
 
-    memory_output = {hex(addr): str(value) for addr, value in memory.items()}
-    
-    return {
-        'registers': reg,
-        'memory': memory_output,
-        'console_output': output_capture.get_output(),
-        'pc': pc
-    }
+# Value written to the destination register, per opcode. {b}/{c} are
+# register operands, {imm} the immediate in the record's c slot.
+_BLOCK_TEMPLATES = {
+    OP_ADD: _WRAP.format('{b} + {c}'),
+    OP_SUB: _WRAP.format('{b} - {c}'),
+    OP_MUL: _WRAP.format('{b} * {c}'),
+    OP_AND: '{b} & {c}',
+    OP_OR: '{b} | {c}',
+    OP_XOR: '{b} ^ {c}',
+    OP_NOR: '~({b} | {c})',
+    OP_SLT: '1 if {b} < {c} else 0',
+    OP_SLL: _WRAP.format('({b} << {imm})'),
+    OP_SRL: _WRAP.format('(({b} & 0xFFFFFFFF) >> {imm})'),
+    OP_ADDI: _WRAP.format('{b} + {imm}'),
+    OP_ANDI: '{b} & {imm}',
+    OP_ORI: '{b} | {imm}',
+    OP_MOVE: '{b}',
+}
 
-@app.route('/api/simulate', methods=['POST'])
-def simulate_mips():
-    try:
-        if not request.is_json:
-            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+def _block_register(num):
+    return f'r{num}' if num else '0'
 
-        data = request.get_json()
-        if 'code' not in data:
-            return jsonify({'success': False, 'error': 'No code provided'}), 400
+def compile_block(program, start, end, record_accesses=False):
+    """Generate a function that runs the basic block program[start:end].
 
-        # Parse the assembly code
-        content = data['code']
-        instructions = read_asm_content(content)
-        
-        try:
-            parsed_instructions, labels, memory = parse_labels_and_instructions(instructions)
-            
-            # Validate instructions before execution
-            for instruction in parsed_instructions:
-                parts = re.split(r'[,\s()]+', instruction)
-                parts = [p for p in parts if p]
-                if not parts:
-                    return jsonify({
-                        'success': False,
-                        'error': 'Empty instruction found'
-                    }), 400
-                    
-                op_code = parts[0]
-                try:
-                    control_signals = generate_control_signals(op_code)
-                except ValueError as e:
-                    return jsonify({
-                        'success': False,
-                        'error': f"Invalid instruction: {str(e)}"
-                    }), 400
-            
-            results = run_simulation(parsed_instructions, labels, memory)
-            
-            return jsonify({
-                'success': True,
-                'data': results
-            }), 200
-            
-        except ValueError as e:
-            # Handle specific validation errors
-            return jsonify({
-                'success': False,
-                'error': str(e)
-            }), 400
+    The function is called as fn(r, memory, budget, access, output) with the
+    register list, the Memory, the number of instructions it may execute
+    (at least the block length), with ``record_accesses`` a callable that
+    is passed (instruction index, address) for every lw/sw, and the output
+    capture syscalls write to. It returns (next_pc, executed, finished),
+    where finished is set by the exit syscall. A block whose last
+    instruction branches back to its own start loops inside the function
+    for as long as the budget allows another full iteration. When an
+    instruction fails, the registers are written back and ExecutionError
+    reports the failing pc, counting the failing instruction as executed
+    like the interpreter does.
+    """
+    reg = _block_register
+    length = end - start
+    start_pc = start << 2
+    next_pc = end << 2
+    body = []
+    # Registers the block writes are loaded into locals on entry, along with
+    # the ones it reads, so they can be written back from any point in it
+    written = {register_written(record) for record in program[start:end]} - {None, 0}
+    used = set(written)
+    stores = [f'r[{num}] = r{num}' for num in sorted(written)]
+    memory_ops = False
+    exit_expr = str(next_pc)
+    loop_cond = None
+    op, a, _, c = program[end - 1]
+    loops = (((op == OP_BEQ or op == OP_BNE) and c == start_pc)
+             or ((op == OP_J or op == OP_JAL) and a == start_pc))
+    done = 'executed + ' if loops else ''  # instructions before this iteration
 
-    except Exception as e:
-        # Handle unexpected errors
-        return jsonify({
-            'success': False,
-            'error': f"Internal server error: {str(e)}"
-        }), 500
+    for k, idx in enumerate(range(start, end)):
+        op, a, b, c = program[idx]
+        used.update(registers_read(program[idx]))
+        if op in _BLOCK_TEMPLATES:
+            body.append(f'r{a} = ' + _BLOCK_TEMPLATES[op].format(b=reg(b), c=reg(c), imm=c))
+        elif op == OP_LI or op == OP_LUI or op == OP_LA:
+            body.append(f'r{a} = {b}')
+        elif op == OP_LW or op == OP_SW:
+            memory_ops = True
+            body.append(f'at = {k}')
+            body.append(f'addr = ({reg(b)} + {c}) & 0xFFFFFFFF')
+            if record_accesses:
+                body.append(f'access(({idx}, addr))')
+            body.append(f'page = pages.get(addr >> {PAGE_BITS})')
+            body.append(f'offset = addr & {PAGE_MASK}')
+            if op == OP_LW:
+                body.append(f'r{a} = unpack_word(page, offset)[0] '
+                            f'if page is not None and offset <= {PAGE_SIZE - 4} else load_word(addr)')
+            else:
+                body.append(f'if page is not None and offset <= {PAGE_SIZE - 4}:')
+                body.append(f'    pack_word(page, offset, {reg(a)})')
+                body.append('else:')
+                body.append(f'    store_word(addr, {reg(a)})')
+        elif op == OP_SYSCALL:
+            # The syscall reads $v0, $a0 and $a1 from the list and may set $v0
+            used.update((2, 4, 5))
+            body.append(f'at = {k}')
+            body += ['r[2] = r2', 'r[4] = r4', 'r[5] = r5']
+            body.append('if not syscall(r, memory, output):')
+            body += ['    ' + line for line in stores]
+            body.append(f'    return {idx << 2}, {done}{k + 1}, True')
+            body.append('r2 = r[2]')
+        elif op == OP_BEQ or op == OP_BNE:
+            cond = f"{reg(a)} {'==' if op == OP_BEQ else '!='} {reg(b)}"
+            if c == start_pc:
+                loop_cond = cond
+            else:
+                exit_expr = f'{c} if {cond} else {next_pc}'
+        elif op == OP_J or op == OP_JAL:
+            if op == OP_JAL:
+                body.append(f'r31 = {(idx << 2) + 4}')
+            if a == start_pc:
+                loop_cond = 'True'
+            else:
+                exit_expr = str(a)
+        elif op == OP_JR:
+            exit_expr = reg(a)
+        elif op != OP_NOP:
+            raise ValueError(f"Cannot compile {OPCODES[op]}")
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'version': '1.0.0'
-    })
+    lines = ['def block(r, memory, budget, access=None, output=None):']
+    if memory_ops:
+        lines += ['    pages = memory.pages',
+                  '    load_word = memory.load_word',
+                  '    store_word = memory.store_word']
+    lines += [f'    r{num} = r[{num}]' for num in sorted(used)]
+    lines.append('    at = 0')
+    if not body:
+        body.append('pass')
+    if loop_cond is None:
+        lines.append('    try:')
+        lines += ['        ' + line for line in body]
+    else:
+        lines.append('    executed = 0')
+        lines.append(f'    last = budget - {length}')
+        lines.append('    try:')
+        lines.append('        while True:')
+        lines += ['            ' + line for line in body]
+        lines.append(f'            executed += {length}')
+        lines.append(f'            if not ({loop_cond}) or executed > last:')
+        lines.append('                break')
+    lines.append('    except Exception as e:')
+    lines += ['        ' + line for line in stores]
+    lines.append(f'        raise ExecutionError({start_pc} + 4 * at, {done}at + 1, e) from e')
+    lines += ['    ' + line for line in stores]
+    if loop_cond is None:
+        lines.append(f'    return {exit_expr}, {length}, False')
+    else:
+        lines.append(f'    return ({start_pc} if {loop_cond} else {next_pc}), executed, False')
 
-# Error handlers
-@app.errorhandler(404)
-def not_found(e):
-    return jsonify({'error': 'Resource not found'}), 404
+    namespace = {'unpack_word': WORD.unpack_from, 'pack_word': WORD.pack_into,
+                 'syscall': syscall, 'ExecutionError': ExecutionError}
+    exec(compile('\n'.join(lines), f'<block {start_pc:#x}>', 'exec'), namespace)
+    return namespace['block']
 
-@app.errorhandler(500)
-def server_error(e):
-    return jsonify({'error': 'Internal server error'}), 500
+class BasicBlocks:
+    """Basic-block map of a decoded program and its compiled blocks.
 
-@app.route('/api/init-step', methods=['POST'])
-def init_step():
-    """Initialize stepping execution"""
-    try:
-        data = request.get_json()
-        if 'code' not in data:
-            return jsonify({'success': False, 'error': 'No code provided'}), 400
+    Blocks start at pc 0, at every branch/jump target and after every
+    control transfer. Trap and break records get blocks of their own and
+    are always interpreted; syscalls are compiled into their block like any
+    other instruction. Cached programs share one instance
+    across runs, so blocks that got hot in one run start out compiled in
+    the next. With ``record_accesses`` the compiled blocks report memory
+    accesses (see compile_block); such instances are made per run.
+    """
 
-        # Parse the code and prepare initial state
-        content = data['code']
-        instructions = read_asm_content(content)
-        parsed_instructions, labels, memory = parse_labels_and_instructions(instructions)
-        
-        # Create initial state
-        session_state = {
-            'instructions': parsed_instructions,
-            'labels': labels,
-            'memory': memory,
-            'pc': 0,
-            'registers': {name: 0 for name in reg_map},
-            'output_buffer': '',
-            'instruction_index': 0
-        }
-        
-        # Generate unique session ID
-        session_id = str(uuid.uuid4())
-        execution_states[session_id] = session_state
-        
-        return jsonify({
-            'success': True,
-            'session_id': session_id,
-            'total_instructions': len(parsed_instructions)
-        }), 200
+    def __init__(self, program, threshold, record_accesses=False):
+        self.program = program
+        self.threshold = threshold
+        self.record_accesses = record_accesses
+        n = len(program)
+        leaders = {0}
+        for idx, (op, a, b, c) in enumerate(program):
+            if op == OP_BEQ or op == OP_BNE:
+                leaders.update((c >> 2, idx + 1))
+            elif op == OP_J or op == OP_JAL:
+                leaders.update((a >> 2, idx + 1))
+            elif op == OP_JR:
+                leaders.add(idx + 1)
+            elif op == OP_TRAP or op == OP_BREAK:
+                leaders.update((idx, idx + 1))
+        starts = sorted(leader for leader in leaders if 0 <= leader < n)
+        # Indexed by instruction index; non-zero only at block starts
+        self.lengths = [0] * n
+        self.counts = [0] * n
+        self.functions = [None] * n
+        for start, end in zip(starts, starts[1:] + [n]):
+            self.lengths[start] = end - start
+        self.compiled = 0
 
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    def record(self, idx):
+        """Count an interpreted entry into the block at ``idx``."""
+        count = self.counts[idx] + 1
+        self.counts[idx] = count
+        if count == self.threshold:
+            self.compile(idx)
 
-@app.route('/api/step', methods=['POST'])
-def step_instruction():
-    """Execute next instruction in the stepping sequence"""
+    def compile(self, idx):
+        end = idx + self.lengths[idx]
+        for op, _, _, _ in self.program[idx:end]:
+            if op == OP_TRAP or op == OP_BREAK:
+                return
+        self.functions[idx] = compile_block(self.program, idx, end, self.record_accesses)
+        self.compiled += 1
+
+def _trace_block(trace, idx, length, count):
+    # One segment per iteration of a compiled loop, the last one partial
+    # when the block stopped at an exit syscall or a failing instruction
+    if count == length:
+        trace.append((idx, length))
+        return
+    iterations, rest = divmod(count, length)
+    trace.extend([(idx, length)] * iterations)
+    if rest:
+        trace.append((idx, rest))
+
+def execute_tiered(program, blocks, regs, memory, pc, output_capture, max_steps=None,
+                   trace=None, accesses=None):
+    """Like execute_program, but runs hot basic blocks as compiled functions.
+
+    Cold blocks go through the interpreter one block at a time. A compiled
+    block only runs when the remaining step budget covers the whole block,
+    so step limits are honoured exactly. Execution also stops in front of
+    a break record.
+
+    When a ``trace`` list is given, every straight-line run of instructions
+    is appended to it as a (first instruction index, count) segment, one
+    per iteration of a compiled loop. An ``accesses`` list gets an
+    (instruction index, address) pair per lw/sw; ``blocks`` must then have
+    been made with record_accesses.
+    """
+    r = regs.to_list()
+    access = None if accesses is None else accesses.append
+    lengths = blocks.lengths
+    functions = blocks.functions
+    n = len(program)
+    limit = sys.maxsize if max_steps is None else max_steps
+    executed = 0
     try:
-        data = request.get_json()
+        while executed < limit:
+            idx = pc >> 2
+            if pc & 3 or idx < 0 or idx >= n:
+                return pc, executed, True
+            remaining = limit - executed
+            length = lengths[idx]
+            fn = functions[idx]
+            if fn is not None and remaining >= length:
+                try:
+                    pc, count, finished = fn(r, memory, remaining, access, output_capture)
+                except ExecutionError as e:
+                    if trace is not None:
+                        _trace_block(trace, idx, length, e.executed)
+                    e.executed += executed
+                    raise
+                if trace is not None:
+                    _trace_block(trace, idx, length, count)
+                if finished:
+                    return pc, executed + count, True
+            else:
+                if length:
+                    blocks.record(idx)
+                else:
+                    # Entered mid-block (e.g. through jr): single-step to a block start
+                    length = 1
+                try:
+                    if access is None:
+                        pc, count, finished = _interpret(program, r, memory, pc, output_capture,
+                                                         min(length, remaining))
+                    else:
+                        pc, count, finished = _interpret_accesses(
+                            program, r, memory, pc, output_capture, min(length, remaining), access)
+                except ExecutionError as e:
+                    if trace is not None and e.executed:
+                        trace.append((idx, e.executed))
+                    e.executed += executed
+                    raise
+                if trace is not None and count:
+                    trace.append((idx, count))
+                if finished:
+                    return pc, executed + count, True
+                if not count:
+                    return pc, executed, False  # break record
+            executed += count
+    finally:
+        regs.load(r)
+    return pc, executed, False
+
+# Instrumentation. Probes are optional models that watch a run without
+# affecting it: run_simulation collects the trace of executed segments (and,
+# for probes with ``accesses`` set, of lw/sw addresses) from execute_tiered
+# and hands it to each probe's consume() after every chunk. Once execution
+# has stopped it calls probe.finish(pc) with the pc it stopped at, then adds
+# probe.report() to the results under the probe's name. Step sessions can
+# carry probes too; they finish them when the program completes.
+
+class PipelineModel:
+    """Cycle accounting for a classic 5-stage pipeline (IF ID EX MEM WB).
+
+    The model assumes full forwarding into EX (from EX/MEM at distance 1,
+    from MEM/WB at distance 2; the register file is written before it is
+    read), a one-cycle stall when an instruction needs the result of the
+    load right before it, and predict-not-taken fetch: a taken branch
+    flushes ``branch_penalty`` instructions (resolved in EX) and a jump
+    ``jump_penalty`` (resolved in ID).
+
+    Hazards only reach back two instructions, so the cost of a segment is
+    fixed by the two segments before it. consume() therefore just counts
+    consecutive segment triples (a C-level Counter over zip) and report()
+    costs each distinct triple once.
+    """
+    name = 'pipeline'
+    accesses = False
+    OPTIONS = {'branch_penalty': 2, 'jump_penalty': 1}
+
+    def __init__(self, program, instructions, branch_penalty=2, jump_penalty=1):
+        self.instructions = instructions
+        n = len(program)
+        # Per instruction index, plus a sentinel bubble at index n
+        self.reads = [registers_read(record) for record in program] + [()]
+        self.writes = [register_written(record) or -1 for record in program] + [-1]
+        self.loads = [record[0] == OP_LW for record in program] + [False]
+        self.penalty = [branch_penalty if op == OP_BEQ or op == OP_BNE
+                        else jump_penalty if op == OP_J or op == OP_JAL or op == OP_JR
+                        else 0 for op, _, _, _ in program] + [0]
+        self.triples = collections.Counter()
+        self.tail = [(n, 1), (n, 1)]
+
+    @classmethod
+    def options(cls, config):
+        """Validate request options (True or a dict) into constructor kwargs."""
+        return _probe_options(cls, config)
+
+    def consume(self, trace, accesses):
+        segments = self.tail + trace
+        self.triples.update(zip(segments, segments[1:], segments[2:]))
+        self.tail = segments[-2:]
+
+    def _cost(self, a, b, c):
+        """Stall cycles and forwarded operands of instruction ``c`` executed
+        after ``b`` and ``a``, and the flush cycles between ``b`` and ``c``."""
+        reads = self.reads[c]
+        flush = self.penalty[b] if c != b + 1 else 0
+        stalls = ex_mem = mem_wb = 0
+        if reads:
+            writes_a = self.writes[a]
+            writes_b = self.writes[b]
+            # Distance (in cycles) from b and from a to c
+            near = 1 + flush
+            far = near + 1 + (self.penalty[a] if b != a + 1 else 0)
+            if self.loads[a] and writes_a in self.reads[b]:
+                far += 1
+            if near == 1 and self.loads[b] and writes_b in reads:
+                stalls = 1
+                near += 1
+                far += 1
+            for num in reads:
+                distance = near if num == writes_b else far if num == writes_a else 0
+                if distance == 1:
+                    ex_mem += 1
+                elif distance == 2:
+                    mem_wb += 1
+        return stalls, ex_mem, mem_wb, flush
+
+    def finish(self, pc):
+        pass
+
+    def report(self):
+        n = len(self.instructions)
+        executions = [0] * (n + 1)
+        stalls = [0] * (n + 1)
+        forwards = [0] * (n + 1)
+        flushes = [0] * (n + 1)       # taken branches/jumps, by control instruction
+        flush_cycles = [0] * (n + 1)
+        totals = [0, 0, 0, 0]         # stalls, ex_mem, mem_wb, flush cycles
+        for (first, second, (start, count)), times in self.triples.items():
+            # The two instructions executed before this segment
+            b = second[0] + second[1] - 1
+            a = b - 1 if second[1] >= 2 else first[0] + first[1] - 1
+            for c in range(start, start + count):
+                stall, ex_mem, mem_wb, flush = self._cost(a, b, c)
+                executions[c] += times
+                stalls[c] += stall * times
+                forwards[c] += (ex_mem + mem_wb) * times
+                if flush:
+                    flushes[b] += times
+                    flush_cycles[b] += flush * times
+                totals[0] += stall * times
+                totals[1] += ex_mem * times
+                totals[2] += mem_wb * times
+                totals[3] += flush * times
+                a, b = b, c
+        instructions = sum(executions)
+        cycles = instructions + 4 + totals[0] + totals[3] if instructions else 0
+        per_instruction = [{
+            'pc': idx << 2,
+            'instruction': self.instructions[idx],
+            'executions': executions[idx],
+            'cycles': executions[idx] + stalls[idx] + flush_cycles[idx],
+            'stalls': stalls[idx],
+            'forwards': forwards[idx],
+            'flushes': flushes[idx],
+            'flush_cycles': flush_cycles[idx]
+        } for idx in range(n) if executions[idx]]
+        return {
+            'cycles': cycles,
+            'instructions': instructions,
+            'cpi': cycles / instructions if instructions else None,
+            'load_use_stalls': totals[0],
+            'forwards': {'ex_mem': totals[1], 'mem_wb': totals[2]},
+            'flushes': sum(flushes),
+            'flush_cycles': totals[3],
+            'per_instruction': per_instruction
+        }
+
+def _power_of_two(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0 \
+        and value & (value - 1) == 0
+
+class CacheModel:
+    """A data cache fed with the address of every lw/sw.
+
+    ``size`` and ``block_size`` are bytes (powers of two), ``associativity``
+    the number of ways per set; 'lru' or 'fifo' replacement. 'write-back'
+    allocates on a write miss and writes dirty blocks back when they are
+    evicted; 'write-through' sends every store to memory and does not
+    allocate on a write miss.
+
+    With ``sizes``, the same pass also measures the LRU stack distance of
+    every access (how many distinct other blocks were touched since the
+    last access to its block), which gives the misses of a fully
+    associative LRU cache of every one of those sizes at once. Each of the
+    ``depth`` most recently used blocks marks the timestamp of its last
+    access in a Fenwick tree, so a distance is one prefix count, in
+    O(log depth) time.
+    """
+    name = 'cache'
+    accesses = True
+    OPTIONS = {'size': 4096, 'block_size': 16, 'associativity': 1,
+               'replacement': 'lru', 'write_policy': 'write-back', 'sizes': ()}
+    MAX_SIZES = 32
+    MAX_SIZE = 1 << 22  # bytes; bounds the set lists and the stack distance array
+
+    def __init__(self, program, instructions, size=4096, block_size=16, associativity=1,
+                 replacement='lru', write_policy='write-back', sizes=()):
+        self.instructions = instructions
+        self.size = size
+        self.block_size = block_size
+        self.associativity = associativity
+        self.replacement = replacement
+        self.write_policy = write_policy
+        self.offset_bits = block_size.bit_length() - 1
+        self.set_count = size // (block_size * associativity)
+        self.sets = [[] for _ in range(self.set_count)]  # tags, oldest/least recent first
+        self.dirty = set()
+        self.stores = [record[0] == OP_SW for record in program]
+        self.pc_accesses = array('Q', bytes(8 * len(program)))
+        self.pc_misses = array('Q', bytes(8 * len(program)))
+        self.reads = self.writes = self.read_misses = self.write_misses = 0
+        self.evictions = self.writebacks = self.memory_writes = 0
+        self.sizes = sorted(set(sizes))
+        if self.sizes:
+            self.depth = self.sizes[-1] // block_size
+            # Timestamps run from 1 to capacity, then are renumbered
+            self.capacity = max(2 * self.depth, 1024)
+            self.tree = array('I', bytes(4 * (self.capacity + 1)))
+            self.owners = [None] * (self.capacity + 1)  # block last accessed at a timestamp
+            self.last = {}         # timestamp of the last access, for at most depth blocks
+            self.clock = 0         # latest timestamp
+            self.oldest = 1        # no block's timestamp is earlier
+            self.seen = set()
+            self.distances = array('Q', bytes(8 * self.depth))
+            self.cold = 0
+            self.beyond = 0        # seen before, but deeper than the largest size
+
+    @classmethod
+    def options(cls, config):
+        """Validate request options (True or a dict) into constructor kwargs."""
+        if config is True:
+            config = {}
+        if not isinstance(config, dict):
+            raise ValueError('cache must be true or an object of options')
+        unknown = set(config) - set(cls.OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown cache option: {', '.join(sorted(unknown))}")
+        options = dict(cls.OPTIONS, **config)
+        for key in ('size', 'block_size', 'associativity'):
+            value = options[key]
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                raise ValueError(f'cache.{key} must be a positive integer')
+        if not _power_of_two(options['size']) or not _power_of_two(options['block_size']):
+            raise ValueError('cache.size and cache.block_size must be powers of two')
+        if options['size'] > cls.MAX_SIZE:
+            raise ValueError(f'cache.size must not exceed {cls.MAX_SIZE}')
+        if options['block_size'] < 4:
+            raise ValueError('cache.block_size must be at least one word')
+        if options['size'] % (options['block_size'] * options['associativity']):
+            raise ValueError('cache.size must be a multiple of block_size * associativity')
+        if options['replacement'] not in ('lru', 'fifo'):
+            raise ValueError("cache.replacement must be 'lru' or 'fifo'")
+        if options['write_policy'] not in ('write-back', 'write-through'):
+            raise ValueError("cache.write_policy must be 'write-back' or 'write-through'")
+        sizes = options['sizes']
+        if (not isinstance(sizes, (list, tuple)) or len(sizes) > cls.MAX_SIZES
+                or not all(_power_of_two(value) and options['block_size'] <= value <= cls.MAX_SIZE
+                           for value in sizes)):
+            raise ValueError(f'cache.sizes must be a list of at most {cls.MAX_SIZES} powers '
+                             f'of two between block_size and {cls.MAX_SIZE}')
+        options['sizes'] = tuple(sizes)
+        return options
+
+    def consume(self, trace, accesses):
+        sets = self.sets
+        set_count = self.set_count
+        ways_per_set = self.associativity
+        offset_bits = self.offset_bits
+        stores = self.stores
+        pc_accesses = self.pc_accesses
+        pc_misses = self.pc_misses
+        dirty = self.dirty
+        lru = self.replacement == 'lru'
+        write_back = self.write_policy == 'write-back'
+        distances = bool(self.sizes)
+        for idx, address in accesses:
+            block = address >> offset_bits
+            store = stores[idx]
+            pc_accesses[idx] += 1
+            if store:
+                self.writes += 1
+                if not write_back:
+                    self.memory_writes += 1
+            else:
+                self.reads += 1
+            if distances:
+                self._stack_distance(block)
+            ways = sets[block % set_count]
+            if block in ways:
+                if lru and ways[-1] != block:
+                    ways.remove(block)
+                    ways.append(block)
+                if store and write_back:
+                    dirty.add(block)
+                continue
+            pc_misses[idx] += 1
+            if store:
+                self.write_misses += 1
+                if not write_back:
+                    continue  # no write allocate
+            else:
+                self.read_misses += 1
+            if len(ways) == ways_per_set:
+                victim = ways.pop(0)
+                self.evictions += 1
+                if victim in dirty:
+                    dirty.discard(victim)
+                    self.writebacks += 1
+            ways.append(block)
+            if store:
+                dirty.add(block)
+
+    def _stack_distance(self, block):
+        last = self.last
+        tree = self.tree
+        capacity = self.capacity
+        time = last.get(block)
+        if time == self.clock and time is not None:
+            self.distances[0] += 1
+            return
+        if time is None:
+            if block in self.seen:
+                self.beyond += 1
+            else:
+                self.seen.add(block)
+                self.cold += 1
+        else:
+            # Blocks touched since: marks after ``time``
+            i = time
+            earlier = 0
+            while i:
+                earlier += tree[i]
+                i &= i - 1
+            self.distances[len(last) - earlier] += 1
+            i = time
+            while i <= capacity:
+                tree[i] -= 1
+                i += i & -i
+            self.owners[time] = None
+            del last[block]
+        if self.clock == capacity:
+            self._renumber()
+        self.clock += 1
+        i = time = self.clock
+        while i <= capacity:
+            tree[i] += 1
+            i += i & -i
+        last[block] = time
+        self.owners[time] = block
+        if len(last) > self.depth:
+            # Drop the least recently used block
+            owners = self.owners
+            oldest = self.oldest
+            while owners[oldest] is None:
+                oldest += 1
+            del last[owners[oldest]]
+            owners[oldest] = None
+            i = oldest
+            while i <= capacity:
+                tree[i] -= 1
+                i += i & -i
+            self.oldest = oldest + 1
+
+    def _renumber(self):
+        # Give the tracked blocks timestamps 1..n in the same order
+        order = sorted(self.last, key=self.last.get)
+        tree = self.tree
+        owners = self.owners
+        capacity = self.capacity
+        for i in range(capacity + 1):
+            tree[i] = 0
+            owners[i] = None
+        for time, block in enumerate(order, 1):
+            self.last[block] = time
+            owners[time] = block
+            tree[time] = 1
+        # Build the tree in place: every node adds its sum to its parent
+        for i in range(1, capacity):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self.clock = len(order)
+        self.oldest = 1
+
+    def finish(self, pc):
+        pass
+
+    def report(self):
+        accesses = self.reads + self.writes
+        misses = self.read_misses + self.write_misses
+        per_pc = sorted(({
+            'pc': idx << 2,
+            'instruction': self.instructions[idx],
+            'accesses': count,
+            'misses': self.pc_misses[idx]
+        } for idx, count in enumerate(self.pc_accesses) if count),
+            key=lambda row: (-row['misses'], row['pc']))
+        report = {
+            'size': self.size,
+            'block_size': self.block_size,
+            'associativity': self.associativity,
+            'sets': self.set_count,
+            'replacement': self.replacement,
+            'write_policy': self.write_policy,
+            'accesses': accesses,
+            'reads': self.reads,
+            'writes': self.writes,
+            'hits': accesses - misses,
+            'misses': misses,
+            'read_misses': self.read_misses,
+            'write_misses': self.write_misses,
+            'hit_rate': (accesses - misses) / accesses if accesses else None,
+            'evictions': self.evictions,
+            'writebacks': self.writebacks,
+            'memory_writes': self.memory_writes,
+            'per_pc': per_pc
+        }
+        if self.sizes:
+            # Accesses at stack distance >= the size in blocks miss
+            deeper = self.beyond
+            misses_at = {}
+            bound = self.depth
+            for size in reversed(self.sizes):
+                blocks = size // self.block_size
+                deeper += sum(self.distances[blocks:bound])
+                bound = blocks
+                misses_at[size] = self.cold + deeper
+            report['sizes'] = [{
+                'size': size,
+                'misses': misses_at[size],
+                'hit_rate': (accesses - misses_at[size]) / accesses if accesses else None
+            } for size in self.sizes]
+        return report
+
+# Control instruction kinds for BranchPredictorModel
+BRANCH, CALL, RETURN = 1, 2, 3
+# Next state of a 2-bit saturating counter after a taken/not-taken branch
+COUNTER_TAKEN = bytes((1, 2, 3, 3))
+COUNTER_NOT_TAKEN = bytes((0, 0, 1, 2))
+
+class BranchPredictorModel:
+    """Runs several branch predictors side by side over the same run.
+
+    Conditional branches (beq/bne) are predicted by static not-taken, a
+    table of 1-bit last-outcome bits, a table of 2-bit saturating counters
+    and gshare (2-bit counters indexed by the branch address xor the last
+    ``history_bits`` outcomes). Tables have 2**``table_bits`` entries and
+    are bytearrays indexed by instruction index. jal pushes its return
+    address on a ``ras_depth`` entry return-address stack (the oldest entry
+    is lost when it is full) and jr is predicted to return to its top.
+
+    Only the last instruction of a trace segment can transfer control, so
+    its outcome is whether the next segment starts right after it.
+    """
+    name = 'branch_prediction'
+    accesses = False
+    OPTIONS = {'table_bits': 10, 'history_bits': 8, 'ras_depth': 16}
+    PREDICTORS = ('static_not_taken', 'one_bit', 'two_bit', 'gshare')
+
+    def __init__(self, program, instructions, table_bits=10, history_bits=8, ras_depth=16):
+        self.instructions = instructions
+        self.table_bits = table_bits
+        self.history_bits = history_bits
+        self.ras_depth = ras_depth
+        n = len(program)
+        self.kinds = bytearray(BRANCH if op == OP_BEQ or op == OP_BNE
+                               else CALL if op == OP_JAL
+                               else RETURN if op == OP_JR else 0
+                               for op, _, _, _ in program)
+        size = 1 << table_bits
+        self.one_bit = bytearray(size)              # 1 predicts taken
+        self.two_bit = bytearray(b'\x01' * size)    # 0-3, 2 and up predict taken
+        self.gshare = bytearray(b'\x01' * size)
+        self.history = 0
+        self.ras = []
+        # Per instruction index
+        self.executions = array('I', bytes(4 * n))
+        self.taken = array('I', bytes(4 * n))
+        self.mispredicts = {name: array('I', bytes(4 * n)) for name in self.PREDICTORS}
+        self.ras_mispredicts = array('I', bytes(4 * n))
+        self.pending = None   # control instruction that ended the last segment
+        self.previous = None  # and that segment
+
+    @classmethod
+    def options(cls, config):
+        """Validate request options (True or a dict) into constructor kwargs."""
+        options = dict(cls.OPTIONS, **_probe_options(cls, config))
+        if not 1 <= options['table_bits'] <= 20:
+            raise ValueError('branch_prediction.table_bits must be between 1 and 20')
+        if options['history_bits'] > options['table_bits']:
+            raise ValueError('branch_prediction.history_bits must not exceed table_bits')
+        return options
+
+    def consume(self, trace, accesses):
+        kinds = self.kinds
+        executions = self.executions
+        taken_counts = self.taken
+        static_misses = self.mispredicts['static_not_taken']
+        one_bit_misses = self.mispredicts['one_bit']
+        two_bit_misses = self.mispredicts['two_bit']
+        gshare_misses = self.mispredicts['gshare']
+        ras_mispredicts = self.ras_mispredicts
+        one_bit = self.one_bit
+        two_bit = self.two_bit
+        gshare = self.gshare
+        mask = (1 << self.table_bits) - 1
+        history_mask = (1 << self.history_bits) - 1
+        # Once the history holds nothing but one outcome, every table entry
+        # a repeated branch uses settles within three more executions
+        settle = self.history_bits + 3
+        ras = self.ras
+        ras_depth = self.ras_depth
+        history = self.history
+
+        def resolve(prev, target, times):
+            """Record ``times`` executions of control instruction ``prev``
+            that all went on to ``target``."""
+            nonlocal history
+            kind = kinds[prev]
+            executions[prev] += times
+            if kind == BRANCH:
+                taken = target != prev + 1
+                if taken:
+                    taken_counts[prev] += times
+                    static_misses[prev] += times
+                update = COUNTER_TAKEN if taken else COUNTER_NOT_TAKEN
+                i = prev & mask
+                # Past settle, all predictors get a repeated outcome right
+                for _ in range(times if times < settle else settle):
+                    if one_bit[i] != taken:
+                        one_bit_misses[prev] += 1
+                        one_bit[i] = taken
+                    counter = two_bit[i]
+                    if (counter >= 2) != taken:
+                        two_bit_misses[prev] += 1
+                    two_bit[i] = update[counter]
+                    j = (prev ^ history) & mask
+                    counter = gshare[j]
+                    if (counter >= 2) != taken:
+                        gshare_misses[prev] += 1
+                    gshare[j] = update[counter]
+                    history = ((history << 1) | taken) & history_mask
+            elif kind == CALL:
+                for _ in range(times if times <= ras_depth else ras_depth + 1):
+                    ras.append(prev + 1)
+                    if len(ras) > ras_depth:
+                        del ras[0]
+            else:
+                for _ in range(times):
+                    if (ras.pop() if ras else None) != target:
+                        ras_mispredicts[prev] += 1
+
+        prev = self.pending
+        previous = self.previous
+        repeats = 0
+        for segment in trace:
+            if segment == previous:
+                # A loop iterating again: the same outcome as last time
+                repeats += 1
+                continue
+            if repeats:
+                if prev is not None:
+                    resolve(prev, previous[0], repeats)
+                repeats = 0
+            if prev is not None:
+                resolve(prev, segment[0], 1)
+            previous = segment
+            last = segment[0] + segment[1] - 1
+            prev = last if kinds[last] else None
+        if repeats and prev is not None:
+            resolve(prev, previous[0], repeats)
+        self.history = history
+        self.pending = prev
+        self.previous = previous
+
+    def finish(self, pc):
+        """Resolve the control instruction that ended the last segment
+        against the ``pc`` execution stopped at."""
+        if self.pending is not None:
+            # An empty segment at pc: it resolves the pending outcome and
+            # nothing else
+            self.consume([(pc >> 2, 0)], ())
+        self.pending = self.previous = None
+
+    def _row(self, idx):
+        return {
+            'pc': idx << 2,
+            'instruction': self.instructions[idx],
+            'executions': self.executions[idx]
+        }
+
+    def report(self):
+        kinds = self.kinds
+        branches = [idx for idx, kind in enumerate(kinds) if kind == BRANCH and self.executions[idx]]
+        returns = [idx for idx, kind in enumerate(kinds) if kind == RETURN and self.executions[idx]]
+        executed = sum(self.executions[idx] for idx in branches)
+        predictors = {}
+        for name in self.PREDICTORS:
+            misses = sum(self.mispredicts[name][idx] for idx in branches)
+            predictors[name] = {
+                'mispredicts': misses,
+                'accuracy': 1 - misses / executed if executed else None
+            }
+        per_branch = []
+        for idx in branches:
+            row = self._row(idx)
+            row['taken'] = self.taken[idx]
+            row['mispredicts'] = {name: self.mispredicts[name][idx] for name in self.PREDICTORS}
+            row['accuracy'] = {name: 1 - misses / row['executions']
+                               for name, misses in row['mispredicts'].items()}
+            per_branch.append(row)
+        per_return = []
+        for idx in returns:
+            row = self._row(idx)
+            row['mispredicts'] = self.ras_mispredicts[idx]
+            per_return.append(row)
+        returned = sum(self.executions[idx] for idx in returns)
+        ras_misses = sum(self.ras_mispredicts[idx] for idx in returns)
+        return {
+            'table_bits': self.table_bits,
+            'history_bits': self.history_bits,
+            'ras_depth': self.ras_depth,
+            'branches': executed,
+            'taken': sum(self.taken[idx] for idx in branches),
+            'predictors': predictors,
+            'returns': {
+                'executions': returned,
+                'mispredicts': ras_misses,
+                'accuracy': 1 - ras_misses / returned if returned else None
+            },
+            'per_branch': per_branch,
+            'per_return': per_return
+        }
+
+# Probes that /api/simulate and /api/init-step can enable by name
+PROBES = {probe.name: probe for probe in (PipelineModel, CacheModel, BranchPredictorModel)}
+
+def _probe_options(probe, config):
+    if config is True:
+        return {}
+    if not isinstance(config, dict):
+        raise ValueError(f'{probe.name} must be true or an object of options')
+    options = {}
+    for key, value in config.items():
+        default = probe.OPTIONS.get(key)
+        if default is None:
+            raise ValueError(f'Unknown {probe.name} option: {key}')
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f'{probe.name}.{key} must be a non-negative integer')
+        options[key] = value
+    return options
+
+def resolve_probes(data):
+    """Return {probe name: constructor options} for the probes a request
+    enables. Raises ValueError for invalid options."""
+    return {name: probe.options(data[name]) for name, probe in PROBES.items()
+            if data.get(name)}
+
+def make_probes(assembled, probes):
+    return [PROBES[name](assembled.program, assembled.instructions, **options)
+            for name, options in probes.items()]
+
+def _interpret_accesses(program, r, memory, pc, output_capture, limit, access):
+    """_interpret for a straight-line stretch of ``limit`` instructions that
+    also passes (instruction index, address) of every lw/sw to ``access``.
+    Memory instructions are interpreted one at a time, the runs between
+    them in one go."""
+    executed = 0
+    while executed < limit:
+        idx = pc >> 2
+        end = idx + limit - executed
+        op, a, b, c = program[idx]
+        if op == OP_LW or op == OP_SW:
+            access((idx, (r[b] + c) & 0xFFFFFFFF))
+            stop = idx + 1
+        else:
+            stop = idx + 1
+            while stop < end and program[stop][0] != OP_LW and program[stop][0] != OP_SW:
+                stop += 1
+        try:
+            pc, count, finished = _interpret(program, r, memory, pc, output_capture, stop - idx)
+        except ExecutionError as e:
+            e.executed += executed
+            raise
+        executed += count
+        if finished or count < stop - idx:
+            return pc, executed, finished
+    return pc, executed, False
+
+# Modified simulation function to return results including PC value
+def run_simulation(parsed_instructions, labels, memory, program=None,
+                   max_instructions=None, deadline=None, blocks=None,
+                   cancel_event=None, on_progress=None, output_capture=None, probes=(),
+                   stdin=None, include_memory=False):
+    """Run a program to completion or until a limit is hit.
+
+    ``max_instructions`` caps the number of executed instructions and
+    ``deadline`` is a time.monotonic() value after which execution stops;
+    the clock is checked every WATCHDOG_INTERVAL instructions. Either way
+    the partial state is returned along with what stopped it. Hot code is
+    compiled into ``blocks`` (a fresh BasicBlocks unless one is passed in).
+
+    At the same interval, ``on_progress(executed, pc)`` is called and
+    execution stops early once ``cancel_event`` (a threading.Event) is set.
+    Console output goes to ``output_capture`` when one is given, else to an
+    OutputCapture capped at OUTPUT_LIMIT; the read syscalls consume the
+    ``stdin`` text.
+
+    Each of ``probes`` (see PROBES) is fed the executed segments and its
+    report() is added to the results under its name. The non-zero memory
+    bytes are only included with ``include_memory``.
+    """
+    if output_capture is None:
+        output_capture = OutputCapture(limit=app.config['OUTPUT_LIMIT'])
+    if stdin is not None:
+        output_capture.input = InputBuffer(stdin)
+    if program is None:
+        program = decode_program(parsed_instructions, labels)
+    if blocks is None:
+        blocks = make_blocks(program)
+    trace = accesses = None
+    if probes:
+        trace = []
+        if any(probe.accesses for probe in probes):
+            # Compiled blocks have to report memory accesses: compile afresh
+            accesses = []
+            blocks = BasicBlocks(program, app.config['JIT_THRESHOLD'], record_accesses=True)
+        elif blocks is None:
+            # Segments come from execute_tiered; never compile anything
+            blocks = BasicBlocks(program, 0)
+    regs = RegisterFile()
+    pc = 0
+    executed = 0
+    budget_exhausted = False
+    timed_out = False
+    cancelled = False
+
+    try:
+        while True:
+            chunk = WATCHDOG_INTERVAL
+            if max_instructions is not None:
+                chunk = min(chunk, max_instructions - executed)
+            if blocks is not None:
+                pc, count, finished = execute_tiered(program, blocks, regs, memory, pc,
+                                                     output_capture, max_steps=chunk,
+                                                     trace=trace, accesses=accesses)
+            else:
+                pc, count, finished = execute_program(program, regs, memory, pc, output_capture,
+                                                      max_steps=chunk)
+            executed += count
+            for probe in probes:
+                probe.consume(trace, accesses)
+            if probes:
+                trace.clear()
+                if accesses is not None:
+                    accesses.clear()
+            if finished:
+                break
+            if on_progress is not None:
+                on_progress(executed, pc)
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            if max_instructions is not None and executed >= max_instructions:
+                budget_exhausted = True
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                break
+    except ExecutionError as e:
+        pc = e.pc
+        executed += e.executed
+        output_capture.write(f"Error executing instruction: {parsed_instructions[pc >> 2]} -> {e}\n")
+        for probe in probes:
+            probe.consume(trace, accesses)
+    for probe in probes:
+        probe.finish(pc)
+
+    results = {
+        'registers': regs.to_dict(),
+        'console_output': output_capture.get_output(),
+        'output_truncated': output_capture.truncated,
+        'pc': pc,
+        'instructions_executed': executed,
+        'budget_exhausted': budget_exhausted,
+        'timed_out': timed_out,
+        'cancelled': cancelled
+    }
+    if include_memory:
+        # Non-zero bytes of the touched pages
+        results['memory'] = {hex(addr): str(value) for addr, value in memory.items()}
+    for probe in probes:
+        results[probe.name] = probe.report()
+    return results
+
+def resolve_limits(data, max_instructions=None, time_limit=None):
+    """Return (max_instructions, time_limit) for a request, capped by the server.
+
+    The caps default to the /api/simulate limits in app.config.
+    """
+    if max_instructions is None:
+        max_instructions = app.config['MAX_INSTRUCTIONS']
+    if time_limit is None:
+        time_limit = app.config['TIME_LIMIT']
+    requested = data.get('max_instructions')
+    if requested is not None:
+        if not isinstance(requested, int) or isinstance(requested, bool) or requested <= 0:
+            raise ValueError('max_instructions must be a positive integer')
+        max_instructions = min(requested, max_instructions)
+    requested = data.get('time_limit')
+    if requested is not None:
+        if not isinstance(requested, (int, float)) or isinstance(requested, bool) or requested <= 0:
+            raise ValueError('time_limit must be a positive number of seconds')
+        time_limit = min(requested, time_limit)
+    return max_instructions, time_limit
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate_mips():
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+
+        data = request.get_json()
+        try:
+            # Source code, or a pre-assembled image as returned by /api/assemble
+            code = resolve_code(data)
+            max_instructions, time_limit = resolve_limits(data)
+            probes = resolve_probes(data)
+            stdin = resolve_stdin(data)
+            include_memory = resolve_include_memory(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        body, status = simulate_code(code, max_instructions, time_limit, probes=probes,
+                                     stdin=stdin, include_memory=include_memory)
+        return jsonify(body), status
+
+    except Exception as e:
+        # Handle unexpected errors
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+def resolve_code(data, binary=True):
+    """Return a request's source 'code' or, with ``binary``, its
+    pre-assembled 'binary' image as returned by /api/assemble."""
+    if 'code' in data:
+        if not isinstance(data['code'], str):
+            raise ValueError('code must be a string')
+        return data['code']
+    if binary and data.get('binary') is not None:
+        if not isinstance(data['binary'], dict):
+            raise ValueError('binary must be an object')
+        return data['binary']
+    raise ValueError('No code provided')
+
+def resolve_stdin(data):
+    """Return the 'stdin' text of a request (for the read syscalls), or None."""
+    stdin = data.get('stdin')
+    if stdin is not None and not isinstance(stdin, str):
+        raise ValueError('stdin must be a string')
+    return stdin
+
+def resolve_include_memory(data):
+    """Return whether a request asked for memory in its response
+    ('include_memory'); otherwise memory is fetched through /api/memory."""
+    include_memory = data.get('include_memory', False)
+    if not isinstance(include_memory, bool):
+        raise ValueError('include_memory must be true or false')
+    return include_memory
+
+def simulate_code(code, max_instructions, time_limit, probes=None, **options):
+    """Assemble and run ``code``, returning the /api/simulate (body, status).
+
+    ``code`` is source text or a machine-code image (see load_program).
+    ``probes`` maps probe names to options, as returned by resolve_probes.
+
+    Shared by the single, batch and job endpoints so all give identical
+    results; ``options`` are passed on to run_simulation.
+    """
+    started = time.monotonic()
+    try:
+        # Parse, decode and validate the assembly code (cached by source)
+        with phase('assemble'):
+            assembled = load_program(code)
+        
+        with phase('execute') as timer:
+            results = run_simulation(assembled.instructions, assembled.labels,
+                                     assembled.memory.copy(), program=assembled.program,
+                                     blocks=assembled.blocks,
+                                     max_instructions=max_instructions,
+                                     deadline=started + time_limit,
+                                     probes=make_probes(assembled, probes or {}), **options)
+        count_execution(results['instructions_executed'], timer.seconds)
+        
+        return {
+            'success': True,
+            'data': results
+        }, 200
+        
+    except ValueError as e:
+        # Handle specific validation errors
+        return {
+            'success': False,
+            'error': str(e)
+        }, 400
+
+# Process pool for batch simulation. Workers are started with spawn (the
+# server is threaded, so forking it is unsafe) and warmed up once.
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def _warm_worker():
+    simulate_code('.text\n    addi $t0, $zero, 1', 1, 1.0)
+
+def get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=app.config['BATCH_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_worker)
+        return _batch_executor
+
+def _batch_result(index, future):
+    try:
+        body, status = future.result()
+    except Exception as e:
+        body, status = {'success': False, 'error': f"Internal server error: {str(e)}"}, 500
+    return dict(body, index=index, status=status)
+
+@app.route('/api/simulate-batch', methods=['POST'])
+def simulate_batch():
+    """Run many programs on the worker process pool.
+
+    Takes {'programs': [...]} where each entry is source code or an object
+    with 'code' and optional limits, 'stdin' and 'include_memory';
+    top-level values of these apply to every entry.
+    Results come back in request order, or as newline-delimited JSON in
+    completion order when 'stream' is true.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+
+        data = request.get_json()
+        programs = data.get('programs')
+        if not isinstance(programs, list) or not programs:
+            return jsonify({'success': False, 'error': 'No programs provided'}), 400
+        if len(programs) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({
+                'success': False,
+                'error': f"At most {app.config['MAX_BATCH_SIZE']} programs per batch"
+            }), 400
+
+        defaults = {key: data[key]
+                    for key in ('max_instructions', 'time_limit', 'stdin', 'include_memory')
+                    if key in data}
+        jobs = []
+        for index, item in enumerate(programs):
+            if isinstance(item, str):
+                item = {'code': item}
+            if not isinstance(item, dict) or not isinstance(item.get('code'), str):
+                return jsonify({'success': False, 'error': f"No code provided for program {index}"}), 400
+            try:
+                item = dict(defaults, **item)
+                max_instructions, time_limit = resolve_limits(item)
+                stdin = resolve_stdin(item)
+                include_memory = resolve_include_memory(item)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': f"Program {index}: {str(e)}"}), 400
+            jobs.append((item['code'], max_instructions, time_limit, stdin, include_memory))
+
+        executor = get_batch_executor()
+        futures = {executor.submit(simulate_code, code, max_instructions, time_limit,
+                                   stdin=stdin, include_memory=include_memory): index
+                   for index, (code, max_instructions, time_limit, stdin, include_memory)
+                   in enumerate(jobs)}
+
+        if data.get('stream'):
+            def generate():
+                for future in as_completed(futures):
+                    yield json.dumps(_batch_result(futures[future], future)) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        results = [_batch_result(index, future) for future, index in futures.items()]
+        return jsonify({'success': True, 'results': results}), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+class SimulationJob:
+    """A simulation running in the background on the job thread pool."""
+
+    def __init__(self, code, max_instructions, time_limit, stdin=None, include_memory=False):
+        self.id = str(uuid.uuid4())
+        self.code = code
+        self.max_instructions = max_instructions
+        self.time_limit = time_limit
+        self.stdin = stdin
+        self.include_memory = include_memory
+        # Output beyond OUTPUT_LIMIT spills to a file, see /api/jobs/<id>/output
+        self.output = OutputCapture(limit=app.config['OUTPUT_LIMIT'],
+                                    spill_limit=app.config['JOB_OUTPUT_LIMIT'])
+        self.status = 'queued'
+        self.executed = 0
+        self.pc = 0
+        self.result = None
+        self.result_status = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.finished_at = None
+
+    def _progress(self, executed, pc):
+        self.executed = executed
+        self.pc = pc
+
+    def run(self):
+        if self.cancel_event.is_set():
+            return
+        self.status = 'running'
+        try:
+            body, status = simulate_code(self.code, self.max_instructions, self.time_limit,
+                                         cancel_event=self.cancel_event,
+                                         on_progress=self._progress,
+                                         output_capture=self.output, stdin=self.stdin,
+                                         include_memory=self.include_memory)
+        except Exception as e:
+            body, status = {'success': False, 'error': f"Internal server error: {str(e)}"}, 500
+        if status == 200:
+            self._progress(body['data']['instructions_executed'], body['data']['pc'])
+            self.status = 'cancelled' if body['data']['cancelled'] else 'completed'
+        else:
+            self.status = 'failed'
+        self.result, self.result_status = body, status
+        self.finished_at = time.monotonic()
+        self.code = self.stdin = None
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            # Never started: nothing to stop
+            self.status = 'cancelled'
+            self.finished_at = time.monotonic()
+            self.code = self.stdin = None
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def to_dict(self):
+        job = {
+            'id': self.id,
+            'status': self.status,
+            'instructions_executed': self.executed,
+            'pc': self.pc
+        }
+        if self.result is not None:
+            job['result'] = self.result
+        return job
+
+jobs = {}
+_jobs_lock = threading.Lock()
+_job_executor = None
+
+def get_job_executor():
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'],
+                                               thread_name_prefix='mips-job')
+        return _job_executor
+
+def purge_finished_jobs():
+    """Forget finished jobs older than JOB_TTL."""
+    cutoff = time.monotonic() - app.config['JOB_TTL']
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            jobs.pop(job_id).output.close()
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Start a simulation in the background and return its job id"""
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+
+        data = request.get_json()
+        if 'code' not in data:
+            return jsonify({'success': False, 'error': 'No code provided'}), 400
+        try:
+            max_instructions, time_limit = resolve_limits(
+                data, app.config['JOB_MAX_INSTRUCTIONS'], app.config['JOB_TIME_LIMIT'])
+            stdin = resolve_stdin(data)
+            include_memory = resolve_include_memory(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        purge_finished_jobs()
+        job = SimulationJob(data['code'], max_instructions, time_limit, stdin, include_memory)
+        with _jobs_lock:
+            jobs[job.id] = job
+        job.future = get_job_executor().submit(job.run)
+
+        return jsonify({'success': True, 'job': job.to_dict()}), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report a job's status, progress and (once finished) its result"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+@app.route('/api/jobs/<job_id>/output', methods=['GET'])
+def get_job_output(job_id):
+    """The full console output of a finished job as plain text, including
+    what was cut from console_output in the result (up to JOB_OUTPUT_LIMIT)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if not job.finished:
+        return jsonify({'success': False, 'error': 'Job has not finished'}), 409
+    output = job.output
+    if output.spill is None:
+        return Response(output.get_output(), mimetype='text/plain')
+    return Response(output.read_spill(), mimetype='text/plain')
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job; a running simulation stops at its next progress check"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if not job.finished:
+        job.cancel()
+    return jsonify({'success': True, 'job': job.to_dict()}), 200
+
+class EventStream:
+    """Bounded queue of server-sent events fed by a simulation thread.
+
+    Used as the simulation's output capture: syscall output and progress
+    are queued as they happen rather than collected. The simulation blocks
+    while the queue is full, so a slow client slows the interpreter down
+    instead of making the server buffer output. Once ``cancel_event`` is
+    set (the client went away) events are dropped and the simulation stops
+    at its next progress check. A client that stops reading is given up on
+    the same way once the run's ``deadline`` (a time.monotonic() value) has
+    passed, so it cannot hold the simulation thread past its time limit.
+    """
+
+    truncated = False  # nothing is held back, so nothing is cut off
+    input = None
+
+    def __init__(self, maxsize=STREAM_QUEUE_SIZE, progress_interval=STREAM_PROGRESS_INTERVAL,
+                 deadline=None):
+        self.queue = queue.Queue(maxsize)
+        self.cancel_event = threading.Event()
+        self.progress_interval = progress_interval
+        self.deadline = deadline
+        self.last_progress = time.monotonic()
+
+    def put(self, event, data):
+        while not self.cancel_event.is_set():
+            try:
+                self.queue.put((event, data), timeout=0.1)
+                return
+            except queue.Full:
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    self.cancel_event.set()
+
+    def write(self, text):
+        self.put('output', text)
+
+    def get_output(self):
+        return ''  # Already streamed
+
+    def progress(self, executed, pc):
+        now = time.monotonic()
+        if now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            self.put('progress', {'instructions_executed': executed, 'pc': pc})
+
+    def events(self):
+        """Yield SSE messages until the 'result' event, coalescing queued output."""
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    try:
+                        event, data = self.queue.get(timeout=STREAM_KEEPALIVE)
+                    except queue.Empty:
+                        if self.cancel_event.is_set():
+                            return  # Given up on: no result is coming
+                        yield ': keepalive\n\n'
+                        continue
+                else:
+                    (event, data), pending = pending, None
+                if event == 'output':
+                    texts = [data]
+                    while True:
+                        try:
+                            item = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item[0] != 'output':
+                            pending = item
+                            break
+                        texts.append(item[1])
+                    data = {'text': ''.join(texts)}
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == 'result':
+                    return
+        finally:
+            self.cancel_event.set()
+
+@app.route('/api/simulate-stream', methods=['POST'])
+def simulate_stream():
+    """Run a program, streaming it as server-sent events.
+
+    'output' events carry console output as syscalls produce it,
+    'progress' events the instructions executed and pc, and the final
+    'result' event the /api/simulate body (without console_output).
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+
+        data = request.get_json()
+        try:
+            code = resolve_code(data, binary=False)
+            max_instructions, time_limit = resolve_limits(data)
+            stdin = resolve_stdin(data)
+            include_memory = resolve_include_memory(data)
+            # Report invalid programs as a plain error before streaming
+            program_cache.get(code)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        stream = EventStream(deadline=time.monotonic() + time_limit)
+
+        def run():
+            try:
+                body, status = simulate_code(code, max_instructions, time_limit,
+                                             output_capture=stream, on_progress=stream.progress,
+                                             cancel_event=stream.cancel_event, stdin=stdin,
+                                             include_memory=include_memory)
+                if body.get('success'):
+                    del body['data']['console_output']
+            except Exception as e:
+                body, status = {'success': False, 'error': f"Internal server error: {str(e)}"}, 500
+            stream.put('result', dict(body, status=status))
+
+        threading.Thread(target=run, name='mips-stream', daemon=True).start()
+        return Response(stream.events(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+@app.route('/api/assemble', methods=['POST'])
+def assemble_code():
+    """Assemble a program into machine code.
+
+    Returns the text segment as a list of hex words, or as base64 of the
+    little-endian image when 'format' is 'base64', together with each
+    word's source line and the labels' image addresses. The .data bytes
+    come back in the same format, and the whole 'data' object can be
+    posted to /api/simulate as 'binary'.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Request must be JSON'}), 400
+
+        data = request.get_json()
+        output_format = data.get('format', 'hex')
+        try:
+            code = resolve_code(data, binary=False)
+            if output_format not in ('hex', 'base64'):
+                raise ValueError("format must be 'hex' or 'base64'")
+            with phase('assemble'):
+                assembled = program_cache.get(code)
+            with phase('encode'):
+                words, origins, image_labels = encode_program(assembled.program, assembled.labels)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        data_bytes = data_segment(assembled.memory)
+        if output_format == 'hex':
+            image = [f'{word:08x}' for word in words]
+            data_image = data_bytes.hex()
+        else:
+            if sys.byteorder != 'little':
+                words = array('I', words)
+                words.byteswap()
+            image = base64.b64encode(words.tobytes()).decode('ascii')
+            data_image = base64.b64encode(data_bytes).decode('ascii')
+        line_numbers = source_line_numbers(code)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'format': output_format,
+                'image': image,
+                'data_image': data_image,
+                'words': len(words),
+                'source_lines': [line_numbers[idx] for idx in origins],
+                'labels': image_labels
+            }
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+# Request metrics. Every request's phases (see phase()) go into a latency
+# histogram next to its total time, and into its Server-Timing header.
+metrics = Registry()
+request_seconds = metrics.register(Histogram(
+    'mips_request_duration_seconds', 'Request latency by endpoint and phase',
+    ('endpoint', 'phase')))
+requests_total = metrics.register(Counter(
+    'mips_requests_total', 'Requests by endpoint and status', ('endpoint', 'status')))
+instructions_total = metrics.register(Counter(
+    'mips_instructions_executed_total', 'Instructions executed in this process'))
+execution_seconds_total = metrics.register(Counter(
+    'mips_execution_seconds_total', 'Seconds spent executing instructions in this process'))
+metrics.register(Gauge(
+    'mips_instructions_per_second', 'Average execution speed since start',
+    lambda: [((), instructions_total.get() / (execution_seconds_total.get() or 1.0))]))
+metrics.register(Gauge(
+    'mips_sessions', 'Stepping sessions held by the session store',
+    lambda: [((), len(execution_states))]))
+metrics.register(Gauge(
+    'mips_session_store', 'Session store statistics', lambda: [
+        ((key,), value) for key, value in execution_states.stats().items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)], ('stat',)))
+metrics.register(Gauge(
+    'mips_program_cache', 'Program cache statistics',
+    lambda: [((key,), value) for key, value in program_cache.stats().items()], ('stat',)))
+metrics.register(Gauge(
+    'mips_program_cache_hit_ratio', 'Program cache hits over lookups',
+    lambda: [((), program_cache.hits / ((program_cache.hits + program_cache.misses) or 1))]))
+metrics.register(Gauge(
+    'mips_decoded_word_cache_size', 'Distinct machine words in the decode cache',
+    lambda: [((), len(_decoded_words))]))
+
+def _job_counts():
+    counts = {}
+    with _jobs_lock:
+        for job in jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+    return [((status,), count) for status, count in sorted(counts.items())]
+
+metrics.register(Gauge('mips_jobs', 'Simulation jobs by status', _job_counts, ('status',)))
+
+def count_execution(executed, seconds):
+    instructions_total.inc(executed)
+    execution_seconds_total.inc(seconds)
+
+@app.before_request
+def start_request_timer():
+    if app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    timings = g.get('phase_timings', {})
+    entries = []
+    for name, seconds in timings.items():
+        request_seconds.observe(seconds, (endpoint, name))
+        entries.append(f'{name};dur={seconds * 1000:.3f}')
+    request_seconds.observe(total, (endpoint, 'total'))
+    entries.append(f'total;dur={total * 1000:.3f}')
+    requests_total.inc(1, (endpoint, str(response.status_code)))
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+# Registered after record_request_metrics so that it runs first (Flask calls
+# after_request functions in reverse) and its time is reported
+@app.after_request
+def compress_response(response):
+    """Gzip large responses for clients that accept it. Streamed responses
+    are sent as they are produced and never compressed."""
+    minimum = app.config['COMPRESS_MIN_SIZE']
+    if minimum < 0 or response.is_streamed or response.direct_passthrough:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (not request.accept_encodings['gzip'] or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+    data = response.get_data()
+    if len(data) < minimum:
+        return response
+    with phase('compress'):
+        response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag is not None:
+        # A different encoding is a different representation
+        response.set_etag(etag + '-gzip', weak)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'healthy',
+        'version': '1.0.0',
+        'program_cache': program_cache.stats(),
+        'sessions': execution_states.stats()
+    })
+
+# Error handlers
+@app.errorhandler(404)
+def not_found(e):
+    return jsonify({'error': 'Resource not found'}), 404
+
+@app.errorhandler(500)
+def server_error(e):
+    return jsonify({'error': 'Internal server error'}), 500
+
+# Stepping session state is a dict; everything but the source code, pc,
+# registers, memory and flags is derived from the (cached) assembled program.
+def new_session_state(code, assembled, stdin=''):
+    state = {
+        'code': code,
+        'instructions': assembled.instructions,
+        'program': assembled.program,
+        'labels': assembled.labels,
+        'memory': assembled.memory.copy(),
+        'pc': 0,
+        'registers': RegisterFile(),
+        'output_buffer': '',
+        'input': InputBuffer(stdin),
+        'instruction_index': 0,
+        'completed': False,
+        'seq': 0,
+        'probes': []
+    }
+    state['history'] = StepHistory(state, app.config['SESSION_HISTORY_BYTES'])
+    return state
+
+SESSION_OUTPUT_TRUNCATED = "\n[Output truncated: session output limit reached]\n"
+
+def append_session_output(state, text):
+    """Add ``text`` to the session's console, which keeps at most
+    OUTPUT_LIMIT characters. Past that, a marker ends the console and
+    further output is dropped."""
+    output = state['output_buffer']
+    limit = app.config['OUTPUT_LIMIT']
+    if len(output) + len(text) <= limit:
+        state['output_buffer'] = output + text
+    elif not output.endswith(SESSION_OUTPUT_TRUNCATED):
+        room = max(limit - len(output), 0)
+        state['output_buffer'] = output + text[:room] + SESSION_OUTPUT_TRUNCATED
+
+SESSION_MAGIC = b'MSS3'
+# magic, pc, completed flag, sequence number, page count, code length, output
+# length, input length, input position, instructions executed, probe state length
+SESSION_HEADER = struct.Struct('<4siBIIIIIIQI')
+SESSION_PAGE = struct.Struct('<I')
+
+class _ProbeUnpickler(pickle.Unpickler):
+    """Unpickler for session probe state that only rebuilds probe objects
+    and the containers they hold."""
+
+    ALLOWED = {('array', 'array'), ('array', '_array_reconstructor'),
+               ('collections', 'Counter'), ('builtins', 'set'),
+               ('builtins', 'frozenset'), ('builtins', 'bytearray')}
+
+    def find_class(self, module, name):
+        for probe in PROBES.values():
+            if name == probe.__name__:
+                return probe
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f'{module}.{name} is not part of probe state')
+        return super().find_class(module, name)
+
+def serialize_session(state):
+    """Pack a session into a compact, zlib-compressed binary blob."""
+    code = state['code'].encode('utf-8')
+    output = state['output_buffer'].encode('utf-8')
+    stdin = state['input'].text.encode('utf-8')
+    probes = pickle.dumps(state['probes'], pickle.HIGHEST_PROTOCOL) if state['probes'] else b''
+    pages = state['memory'].pages
+    parts = [
+        SESSION_HEADER.pack(SESSION_MAGIC, state['pc'], state['completed'], state['seq'],
+                            len(pages), len(code), len(output), len(stdin),
+                            state['input'].position, state['history'].time, len(probes)),
+        state['registers'].values.tobytes(),
+        code,
+        output,
+        stdin,
+        probes
+    ]
+    for number in sorted(pages):
+        parts.append(SESSION_PAGE.pack(number))
+        parts.append(pages[number])
+    return zlib.compress(b''.join(parts), 1)
+
+def deserialize_session(blob):
+    """Rebuild a session from serialize_session() output."""
+    data = memoryview(zlib.decompress(blob))
+    (magic, pc, completed, seq, page_count, code_len, output_len,
+     input_len, input_position, time, probes_len) = SESSION_HEADER.unpack_from(data)
+    if magic != SESSION_MAGIC:
+        raise ValueError('Not a session blob')
+    offset = SESSION_HEADER.size
+    registers = RegisterFile(data[offset:offset + 128].cast('i'))
+    offset += 128
+    code = str(data[offset:offset + code_len], 'utf-8')
+    offset += code_len
+    output = str(data[offset:offset + output_len], 'utf-8')
+    offset += output_len
+    stdin = str(data[offset:offset + input_len], 'utf-8')
+    offset += input_len
+    probes = (_ProbeUnpickler(BytesIO(data[offset:offset + probes_len])).load()
+              if probes_len else [])
+    offset += probes_len
+    memory = Memory()
+    for _ in range(page_count):
+        number, = SESSION_PAGE.unpack_from(data, offset)
+        offset += SESSION_PAGE.size
+        memory.pages[number] = bytearray(data[offset:offset + PAGE_SIZE])
+        offset += PAGE_SIZE
+
+    state = new_session_state(code, program_cache.get(code))
+    state.update(memory=memory, registers=registers, pc=pc, output_buffer=output,
+                 input=InputBuffer(stdin, input_position),
+                 instruction_index=pc // 4, completed=bool(completed), seq=seq,
+                 probes=probes)
+    # The undo history itself is not persisted: it restarts here, at the
+    # session's instruction count, and step-back reports it as history_start
+    state['history'] = StepHistory(state, app.config['SESSION_HISTORY_BYTES'], time)
+    return state
+
+# Opcodes for which memory_write_range can return a range
+MEMORY_WRITE_OPS = frozenset((OP_SW, OP_SYSCALL))
+
+def memory_write_range(record, regs, input=None):
+    """Return the (address, length) of memory that executing ``record`` with
+    the current ``regs`` and InputBuffer ``input`` will write, or None if it
+    writes no memory."""
+    op, a, b, c = record
+    if op == OP_SW:
+        return (regs[b] + c) & 0xFFFFFFFF, 4
+    if op == OP_SYSCALL and regs[2] == 8:
+        length = len(read_string_bytes(input, regs[5]))
+        if length:
+            return regs[4] & 0xFFFFFFFF, length
+    return None
+
+def memory_address(record, regs):
+    """Return the address a lw/sw ``record`` accesses with the current
+    ``regs``, or None for other instructions."""
+    op, a, b, c = record
+    if op == OP_LW or op == OP_SW:
+        return (regs[b] + c) & 0xFFFFFFFF
+    return None
+
+def step_probes(probes, index, address):
+    """Feed one single-stepped instruction (and the address it accessed,
+    or None) to a session's probes."""
+    accesses = [] if address is None else [(index, address)]
+    for probe in probes:
+        probe.consume([(index, 1)], accesses)
+
+def register_written(record):
+    """Return the number of the register ``record`` may write, or None."""
+    op = record[0]
+    if op in REG_WRITE_OPS:
+        return record[1]
+    if op == OP_JAL:
+        return 31
+    if op == OP_SYSCALL:
+        return 2  # read int returns in $v0
+    return None
+
+def registers_read(record):
+    """Return the numbers of the registers ``record`` reads, without $zero."""
+    op, a, b, c = record
+    if op in R_TYPE_OPS:
+        nums = (b, c)
+    elif op == OP_SW or op == OP_BEQ or op == OP_BNE:
+        nums = (a, b)
+    elif op == OP_JR:
+        nums = (a,)
+    elif op == OP_SYSCALL:
+        nums = (2, 4)
+    elif op in REG_WRITE_OPS and op not in (OP_LI, OP_LUI, OP_LA):
+        nums = (b,)
+    else:
+        nums = ()
+    return tuple(sorted({num for num in nums if num}))
+
+BREAK_RECORD = (OP_BREAK, 0, 0, 0)
+
+def _finish_reason(program, pc):
+    # execute_program finishes at the exit syscall itself, or once the pc
+    # has left the text segment
+    return 'exit' if not pc & 3 and 0 <= pc >> 2 < len(program) else 'completed'
+
+def run_session(state, output_capture, max_steps, breakpoints=(), watch_registers=(),
+                watch_memory=(), deadline=None, on_progress=None):
+    """Run a step session until something stops it.
+
+    ``breakpoints`` are instruction indices, ``watch_registers`` register
+    numbers and ``watch_memory`` word addresses. Instead of checking every
+    instruction, every stop is patched into a copy of the program as a break
+    record: the interpreter runs at full speed in between and each stop
+    costs a set lookup. Instructions that may write a watched register or
+    watched memory run one at a time on the original program and stop the
+    run if the watched value changed. A breakpoint at the starting pc does
+    not trigger, so a run resumed from a breakpoint makes progress.
+
+    Updates state['registers'] and state['memory'] in place and returns
+    (pc, executed, reason, watch), where reason is 'breakpoint',
+    'watchpoint', 'steps', 'timeout', 'exit' (the exit syscall, at pc) or
+    'completed' (the pc left the text segment) and watch describes the
+    watchpoint that triggered. ``on_progress(executed, pc)`` is called
+    between stretches of execution.
+
+    With state['probes'], the stretches run through execute_tiered so the
+    probes see what executed.
+    """
+    program = state['program']
+    regs = state['registers']
+    memory = state['memory']
+    probes = state['probes']
+    breakpoints = set(breakpoints)
+    watch_registers = set(watch_registers)
+    watched_bytes = {(address + i) & 0xFFFFFFFF for address in watch_memory for i in range(4)}
+    stops = set(breakpoints)
+    for idx, record in enumerate(program):
+        if ((watch_registers and register_written(record) in watch_registers)
+                or (watched_bytes and record[0] in MEMORY_WRITE_OPS)):
+            stops.add(idx)
+    patched = list(program)
+    for idx in stops:
+        patched[idx] = BREAK_RECORD
+    if probes:
+        trace = []
+        accesses = [] if any(probe.accesses for probe in probes) else None
+        blocks = BasicBlocks(patched, app.config['JIT_THRESHOLD'],
+                             record_accesses=accesses is not None)
+
+    pc = state['pc']
+    executed = 0
+    while True:
+        if on_progress is not None:
+            on_progress(executed, pc)
+        if executed >= max_steps:
+            return pc, executed, 'steps', None
+        if deadline is not None and time.monotonic() >= deadline:
+            return pc, executed, 'timeout', None
+        idx = pc >> 2
+        if not pc & 3 and idx in stops:
+            if idx in breakpoints and executed:
+                return pc, executed, 'breakpoint', None
+            record = program[idx]
+            register = register_written(record)
+            old_value = regs[register] if register in watch_registers else None
+            written = memory_write_range(record, regs, state['input']) if watched_bytes else None
+            if written and not any((written[0] + i) & 0xFFFFFFFF in watched_bytes
+                                   for i in range(written[1])):
+                written = None
+            old_bytes = memory.read(*written) if written else None
+            address = memory_address(record, regs) if probes else None
+            pc, count, finished = execute_program(program, regs, memory, pc, output_capture,
+                                                  max_steps=1)
+            executed += count
+            if count:
+                step_probes(probes, idx, address)
+            if finished:
+                for probe in probes:
+                    probe.finish(pc)
+                return pc, executed, _finish_reason(program, pc), None
+            if old_value is not None and regs[register] != old_value:
+                return pc, executed, 'watchpoint', {
+                    'register': REG_NAMES[register], 'old': old_value, 'new': regs[register]}
+            if written and memory.read(*written) != old_bytes:
+                return pc, executed, 'watchpoint', {
+                    'address': written[0], 'length': written[1]}
+            continue
+        limit = min(WATCHDOG_INTERVAL, max_steps - executed)
+        if probes:
+            pc, count, finished = execute_tiered(patched, blocks, regs, memory, pc, output_capture,
+                                                 max_steps=limit, trace=trace, accesses=accesses)
+            for probe in probes:
+                probe.consume(trace, accesses)
+            trace.clear()
+            if accesses is not None:
+                accesses.clear()
+        else:
+            pc, count, finished = execute_program(patched, regs, memory, pc, output_capture,
+                                                  max_steps=limit)
+        executed += count
+        if finished:
+            for probe in probes:
+                probe.finish(pc)
+            return pc, executed, _finish_reason(program, pc), None
+
+# Instructions between the checkpoints a run takes, and single steps
+# between the checkpoints taken while stepping
+CHECKPOINT_INTERVAL = 1 << 18
+JOURNAL_CHECKPOINT_INTERVAL = 1024
+
+class StepHistory:
+    """Undo journal and checkpoints that let a step session run backwards.
+
+    ``time`` counts the instructions the session has executed. Single steps
+    are journalled: each entry holds the old value of the one register and
+    memory range the instruction wrote, plus the pc, console length, input
+    position and completed flag, so stepping back over them costs one undo
+    per instruction. Runs are not journalled. They take full checkpoints as they
+    go, and rewinding into a run restores the nearest earlier checkpoint and
+    replays forward from it. Once history exceeds ``max_bytes`` the oldest
+    checkpoint and the journal before the next one are dropped.
+    """
+
+    def __init__(self, state, max_bytes, time=0):
+        self.max_bytes = max_bytes
+        self.time = time
+        # (time, pc, register, old value, address, old bytes, output length,
+        #  input position, completed)
+        self.journal = []
+        # (time, pc, register values, memory, output length, input position, completed)
+        self.checkpoints = []
+        self.journal_bytes = 0
+        self.checkpoint_bytes = 0
+        self.checkpoint(state)
+
+    def size(self):
+        return self.journal_bytes + self.checkpoint_bytes
+
+    def oldest(self):
+        """The earliest time the session can rewind to."""
+        return self.checkpoints[0][0]
+
+    def checkpoint(self, state, time=None, pc=None, output_length=None):
+        """Snapshot the session; time, pc and console length default to the
+        session's current ones. The input position is always the current
+        one, as runs consume the session's InputBuffer directly."""
+        time = self.time if time is None else time
+        if self.checkpoints and self.checkpoints[-1][0] == time:
+            return
+        memory = state['memory'].copy()
+        self.checkpoints.append((
+            time,
+            state['pc'] if pc is None else pc,
+            array('i', state['registers'].values),
+            memory,
+            len(state['output_buffer']) if output_length is None else output_length,
+            state['input'].position,
+            state['completed']))
+        self.checkpoint_bytes += len(memory.pages) * PAGE_SIZE + 256
+        self._trim()
+
+    def undo_entry(self, state, record):
+        """Capture what executing ``record`` next will overwrite."""
+        regs = state['registers']
+        register = register_written(record)
+        written = memory_write_range(record, regs, state['input'])
+        return (self.time, state['pc'],
+                register, None if register is None else regs[register],
+                None if written is None else written[0],
+                None if written is None else state['memory'].read(*written),
+                len(state['output_buffer']), state['input'].position, state['completed'])
+
+    def push(self, state, entry):
+        """Journal a single step that has executed (``entry`` from undo_entry).
+        ``state`` must already hold the step's pc, output and completed flag."""
+        self.journal.append(entry)
+        self.journal_bytes += 128 + (len(entry[5]) if entry[5] else 0)
+        self.time += 1
+        if self.time - self.checkpoints[-1][0] >= JOURNAL_CHECKPOINT_INTERVAL:
+            self.checkpoint(state)
+
+    def advance(self, executed):
+        """Account for ``executed`` instructions run without journalling."""
+        self.time += executed
+
+    def abort(self, state):
+        """Put the session back to the checkpoint at the current time,
+        dropping checkpoints an unfinished run took after it."""
+        self._drop_after(self.time)
+        self._restore(state, self.checkpoints[-1])
+
+    def rewind(self, state, steps):
+        """Move the session back ``steps`` instructions, or as far as history
+        reaches. Returns the number of instructions rewound."""
+        target = max(self.time - steps, self.oldest())
+        start = self.time
+        journal = self.journal
+        while self.time > target:
+            if journal and journal[-1][0] == self.time - 1:
+                self._undo(state, journal.pop())
+                continue
+            # Inside a run: restore the last checkpoint before now
+            index = len(self.checkpoints) - 1
+            while self.checkpoints[index][0] >= self.time:
+                index -= 1
+            checkpoint = self.checkpoints[index]
+            self._restore(state, checkpoint)
+            if checkpoint[0] < target:
+                self._replay(state, target - checkpoint[0])
+        self._drop_after(target)
+        return start - target
+
+    def _undo(self, state, entry):
+        (time, pc, register, old_value, address, old_bytes, output_length,
+         input_position, completed) = entry
+        if register is not None:
+            state['registers'][register] = old_value
+        if address is not None:
+            state['memory'].write(address, old_bytes)
+        self.journal_bytes -= 128 + (len(old_bytes) if old_bytes else 0)
+        self._set(state, time, pc, output_length, input_position, completed)
+
+    def _restore(self, state, checkpoint):
+        time, pc, values, memory, output_length, input_position, completed = checkpoint
+        state['registers'] = RegisterFile(values)
+        state['memory'] = memory.copy()
+        self._set(state, time, pc, output_length, input_position, completed)
+
+    def _replay(self, state, steps):
+        output_capture = OutputCapture(state['input'])
+        pc, executed, _ = execute_program(state['program'], state['registers'], state['memory'],
+                                          state['pc'], output_capture, max_steps=steps)
+        append_session_output(state, output_capture.get_output())
+        state['pc'] = pc
+        state['instruction_index'] = pc // 4
+        self.time += executed
+
+    def _set(self, state, time, pc, output_length, input_position, completed):
+        self.time = time
+        state['pc'] = pc
+        state['instruction_index'] = pc // 4
+        state['output_buffer'] = state['output_buffer'][:output_length]
+        state['input'].position = input_position
+        state['completed'] = completed
+
+    def _drop_after(self, time):
+        while self.checkpoints[-1][0] > time:
+            self._drop_checkpoint(-1)
+        while self.journal and self.journal[-1][0] >= time:
+            entry = self.journal.pop()
+            self.journal_bytes -= 128 + (len(entry[5]) if entry[5] else 0)
+
+    def _drop_checkpoint(self, index):
+        checkpoint = self.checkpoints.pop(index)
+        self.checkpoint_bytes -= len(checkpoint[3].pages) * PAGE_SIZE + 256
+
+    def _trim(self):
+        while self.size() > self.max_bytes and len(self.checkpoints) > 1:
+            self._drop_checkpoint(0)
+            oldest = self.oldest()
+            keep = 0
+            while keep < len(self.journal) and self.journal[keep][0] < oldest:
+                entry = self.journal[keep]
+                self.journal_bytes -= 128 + (len(entry[5]) if entry[5] else 0)
+                keep += 1
+            del self.journal[:keep]
+
+def resolve_address(value, labels):
+    """Return the address named by ``value``, an integer or a label."""
+    if isinstance(value, str) and value in labels:
+        return labels[value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value & 0xFFFFFFFF
+    raise ValueError(f"Unknown address or label: {value!r}")
+
+def session_size(state):
+    # Instructions and labels are shared with the program cache
+    return (len(state['memory'].pages) * PAGE_SIZE + state['history'].size()
+            + len(state['output_buffer']) + 1024)
+
+def make_session_store():
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'sqlite':
+        return SQLiteSessionStore(
+            app.config['SESSION_DATABASE'],
+            serialize_session, deserialize_session, session_size,
+            version_of=lambda state: state['seq'],
+            ttl=app.config['SESSION_TTL'],
+            memory_budget=app.config['SESSION_MEMORY_BUDGET'])
+    if backend != 'memory':
+        raise ValueError(f"Unknown session backend: {backend}")
+    return SessionStore(
+        serialize_session, deserialize_session, session_size,
+        ttl=app.config['SESSION_TTL'],
+        memory_budget=app.config['SESSION_MEMORY_BUDGET'],
+        hibernate_dir=app.config['SESSION_HIBERNATE_DIR'],
+        hibernate_after=app.config['SESSION_HIBERNATE_AFTER'])
+
+execution_states = make_session_store()
+
+@app.route('/api/init-step', methods=['POST'])
+def init_step():
+    """Initialize stepping execution
+
+    Accepts 'stdin' for the read syscalls and the same probe options as
+    /api/simulate ('pipeline', 'cache', 'branch_prediction').
+    The probes see every instruction the session executes, including ones
+    executed again after /api/step-back, and their reports are added to
+    the data of every /api/step and /api/run response.
+    """
+    try:
+        data = request.get_json()
+        if 'code' not in data:
+            return jsonify({'success': False, 'error': 'No code provided'}), 400
+
+        # Parse the code (cached by source) and prepare initial state
+        try:
+            probes = resolve_probes(data)
+            stdin = resolve_stdin(data) or ''
+            with phase('assemble'):
+                assembled = program_cache.get(data['code'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Create initial state
+        session_state = new_session_state(data['code'], assembled, stdin)
+        session_state['probes'] = make_probes(assembled, probes)
+        
+        # Generate unique session ID
+        session_id = str(uuid.uuid4())
+        with phase('session'):
+            execution_states.put(session_id, session_state)
+        
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'total_instructions': len(assembled.instructions),
+            'seq': session_state['seq']
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/step', methods=['POST'])
+def step_instruction():
+    """Execute next instruction in the stepping sequence
+
+    Every step advances the session's sequence number ('seq' in the
+    response). A client that sends back the seq of the last response it
+    applied gets a delta: only the registers and memory bytes this step
+    changed. Without a seq, or with a stale one, the response is a full
+    snapshot. 'delta' in the response says which one was sent. Memory is
+    left out unless 'include_memory' is true; /api/memory serves windows
+    of it instead.
+    """
+    try:
+        data = request.get_json()
         session_id = data.get('session_id')
         
-        if not session_id or session_id not in execution_states:
+        with phase('session'):
+            state = execution_states.get(session_id) if isinstance(session_id, str) else None
+        if state is None:
             return jsonify({'success': False, 'error': 'Invalid session'}), 400
+        try:
+            include_memory = resolve_include_memory(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
             
-        state = execution_states[session_id]
+        index = state['instruction_index']
         
-        if state['instruction_index'] >= len(state['instructions']):
+        if state['completed'] or not 0 <= index < len(state['program']) or state['pc'] & 3:
             return jsonify({
                 'success': True,
                 'completed': True,
-                'message': 'Program execution completed'
+                'message': 'Program execution completed',
+                'seq': state['seq']
             }), 200
             
-        # Get current instruction
-        current_instruction = state['instructions'][state['instruction_index']]
-        
-        # Execute single instruction
-        output_capture = OutputCapture()
+        current_instruction = state['instructions'][index]
+        output_capture = OutputCapture(state['input'])
+        registers = state['registers']
+        memory = state['memory']
         
-        # Parse instruction
-        parts = re.split(r'[,\s()]+', current_instruction)
-        parts = [p for p in parts if p]
+        history = state['history']
+        undo = history.undo_entry(state, state['program'][index])
+        address = memory_address(state['program'][index], registers) if state['probes'] else None
+        delta = data.get('seq') == state['seq']
+        if delta:
+            old_registers = registers.values
+        if delta and include_memory:
+            written = memory_write_range(state['program'][index], registers, state['input'])
+            old_bytes = memory.read(*written) if written else b''
         
-        if not parts:
+        try:
+            with phase('execute') as timer:
+                pc, _, finished = execute_program(state['program'], state['registers'], state['memory'],
+                                                  state['pc'], output_capture, max_steps=1)
+        except ExecutionError as e:
             return jsonify({
                 'success': False,
-                'error': 'Empty instruction'
-            }), 400
+                'error': f"Error executing instruction: {str(e)}"
+            }), 500
 
-        op_code = parts[0]
+        step_probes(state['probes'], index, address)
+        count_execution(1, timer.seconds)
+        if finished or not 0 <= pc >> 2 < len(state['program']):
+            # The program has stopped, whether or not the step limit hid it
+            for probe in state['probes']:
+                probe.finish(pc)
+        if finished:
+            # Exit syscall: report this step, then complete on the next one
+            state['completed'] = True
+            pc += 4
+        state['pc'] = pc
+        state['instruction_index'] = pc // 4
+        append_session_output(state, output_capture.get_output())
+        # Journal once the state is complete, as push() may checkpoint it
+        history.push(state, undo)
+        state['seq'] += 1
+        with phase('session'):
+            execution_states.save(session_id, state)
         
-        try:
-            control_signals = generate_control_signals(op_code)
-            
-            # Initialize registers if not present
-            if 'registers' not in state:
-                state['registers'] = {name: 0 for name in reg_map}
-                state['registers']['sp'] = 0x7FFFFFFC
-            
-            # Execute instruction
-            if control_signals['Move']:  # Handle move instruction
-                rd_name = get_register_name(get_register_number(parts[1]))
-                rs_name = get_register_name(get_register_number(parts[2]))
-                state['registers'][rd_name] = state['registers'][rs_name]
-            elif control_signals['LoadAddress']:  # Handle la instruction
-                rt_name = get_register_name(get_register_number(parts[1]))
-                label = parts[2].strip()
-                if label not in state['labels']:
-                    raise ValueError(f"Label {label} not found")
-                state['registers'][rt_name] = state['labels'][label]
-            elif control_signals['Syscall']:
-                if not syscall(state['registers'], state['memory'], output_capture):
-                    state['completed'] = True
-            elif control_signals['Jump']:
-                if op_code == 'j' or op_code == 'jal':
-                    label = parts[1]
-                    if label in state['labels']:
-                        if op_code == 'jal':
-                            state['registers']['ra'] = state['pc'] + 4
-                        state['pc'] = state['labels'][label]
-                        state['instruction_index'] = state['pc'] // 4
-                        return jsonify({
-                            'success': True,
-                            'completed': False,
-                            'data': {
-                                'registers': state['registers'],
-                                'memory': state['memory'],
-                                'pc': state['pc'],
-                                'console_output': output_capture.get_output(),
-                                'current_instruction': current_instruction
-                            }
-                        }), 200
-                elif op_code == 'jr':
-                    rs_name = get_register_name(get_register_number(parts[1]))
-                    state['pc'] = state['registers'][rs_name]
-                    state['instruction_index'] = state['pc'] // 4
-                    return jsonify({
-                        'success': True,
-                        'completed': False,
-                        'data': {
-                            'registers': state['registers'],
-                            'memory': state['memory'],
-                            'pc': state['pc'],
-                            'console_output': output_capture.get_output(),
-                            'current_instruction': current_instruction
-                        }
-                    }), 200
-            elif control_signals['Branch']:
-                rs_name = get_register_name(get_register_number(parts[1]))
-                rt_name = get_register_name(get_register_number(parts[2]))
-                label = parts[3]
-                if op_code == 'beq' and state['registers'][rs_name] == state['registers'][rt_name]:
-                    state['pc'] = state['labels'][label]
-                    state['instruction_index'] = state['pc'] // 4
-                    return jsonify({
-                        'success': True,
-                        'completed': False,
-                        'data': {
-                            'registers': state['registers'],
-                            'memory': state['memory'],
-                            'pc': state['pc'],
-                            'console_output': output_capture.get_output(),
-                            'current_instruction': current_instruction
-                        }
-                    }), 200
-                elif op_code == 'bne' and state['registers'][rs_name] != state['registers'][rt_name]:
-                    state['pc'] = state['labels'][label]
-                    state['instruction_index'] = state['pc'] // 4
-                    return jsonify({
-                        'success': True,
-                        'completed': False,
-                        'data': {
-                            'registers': state['registers'],
-                            'memory': state['memory'],
-                            'pc': state['pc'],
-                            'console_output': output_capture.get_output(),
-                            'current_instruction': current_instruction
-                        }
-                    }), 200
-            else:
-                ALU_result = 0
-                if control_signals['ALUSrc']:
-                    if op_code in ['addi', 'andi', 'ori']:
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        rs_name = get_register_name(get_register_number(parts[2]))
-                        imm = int(parts[3])
-                        if op_code == 'addi':
-                            ALU_result = state['registers'][rs_name] + imm
-                        elif op_code == 'andi':
-                            ALU_result = state['registers'][rs_name] & imm
-                        elif op_code == 'ori':
-                            ALU_result = state['registers'][rs_name] | imm
-                        if control_signals['RegWrite']:
-                            state['registers'][rt_name] = ALU_result
-                    elif op_code == 'lui':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        imm = int(parts[2])
-                        if control_signals['RegWrite']:
-                            state['registers'][rt_name] = imm << 16
-                    elif op_code == 'li':
-                        rd_name = get_register_name(get_register_number(parts[1]))
-                        imm = int(parts[2])
-                        if control_signals['RegWrite']:
-                            state['registers'][rd_name] = imm
-                    elif op_code == 'lw':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        if len(parts) == 4:
-                            offset = int(parts[2])
-                            base_name = get_register_name(get_register_number(parts[3]))
-                            address = state['registers'][base_name] + offset
-                        elif len(parts) == 3:
-                            label = parts[2]
-                            address = state['labels'].get(label)
-                            if address is None:
-                                raise ValueError(f"Label {label} not found")
-                        else:
-                            raise ValueError("Invalid lw instruction format")
-                        if control_signals['MemRead']:
-                            data = state['memory'].get(address, 0)
-                            if control_signals['RegWrite']:
-                                state['registers'][rt_name] = data
-                    elif op_code == 'sw':
-                        rt_name = get_register_name(get_register_number(parts[1]))
-                        if len(parts) == 4:
-                            offset = int(parts[2])
-                            base_name = get_register_name(get_register_number(parts[3]))
-                            address = state['registers'][base_name] + offset
-                        elif len(parts) == 3:
-                            label = parts[2]
-                            address = state['labels'].get(label)
-                            if address is None:
-                                raise ValueError(f"Label {label} not found")
-                        else:
-                            raise ValueError("Invalid sw instruction format")
-                        if control_signals['MemWrite']:
-                            state['memory'][address] = state['registers'][rt_name]
-                else:
-                    rd_name = get_register_name(get_register_number(parts[1]))
-                    rs_name = get_register_name(get_register_number(parts[2]))
-                    rt_name = get_register_name(get_register_number(parts[3]))
-                    if op_code == 'add':
-                        ALU_result = state['registers'][rs_name] + state['registers'][rt_name]
-                    elif op_code == 'sub':
-                        ALU_result = state['registers'][rs_name] - state['registers'][rt_name]
-                    elif op_code == 'and':
-                        ALU_result = state['registers'][rs_name] & state['registers'][rt_name]
-                    elif op_code == 'or':
-                        ALU_result = state['registers'][rs_name] | state['registers'][rt_name]
-                    elif op_code == 'slt':
-                        ALU_result = 1 if state['registers'][rs_name] < state['registers'][rt_name] else 0
-                    elif op_code == 'mul':
-                        ALU_result = state['registers'][rs_name] * state['registers'][rt_name]
-                    elif op_code == 'xor':
-                        ALU_result = state['registers'][rs_name] ^ state['registers'][rt_name]
-                    elif op_code == 'nor':
-                        ALU_result = ~(state['registers'][rs_name] | state['registers'][rt_name])
-                    elif op_code == 'sll':
-                        rt_name = get_register_name(get_register_number(parts[2]))
-                        shamt = int(parts[3])
-                        ALU_result = state['registers'][rt_name] << shamt
-                    elif op_code == 'srl':
-                        rt_name = get_register_name(get_register_number(parts[2]))
-                        shamt = int(parts[3])
-                        ALU_result = state['registers'][rt_name] >> shamt
-                    else:
-                        raise ValueError(f"Unsupported ALU operation {op_code}")
-                    if control_signals['RegWrite']:
-                        state['registers'][rd_name] = ALU_result
+        if delta:
+            # RegisterFile.load() swaps in a new array, so old_registers is intact
+            register_data = {REG_NAMES[num]: value
+                             for num, (old, value) in enumerate(zip(old_registers, registers.values))
+                             if old != value}
+        else:
+            register_data = registers.to_dict()
+        
+        response_data = {
+            'registers': register_data,
+            'pc': state['pc'],
+            'console_output': output_capture.get_output(),
+            'current_instruction': current_instruction
+        }
+        if include_memory and delta:
+            memory_data = response_data['memory'] = {}
+            if written:
+                address = written[0]
+                for offset, (old, value) in enumerate(zip(old_bytes, memory.read(*written))):
+                    if old != value:
+                        memory_data[(address + offset) & 0xFFFFFFFF] = value
+        elif include_memory:
+            response_data['memory'] = memory.to_dict()
+        for probe in state['probes']:
+            response_data[probe.name] = probe.report()
+        return jsonify({
+            'success': True,
+            'completed': False,
+            'seq': state['seq'],
+            'delta': delta,
+            'data': response_data
+        }), 200
 
-            # Update PC and instruction index
-            state['pc'] += 4
-            state['instruction_index'] += 1
-            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f"Internal server error: {str(e)}"
+        }), 500
+
+@app.route('/api/run', methods=['POST'])
+def run_steps():
+    """Run a stepping session until a breakpoint, watchpoint or limit
+
+    Accepts 'steps' (capped by MAX_INSTRUCTIONS), 'breakpoints' (text
+    addresses or labels), 'watch_registers' (register names) and
+    'watch_memory' (word addresses or data labels). Responds with a full
+    snapshot (memory only with 'include_memory'), 'stop_reason' and, for
+    watchpoints, what changed in 'watch'.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+
+        with phase('session'):
+            state = execution_states.get(session_id) if isinstance(session_id, str) else None
+        if state is None:
+            return jsonify({'success': False, 'error': 'Invalid session'}), 400
+
+        if state['completed'] or not 0 <= state['instruction_index'] < len(state['program']) or state['pc'] & 3:
             return jsonify({
                 'success': True,
-                'completed': False,
-                'data': {
-                    'registers': state['registers'],
-                    'memory': state['memory'],
-                    'pc': state['pc'],
-                    'console_output': output_capture.get_output(),
-                    'current_instruction': current_instruction
-                }
+                'completed': True,
+                'message': 'Program execution completed',
+                'seq': state['seq']
             }), 200
 
-        except Exception as e:
+        labels = state['labels']
+        try:
+            max_steps = app.config['MAX_INSTRUCTIONS']
+            steps = data.get('steps')
+            if steps is not None:
+                if not isinstance(steps, int) or isinstance(steps, bool) or steps <= 0:
+                    raise ValueError('steps must be a positive integer')
+                max_steps = min(steps, max_steps)
+            breakpoints = []
+            for value in data.get('breakpoints') or ():
+                address = resolve_address(value, labels)
+                if address & 3 or not 0 <= address >> 2 < len(state['program']):
+                    raise ValueError(f"Breakpoint is not an instruction address: {value!r}")
+                breakpoints.append(address >> 2)
+            watch_registers = []
+            for name in data.get('watch_registers') or ():
+                number = get_register_number(str(name))
+                if not 0 <= number < 32:
+                    raise ValueError(f"Unknown register name {name}")
+                watch_registers.append(number)
+            watch_memory = [resolve_address(value, labels)
+                            for value in data.get('watch_memory') or ()]
+            include_memory = resolve_include_memory(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        output_capture = OutputCapture(state['input'], limit=app.config['OUTPUT_LIMIT'])
+        deadline = time.monotonic() + app.config['TIME_LIMIT']
+        history = state['history']
+        history.checkpoint(state)
+        base_output = len(state['output_buffer'])
+
+        def on_progress(executed, pc):
+            if history.time + executed - history.checkpoints[-1][0] >= CHECKPOINT_INTERVAL:
+                # The console is capped (see append_session_output), so
+                # the run's output may only partly be in it
+                limit = max(app.config['OUTPUT_LIMIT'], base_output)
+                history.checkpoint(state, time=history.time + executed, pc=pc,
+                                   output_length=min(base_output + output_capture.length, limit))
+
+        try:
+            with phase('execute') as timer:
+                pc, executed, reason, watch = run_session(
+                    state, output_capture, max_steps, breakpoints, watch_registers,
+                    watch_memory, deadline, on_progress)
+        except ExecutionError as e:
+            history.abort(state)
             return jsonify({
                 'success': False,
                 'error': f"Error executing instruction: {str(e)}"
             }), 500
 
+        history.advance(executed)
+        count_execution(executed, timer.seconds)
+        if reason == 'exit':
+            # As with /api/step, the pc moves past the exit syscall
+            reason = 'completed'
+            pc += 4
+        if reason == 'completed':
+            state['completed'] = True
+        state['pc'] = pc
+        state['instruction_index'] = pc // 4
+        append_session_output(state, output_capture.get_output())
+        state['seq'] += 1
+        with phase('session'):
+            execution_states.save(session_id, state)
+
+        index = state['instruction_index']
+        response_data = {
+            'registers': state['registers'].to_dict(),
+            'pc': state['pc'],
+            'console_output': output_capture.get_output(),
+            'next_instruction': (state['instructions'][index]
+                                 if 0 <= index < len(state['instructions']) else None)
+        }
+        if include_memory:
+            response_data['memory'] = state['memory'].to_dict()
+        for probe in state['probes']:
+            response_data[probe.name] = probe.report()
+        return jsonify({
+            'success': True,
+            'completed': state['completed'],
+            'seq': state['seq'],
+            'delta': False,
+            'stop_reason': reason,
+            'watch': watch,
+            'instructions_executed': executed,
+            'data': response_data
+        }), 200
+
     except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/step-back', methods=['POST'])
+def step_back():
+    """Rewind a stepping session by 'steps' instructions (default 1)
+
+    Responds with a full snapshot (memory only with 'include_memory'), the
+    number of instructions actually rewound (fewer when history does not
+    reach back that far), the instruction count history now starts at
+    ('history_start') and the whole console output up to the new position.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+
+        with phase('session'):
+            state = execution_states.get(session_id) if isinstance(session_id, str) else None
+        if state is None:
+            return jsonify({'success': False, 'error': 'Invalid session'}), 400
+
+        steps = data.get('steps', 1)
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps <= 0:
+            return jsonify({'success': False, 'error': 'steps must be a positive integer'}), 400
+        try:
+            include_memory = resolve_include_memory(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        history = state['history']
+        with phase('rewind'):
+            rewound = history.rewind(state, steps)
+        state['seq'] += 1
+        with phase('session'):
+            execution_states.save(session_id, state)
+
+        index = state['instruction_index']
+        response_data = {
+            'registers': state['registers'].to_dict(),
+            'pc': state['pc'],
+            'console_output': state['output_buffer'],
+            'next_instruction': (state['instructions'][index]
+                                 if 0 <= index < len(state['instructions']) else None)
+        }
+        if include_memory:
+            response_data['memory'] = state['memory'].to_dict()
         return jsonify({
-            'success': False,
-            'error': f"Internal server error: {str(e)}"
-        }), 500
+            'success': True,
+            'completed': state['completed'],
+            'seq': state['seq'],
+            'delta': False,
+            'rewound': rewound,
+            'instructions_executed': history.time,
+            'history_start': history.oldest(),
+            'data': response_data
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+MEMORY_FORMATS = {'byte': 1, 'word': 4}
+
+def memory_window(memory, start, length, width):
+    """Return the values of the ``length`` bytes at ``start`` as bytes
+    (``width`` 1) or signed little-endian words (``width`` 4)."""
+    data = memory.read(start, length)
+    if width == 1:
+        return list(data)
+    return list(struct.unpack(f'<{length // 4}i', data))
+
+def nonzero_memory(memory, start, end, width, limit):
+    """Return ({address: value} for up to ``limit`` non-zero bytes or
+    aligned words in [start, end), the address to resume from or None)."""
+    entries = {}
+    for address, value in memory.items(start, end):
+        if width == 4:
+            address &= ~3
+            if address in entries:
+                continue
+            value = memory.load_word(address)
+        if len(entries) == limit:
+            return entries, address
+        entries[address] = value
+    return entries, None
+
+@app.route('/api/memory', methods=['POST'])
+def memory_query():
+    """Read a window of a stepping session's memory
+
+    Takes 'start' (an address or data label, default the start of .data),
+    'length' in bytes (default 256) and 'format', 'byte' (default) or
+    'word' for aligned signed words. Responds with the window's 'values'
+    and the address of the following window in 'next'. With 'nonzero'
+    the range, which then defaults to the rest of the address space, is
+    instead listed as {address: value} 'entries' for its non-zero bytes or
+    words, at most 'limit' of them; 'next' is where to continue, or null.
+    """
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+
+        with phase('session'):
+            state = execution_states.get(session_id) if isinstance(session_id, str) else None
+        if state is None:
+            return jsonify({'success': False, 'error': 'Invalid session'}), 400
+
+        window_limit = app.config['MEMORY_WINDOW_LIMIT']
+        nonzero = data.get('nonzero', False)
+        try:
+            if not isinstance(nonzero, bool):
+                raise ValueError('nonzero must be true or false')
+            start = resolve_address(data.get('start', DATA_BASE), state['labels'])
+            output_format = data.get('format', 'byte')
+            if output_format not in MEMORY_FORMATS:
+                raise ValueError(f"format must be one of: {', '.join(MEMORY_FORMATS)}")
+            width = MEMORY_FORMATS[output_format]
+            length = data.get('length', (1 << 32) - start if nonzero else 256)
+            if not isinstance(length, int) or isinstance(length, bool) or length <= 0:
+                raise ValueError('length must be a positive integer')
+            if start + length > 1 << 32:
+                raise ValueError('Window extends past the end of memory')
+            if not nonzero and length > window_limit:
+                raise ValueError(f"length must be at most {window_limit} bytes")
+            if width == 4 and (start & 3 or length & 3):
+                raise ValueError('Word windows must be word-aligned')
+            limit = data.get('limit', window_limit)
+            if (not isinstance(limit, int) or isinstance(limit, bool)
+                    or not 0 < limit <= window_limit):
+                raise ValueError(f"limit must be between 1 and {window_limit}")
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        window = {'start': start, 'length': length, 'format': output_format}
+        if nonzero:
+            window['entries'], window['next'] = nonzero_memory(
+                state['memory'], start, start + length, width, limit)
+        else:
+            window['values'] = memory_window(state['memory'], start, length, width)
+            window['next'] = start + length if start + length < 1 << 32 else None
+        return jsonify({'success': True, 'seq': state['seq'], 'data': window}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """A stepping session's current state, without executing anything
+
+    Memory is included with ?include_memory=true. The ETag changes with
+    every step, run or step-back (it is derived from the session's seq),
+    so a client polling with If-None-Match gets 304 Not Modified until the
+    state moves on, without the snapshot being built or sent.
+    """
+    try:
+        include_memory = request.args.get('include_memory', 'false')
+        if include_memory not in ('true', 'false'):
+            return jsonify({'success': False, 'error': 'include_memory must be true or false'}), 400
+
+        with phase('session'):
+            state = execution_states.get(session_id)
+        if state is None:
+            return jsonify({'success': False, 'error': 'Invalid session'}), 404
+
+        # The representation also depends on the query (fields, memory)
+        # and on the negotiated encoding
+        variant = hashlib.blake2b(f'{request.query_string!r} {response_mimetype()}'.encode('utf-8'),
+                                  digest_size=6).hexdigest()
+        etag = f"{state['seq']}-{variant}"
+        if etag in request.if_none_match or etag + '-gzip' in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            return response
+
+        index = state['instruction_index']
+        response_data = {
+            'registers': state['registers'].to_dict(),
+            'pc': state['pc'],
+            'console_output': state['output_buffer'],
+            'next_instruction': (state['instructions'][index]
+                                 if 0 <= index < len(state['instructions']) else None)
+        }
+        if include_memory == 'true':
+            response_data['memory'] = state['memory'].to_dict()
+        for probe in state['probes']:
+            response_data[probe.name] = probe.report()
+        response = jsonify({
+            'success': True,
+            'completed': state['completed'],
+            'seq': state['seq'],
+            'delta': False,
+            'instructions_executed': state['history'].time,
+            'data': response_data
+        })
+        response.set_etag(etag)
+        return response
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,371 @@
+"""Microbenchmarks for the simulator core.
+
+Runs a corpus of representative workloads and measures, for each one:
+assembly time (read, parse and decode, uncached), execution speed of
+run_simulation with and without compiled blocks, per-step latency of
+/api/step through the Flask test client, and peak Python memory while
+assembling and running. Results are written as JSON; with --compare the
+run is checked against an earlier result file and exits with status 1 if
+anything got slower (or bigger) by more than --threshold.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --scale 0.1 --compare bench.json
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import api
+
+
+def arithmetic_loop(n):
+    """Tight register-only loop: ALU ops and a backward branch."""
+    source = f'''
+.text
+main:
+    li $t0, 0
+    li $t1, {n}
+    li $t2, 3
+loop:
+    add $t3, $t3, $t0
+    xor $t4, $t3, $t2
+    mul $t5, $t0, $t2
+    sub $t6, $t5, $t4
+    sll $t7, $t6, 2
+    addi $t0, $t0, 1
+    bne $t0, $t1, loop
+    li $v0, 1
+    move $a0, $t0
+    syscall
+    li $v0, 10
+    syscall
+'''
+    return source, f'{n}Program exit\n'
+
+
+def print_strings(n):
+    """A syscall 4 for every few instructions."""
+    text = 'The quick brown fox jumps over the lazy dog'
+    source = f'''
+.data
+    line: .asciiz "{text}\\n"
+
+.text
+main:
+    li $t0, 0
+    li $t1, {n}
+    la $a0, line
+    li $v0, 4
+loop:
+    syscall
+    addi $t0, $t0, 1
+    bne $t0, $t1, loop
+    li $v0, 10
+    syscall
+'''
+    return source, f'{text}\n' * n + 'Program exit\n'
+
+
+def _word_lines(values, per_line=16):
+    return '\n'.join('    .word ' + ', '.join(map(str, values[i:i + per_line]))
+                     for i in range(0, len(values), per_line))
+
+
+def array_walk(size, passes):
+    """lw/sw over a .word array, several passes."""
+    values = [i % 100 for i in range(size)]
+    source = f'''
+.data
+    array:
+{_word_lines(values)}
+
+.text
+main:
+    li $s0, 0
+    li $s1, {passes}
+outer:
+    la $t0, array
+    li $t1, 0
+    li $t2, {size}
+inner:
+    lw $t3, 0($t0)
+    addi $t3, $t3, 1
+    sw $t3, 0($t0)
+    add $s2, $s2, $t3
+    addi $t0, $t0, 4
+    addi $t1, $t1, 1
+    bne $t1, $t2, inner
+    addi $s0, $s0, 1
+    bne $s0, $s1, outer
+    li $v0, 1
+    move $a0, $s2
+    syscall
+    li $v0, 10
+    syscall
+'''
+    total = passes * sum(values) + size * passes * (passes + 1) // 2
+    return source, f'{total}Program exit\n'
+
+
+def recursive_calls(n):
+    """Naive recursive Fibonacci: jal/jr with stack traffic."""
+    source = f'''
+.text
+main:
+    li $a0, {n}
+    jal fib
+    move $a0, $v0
+    li $v0, 1
+    syscall
+    li $v0, 10
+    syscall
+fib:
+    li $t1, 2
+    slt $t0, $a0, $t1
+    beq $t0, $zero, recurse
+    move $v0, $a0
+    jr $ra
+recurse:
+    addi $sp, $sp, -12
+    sw $ra, 0($sp)
+    sw $a0, 4($sp)
+    addi $a0, $a0, -1
+    jal fib
+    sw $v0, 8($sp)
+    lw $a0, 4($sp)
+    addi $a0, $a0, -2
+    jal fib
+    lw $t0, 8($sp)
+    add $v0, $v0, $t0
+    lw $ra, 0($sp)
+    addi $sp, $sp, 12
+    jr $ra
+'''
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return source, f'{a}Program exit\n'
+
+
+def large_data(size):
+    """A big .data section (mostly parse cost) summed once."""
+    values = [(i * 7919) % 1000 for i in range(size)]
+    source = f'''
+.data
+    banner: .asciiz "sum="
+    table:
+{_word_lines(values)}
+
+.text
+main:
+    la $t0, table
+    li $t1, {size}
+loop:
+    lw $t2, 0($t0)
+    add $s0, $s0, $t2
+    addi $t0, $t0, 4
+    addi $t1, $t1, -1
+    bne $t1, $zero, loop
+    li $v0, 4
+    la $a0, banner
+    syscall
+    li $v0, 1
+    move $a0, $s0
+    syscall
+    li $v0, 10
+    syscall
+'''
+    return source, f'sum={sum(values)}Program exit\n'
+
+
+def workloads(scale=1.0):
+    """Return {name: (source, expected console output)} sized by ``scale``."""
+    def size(n):
+        return max(1, int(n * scale))
+    return {
+        'arithmetic_loop': arithmetic_loop(size(200_000)),
+        'print_strings': print_strings(size(20_000)),
+        'array_walk': array_walk(size(2_000), 50),
+        # Call count grows by the golden ratio per level of depth
+        'recursive_calls': recursive_calls(max(2, 20 + round(math.log(scale) / math.log(1.618)))),
+        'large_data': large_data(size(50_000)),
+    }
+
+
+def _best(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None or elapsed < best else best
+    return best, result
+
+
+def run(assembled, jit):
+    """Run ``assembled`` to completion with or without compiled blocks."""
+    saved = api.app.config['JIT_THRESHOLD']
+    if not jit:
+        api.app.config['JIT_THRESHOLD'] = 0
+    try:
+        return api.run_simulation(assembled.instructions, assembled.labels,
+                                  assembled.memory.copy(), program=assembled.program)
+    finally:
+        api.app.config['JIT_THRESHOLD'] = saved
+
+
+def step_latency(client, source, steps, delta=False):
+    """Microseconds per /api/step over the first ``steps`` steps, asking for
+    full snapshots or (with ``delta``) for delta responses."""
+    response = client.post('/api/init-step', json={'code': source})
+    session_id = response.get_json()['session_id']
+    body = {'session_id': session_id}
+    latencies = []
+    for _ in range(steps):
+        started = time.perf_counter()
+        data = client.post('/api/step', json=body).get_json()
+        latencies.append((time.perf_counter() - started) * 1e6)
+        if data.get('completed'):
+            break
+        if delta:
+            body['seq'] = data['seq']
+    latencies.sort()
+    return {
+        'median': statistics.median(latencies),
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'steps': len(latencies)
+    }
+
+
+def peak_memory(source):
+    """Peak bytes allocated while assembling and running ``source``."""
+    tracemalloc.start()
+    try:
+        run(api.assemble(source), jit=True)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(name, source, expected, repeat, steps, client):
+    parse_seconds, assembled = _best(repeat, lambda: api.assemble(source))
+    result = {'parse_seconds': parse_seconds, 'run_seconds': {}, 'mips': {}}
+    for mode, jit in (('interpreter', False), ('jit', True)):
+        seconds, results = _best(repeat, lambda: run(assembled, jit))
+        if results['console_output'] != expected:
+            raise RuntimeError(f"{name} ({mode}) produced unexpected output")
+        result['instructions'] = results['instructions_executed']
+        result['run_seconds'][mode] = seconds
+        result['mips'][mode] = results['instructions_executed'] / seconds / 1e6
+    result['step_latency_us'] = step_latency(client, source, steps)
+    result['delta_step_latency_us'] = step_latency(client, source, steps, delta=True)
+    result['peak_memory_bytes'] = peak_memory(source)
+    return result
+
+
+def metadata(scale):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'commit': commit,
+        'scale': scale
+    }
+
+
+# Measurements where a larger number is a regression
+def _comparable(result):
+    yield 'parse_seconds', result['parse_seconds']
+    for mode, seconds in result['run_seconds'].items():
+        yield f'run_seconds.{mode}', seconds
+    yield 'step_latency_us.median', result['step_latency_us']['median']
+    yield 'delta_step_latency_us.median', result['delta_step_latency_us']['median']
+    yield 'peak_memory_bytes', result['peak_memory_bytes']
+
+
+def compare(baseline, current, threshold):
+    """Return a line per regression of more than ``threshold`` (a fraction)."""
+    regressions = []
+    for name, result in current['workloads'].items():
+        old = baseline.get('workloads', {}).get(name)
+        if old is None:
+            continue
+        old_values = dict(_comparable(old))
+        for key, value in _comparable(result):
+            before = old_values.get(key)
+            if before and value > before * (1 + threshold):
+                regressions.append(f'{name} {key}: {before:.6g} -> {value:.6g} '
+                                   f'({value / before:.2f}x)')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply workload sizes (default 1.0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repetitions; the best time is kept (default 3)')
+    parser.add_argument('--steps', type=int, default=500,
+                        help='/api/step calls per workload (default 500)')
+    parser.add_argument('--workload', action='append',
+                        help='run only this workload (repeatable)')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown as a fraction (default 0.25)')
+    args = parser.parse_args(argv)
+
+    corpus = workloads(args.scale)
+    selected = args.workload or list(corpus)
+    unknown = set(selected) - set(corpus)
+    if unknown:
+        parser.error(f"unknown workload: {', '.join(sorted(unknown))}")
+
+    client = api.app.test_client()
+    results = {'meta': metadata(args.scale), 'workloads': {}}
+    for name in selected:
+        source, expected = corpus[name]
+        result = benchmark(name, source, expected, args.repeat, args.steps, client)
+        results['workloads'][name] = result
+        print(f"{name:16} parse {result['parse_seconds'] * 1000:8.2f} ms  "
+              f"interp {result['mips']['interpreter']:6.2f} MIPS  "
+              f"jit {result['mips']['jit']:6.2f} MIPS  "
+              f"step {result['step_latency_us']['median']:7.1f} us  "
+              f"delta {result['delta_step_latency_us']['median']:6.1f} us  "
+              f"peak {result['peak_memory_bytes'] / 1024:8.0f} KiB", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('scale') != args.scale:
+            print('Cannot compare: baseline was run with a different --scale', file=sys.stderr)
+            return 2
+        regressions = compare(baseline, results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Response encodings other than JSON.
+
+pack_msgpack() encodes plain Python data (dicts, lists, strings, bytes,
+ints, floats, booleans and None) as MessagePack, without a third-party
+dependency. pack_state() writes a simulator state snapshot in a packed
+binary layout:
+
+    header        '<4sIIIII': magic b'MST1', flags (1 delta, 2 completed),
+                  seq, pc, register mask, memory run count
+    registers     one little-endian int32 per bit set in the register
+                  mask, in register number order (all 32 for a snapshot)
+    memory runs   '<II' base address and length, then that many bytes
+    output        UTF-8 console output up to the end of the body
+
+project() narrows a response to the requested ``fields=``.
+"""
+import struct
+
+STATE_MAGIC = b'MST1'
+STATE_HEADER = struct.Struct('<4sIIIII')
+STATE_RUN = struct.Struct('<II')
+STATE_DELTA = 1
+STATE_COMPLETED = 2
+
+_UINT = ((0xFF, b'\xcc', '>B'), (0xFFFF, b'\xcd', '>H'),
+         (0xFFFFFFFF, b'\xce', '>I'), (0xFFFFFFFFFFFFFFFF, b'\xcf', '>Q'))
+_INT = ((-0x80, b'\xd0', '>b'), (-0x8000, b'\xd1', '>h'),
+        (-0x80000000, b'\xd2', '>i'), (-0x8000000000000000, b'\xd3', '>q'))
+
+
+def _pack_length(chunks, length, fix_base, fix_limit, markers):
+    if length < fix_limit:
+        chunks.append(bytes((fix_base | length,)))
+        return
+    for limit, marker, fmt in markers:
+        if length <= limit:
+            chunks.append(marker + struct.pack(fmt, length))
+            return
+    raise ValueError('Too long for MessagePack')
+
+
+def _pack(chunks, value):
+    if value is None:
+        chunks.append(b'\xc0')
+    elif value is True:
+        chunks.append(b'\xc3')
+    elif value is False:
+        chunks.append(b'\xc2')
+    elif isinstance(value, int):
+        if -32 <= value < 0x80:
+            # Positive and negative fixint
+            chunks.append(bytes((value & 0xFF,)))
+            return
+        for bound, marker, fmt in (_UINT if value >= 0 else _INT):
+            if bound <= value <= 0 or 0 <= value <= bound:
+                chunks.append(marker + struct.pack(fmt, value))
+                return
+        raise ValueError('Integer too large for MessagePack')
+    elif isinstance(value, float):
+        chunks.append(b'\xcb' + struct.pack('>d', value))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        _pack_length(chunks, len(data), 0xA0, 32, ((0xFF, b'\xd9', '>B'), (0xFFFF, b'\xda', '>H'),
+                                                   (0xFFFFFFFF, b'\xdb', '>I')))
+        chunks.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _pack_length(chunks, len(value), 0, 0, ((0xFF, b'\xc4', '>B'), (0xFFFF, b'\xc5', '>H'),
+                                                (0xFFFFFFFF, b'\xc6', '>I')))
+        chunks.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        _pack_length(chunks, len(value), 0x90, 16, ((0xFFFF, b'\xdc', '>H'),
+                                                    (0xFFFFFFFF, b'\xdd', '>I')))
+        for item in value:
+            _pack(chunks, item)
+    elif isinstance(value, dict):
+        _pack_length(chunks, len(value), 0x80, 16, ((0xFFFF, b'\xde', '>H'),
+                                                    (0xFFFFFFFF, b'\xdf', '>I')))
+        for key, item in value.items():
+            _pack(chunks, key)
+            _pack(chunks, item)
+    else:
+        raise TypeError(f'Cannot encode {type(value).__name__} as MessagePack')
+
+
+def pack_msgpack(value):
+    chunks = []
+    _pack(chunks, value)
+    return b''.join(chunks)
+
+
+def memory_runs(memory):
+    """Group {address: byte} (addresses as ints or numeric strings) into
+    (base, bytes) runs of consecutive addresses."""
+    addresses = sorted((int(address, 0) if isinstance(address, str) else address, int(value))
+                       for address, value in memory.items())
+    runs = []
+    for address, value in addresses:
+        if runs and runs[-1][0] + len(runs[-1][1]) == address:
+            runs[-1][1].append(value)
+        else:
+            runs.append((address, bytearray((value,))))
+    return runs
+
+
+def pack_state(data, register_names, seq=0, delta=False, completed=False):
+    """Pack a response's state ``data`` (registers by name, optional memory,
+    pc and console output) in the layout described above."""
+    registers = data.get('registers', {})
+    mask = 0
+    values = []
+    for number, name in enumerate(register_names):
+        if name in registers:
+            mask |= 1 << number
+            values.append(registers[name])
+    runs = memory_runs(data.get('memory', {}))
+    flags = (STATE_DELTA if delta else 0) | (STATE_COMPLETED if completed else 0)
+    parts = [STATE_HEADER.pack(STATE_MAGIC, flags, seq, data.get('pc', 0) & 0xFFFFFFFF,
+                               mask, len(runs)),
+             struct.pack(f'<{len(values)}i', *values)]
+    for base, run in runs:
+        parts.append(STATE_RUN.pack(base, len(run)))
+        parts.append(run)
+    parts.append(data.get('console_output', '').encode('utf-8'))
+    return b''.join(parts)
+
+
+def _select(data, fields):
+    selected = {}
+    for field in fields:
+        name, _, key = field.partition('.')
+        if name not in data:
+            continue
+        value = data[name]
+        if not key:
+            selected[name] = value
+        elif isinstance(value, dict) and key in value:
+            part = selected.setdefault(name, {})
+            if isinstance(part, dict) and part is not value:
+                part[key] = value[key]
+    return selected
+
+
+def project(body, fields):
+    """Return ``body`` with every 'data' object in it narrowed to
+    ``fields``: key names, or 'key.subkey' for single entries such as
+    'registers.v0'. Everything outside 'data' (success, error, seq, ...)
+    is kept."""
+    if isinstance(body, dict):
+        return {key: (_select(value, fields) if key == 'data' and isinstance(value, dict)
+                      else project(value, fields))
+                for key, value in body.items()}
+    if isinstance(body, list):
+        return [project(item, fields) for item in body]
+    return body
@@ -0,0 +1,125 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+Counters and histograms are updated as requests are served; gauges are
+computed by a callback when the metrics are scraped. Label values are
+passed as a tuple in the order of the metric's label names. Each metric
+has its own lock, so an update costs about a microsecond.
+"""
+from bisect import bisect_left
+import math
+import threading
+
+# Seconds; suits request phases from sub-millisecond lookups to long runs
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, labels=()):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            items = sorted((labels, list(counts)) for labels, counts in self.values.items())
+        bounds = self.buckets + (math.inf,)
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, labels, [('le', _format_value(bound))]),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.labelnames, labels), counts[-1]
+            yield self.name + '_count', _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge:
+    """A gauge whose samples come from ``collect()`` at scrape time, as
+    (label values, value) pairs."""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,299 @@
+"""Stores for stepping sessions.
+
+SessionStore keeps sessions in one process. Live sessions are kept in memory in least-recently-used order. Sessions
+pushed out by the memory budget, or idle for longer than ``hibernate_after``
+seconds, are written to ``hibernate_dir`` when one is configured and are
+transparently restored by the next get(); without a hibernation directory
+they are evicted instead. Sessions idle for longer than ``ttl`` seconds are
+dropped either way.
+
+SQLiteSessionStore keeps the authoritative copy of every session in a
+SQLite database, so any server process sharing the file can serve any
+session.
+
+The stores know nothing about what a session contains: they are given
+``serialize``/``deserialize`` functions for the on-disk format and
+``size_of`` to estimate how much memory a live session holds. Callers
+mutate the state get() returns and hand it back with save().
+"""
+from collections import OrderedDict
+import os
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    def __init__(self, serialize, deserialize, size_of, ttl, memory_budget,
+                 hibernate_dir=None, hibernate_after=None, sweep_interval=1.0,
+                 clock=time.monotonic):
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.size_of = size_of
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.hibernate_dir = hibernate_dir
+        self.hibernate_after = hibernate_after
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.live = OrderedDict()  # session id -> [state, size, last access]
+        self.hibernated = {}       # session id -> last access
+        self.live_bytes = 0
+        self.last_sweep = None
+        self.evicted = 0
+        self.expired = 0
+        self.hibernations = 0
+        self.restores = 0
+        if hibernate_dir:
+            os.makedirs(hibernate_dir, exist_ok=True)
+
+    def __contains__(self, session_id):
+        with self.lock:
+            return session_id in self.live or session_id in self.hibernated
+
+    def __len__(self):
+        with self.lock:
+            return len(self.live) + len(self.hibernated)
+
+    def get(self, session_id, default=None):
+        """Return the session's state, restoring it from disk if hibernated."""
+        with self.lock:
+            now = self.clock()
+            self.sweep(now)
+            entry = self.live.get(session_id)
+            if entry is not None:
+                self.live.move_to_end(session_id)
+                # The session may have grown since it was last sized
+                size = self.size_of(entry[0])
+                self.live_bytes += size - entry[1]
+                entry[1] = size
+            elif session_id in self.hibernated:
+                entry = self._restore(session_id)
+            else:
+                return default
+            entry[2] = now
+            self._enforce_budget(keep=session_id)
+            return entry[0]
+
+    def put(self, session_id, state):
+        with self.lock:
+            now = self.clock()
+            self.sweep(now)
+            self._discard(session_id)
+            size = self.size_of(state)
+            self.live[session_id] = [state, size, now]
+            self.live_bytes += size
+            self._enforce_budget(keep=session_id)
+
+    def save(self, session_id, state):
+        """Store a session's state after it has been changed."""
+        self.put(session_id, state)
+
+    def delete(self, session_id):
+        with self.lock:
+            self._discard(session_id)
+
+    def sweep(self, now=None, force=False):
+        """Expire and hibernate idle sessions (at most once per sweep_interval)."""
+        with self.lock:
+            now = self.clock() if now is None else now
+            if (not force and self.last_sweep is not None
+                    and now - self.last_sweep < self.sweep_interval):
+                return
+            self.last_sweep = now
+            for session_id, entry in list(self.live.items()):
+                idle = now - entry[2]
+                if idle > self.ttl:
+                    self._drop_live(session_id)
+                    self.expired += 1
+                elif (self.hibernate_dir and self.hibernate_after is not None
+                        and idle > self.hibernate_after):
+                    self._hibernate(session_id)
+                else:
+                    break  # LRU order: everything after this is more recent
+            for session_id, last_access in list(self.hibernated.items()):
+                if now - last_access > self.ttl:
+                    self._drop_hibernated(session_id)
+                    self.expired += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'backend': 'memory',
+                'live': len(self.live),
+                'hibernated': len(self.hibernated),
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'hibernations': self.hibernations,
+                'restores': self.restores,
+                'live_bytes': self.live_bytes,
+                'memory_budget': self.memory_budget
+            }
+
+    def _path(self, session_id):
+        return os.path.join(self.hibernate_dir, f'{session_id}.session')
+
+    def _enforce_budget(self, keep):
+        while self.live_bytes > self.memory_budget and len(self.live) > 1:
+            session_id = next(iter(self.live))
+            if session_id == keep:
+                self.live.move_to_end(session_id)
+                continue
+            if self.hibernate_dir:
+                self._hibernate(session_id)
+            else:
+                self._drop_live(session_id)
+                self.evicted += 1
+
+    def _hibernate(self, session_id):
+        state, _, last_access = self.live[session_id]
+        path = self._path(session_id)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.serialize(state))
+        os.replace(path + '.tmp', path)
+        self._drop_live(session_id)
+        self.hibernated[session_id] = last_access
+        self.hibernations += 1
+
+    def _restore(self, session_id):
+        path = self._path(session_id)
+        with open(path, 'rb') as f:
+            state = self.deserialize(f.read())
+        self._drop_hibernated(session_id)
+        size = self.size_of(state)
+        entry = self.live[session_id] = [state, size, self.clock()]
+        self.live_bytes += size
+        self.restores += 1
+        return entry
+
+    def _drop_live(self, session_id):
+        _, size, _ = self.live.pop(session_id)
+        self.live_bytes -= size
+
+    def _drop_hibernated(self, session_id):
+        del self.hibernated[session_id]
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def _discard(self, session_id):
+        if session_id in self.live:
+            self._drop_live(session_id)
+        if session_id in self.hibernated:
+            self._drop_hibernated(session_id)
+
+
+class SQLiteSessionStore:
+    """Session store backed by a SQLite database shared between processes.
+
+    Every save() writes the serialized session with its ``version_of``
+    number. Each process also keeps deserialized sessions in a local
+    SessionStore (bounded by ``memory_budget``), and get() only
+    deserializes when the stored version differs from the cached one, i.e.
+    when another process changed the session since this one last saw it.
+    Anything not serialized, such as the undo history, therefore survives
+    only while consecutive requests for a session reach the same process.
+    Sessions idle for longer than ``ttl`` seconds are deleted.
+    """
+
+    def __init__(self, path, serialize, deserialize, size_of, version_of, ttl,
+                 memory_budget, sweep_interval=1.0, clock=time.time):
+        self.path = path
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.version_of = version_of
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.cache = SessionStore(serialize, deserialize, size_of, ttl, memory_budget,
+                                  sweep_interval=sweep_interval, clock=clock)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.last_sweep = None
+        self.loads = 0
+        self.saves = 0
+        self.cache_hits = 0
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                       'id TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+                       'last_access REAL NOT NULL, state BLOB NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS sessions_last_access '
+                       'ON sessions (last_access)')
+
+    def _connection(self):
+        # One connection per thread, reopened in a forked worker
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            db = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+            self.local.pid = pid
+        return self.local.db
+
+    def __contains__(self, session_id):
+        row = self._connection().execute(
+            'SELECT 1 FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def get(self, session_id, default=None):
+        """Return the session's state, loading it if another process changed it."""
+        self.sweep()
+        db = self._connection()
+        row = db.execute('SELECT version FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            self.cache.delete(session_id)
+            return default
+        state = self.cache.get(session_id)
+        if state is not None and self.version_of(state) == row[0]:
+            with self.lock:
+                self.cache_hits += 1
+            return state
+        row = db.execute('SELECT state FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return default
+        state = self.deserialize(row[0])
+        self.cache.put(session_id, state)
+        with self.lock:
+            self.loads += 1
+        return state
+
+    def put(self, session_id, state):
+        self.sweep()
+        self._connection().execute(
+            'INSERT OR REPLACE INTO sessions (id, version, last_access, state) '
+            'VALUES (?, ?, ?, ?)',
+            (session_id, self.version_of(state), self.clock(), self.serialize(state)))
+        self.cache.put(session_id, state)
+        with self.lock:
+            self.saves += 1
+
+    save = put
+
+    def delete(self, session_id):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        self.cache.delete(session_id)
+
+    def sweep(self, now=None, force=False):
+        """Delete expired sessions (at most once per sweep_interval)."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            if (not force and self.last_sweep is not None
+                    and now - self.last_sweep < self.sweep_interval):
+                return
+            self.last_sweep = now
+        self._connection().execute('DELETE FROM sessions WHERE last_access < ?',
+                                   (now - self.ttl,))
+        self.cache.sweep(now, force)
+
+    def stats(self):
+        with self.lock:
+            counts = {'loads': self.loads, 'saves': self.saves, 'cache_hits': self.cache_hits}
+        cache = self.cache.stats()
+        return dict(counts, backend='sqlite', sessions=len(self),
+                    cached=cache['live'], cached_bytes=cache['live_bytes'])
@@ -1,6 +1,18 @@
 import unittest
-from api import app
+import base64
+import collections
+import gzip
+from api import app, program_cache
 import json
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import api
+import benchmark
+from sessions import SessionStore, SQLiteSessionStore
 
 class TestMIPSSimulator(unittest.TestCase):
     def setUp(self):
@@ -288,5 +300,1637 @@ class TestMIPSSimulator(unittest.TestCase):
         self.assertEqual(step2_data['data']['registers']['t0'], 42)
         self.assertEqual(step2_data['data']['registers']['t1'], 42)
 
+    def test_loop_with_backward_branch(self):
+        # Test case: Loop executes the same decoded instructions repeatedly
+        test_code = '''
+.text
+    li $t0, 0
+    li $t1, 1000
+loop:
+    addi $t0, $t0, 1
+    add $t2, $t2, $t0
+    bne $t0, $t1, loop
+        '''
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        
+        self.assertTrue(data['success'])
+        self.assertEqual(data['data']['registers']['t0'], 1000)
+        self.assertEqual(data['data']['registers']['t2'], 500500)
+        self.assertEqual(data['data']['pc'], 20)
+
+    def test_jal_jr_and_bad_label(self):
+        # Test case: Call/return, and a bad label only fails once it is executed
+        test_code = '''
+.text
+    jal func
+    j missing
+func:
+    li $v1, 7
+    jr $ra
+        '''
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        
+        self.assertTrue(data['success'])
+        self.assertEqual(data['data']['registers']['v1'], 7)
+        self.assertEqual(data['data']['registers']['ra'], 4)
+        self.assertEqual(data['data']['pc'], 4)
+        self.assertIn('Label missing not found', data['data']['console_output'])
+
+    def test_register_wraparound_and_zero(self):
+        # Test case: 32-bit wraparound, logical srl and a hardwired $zero
+        test_code = '''
+.text
+    li $t0, 2147483647
+    addi $t1, $t0, 1      # overflows to the most negative value
+    srl $t2, $t1, 31      # logical shift sees the sign bit as data
+    addi $zero, $zero, 5  # writes to $zero are discarded
+    mul $t3, $t0, $t0
+        '''
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        
+        self.assertTrue(data['success'])
+        self.assertEqual(data['data']['registers']['t1'], -2147483648)
+        self.assertEqual(data['data']['registers']['t2'], 1)
+        self.assertEqual(data['data']['registers']['zero'], 0)
+        self.assertEqual(data['data']['registers']['t3'], 1)
+        self.assertEqual(data['data']['registers']['sp'], 0x7FFFFFFC)
+
+    def test_word_array_and_byte_memory(self):
+        # Test case: Word array walk, store/load round trip and byte-level memory dump
+        test_code = '''
+.data
+    arr: .word 10, 20, -30
+    msg: .asciiz "ok"
+
+.text
+    la $t0, arr
+    lw $t1, 0($t0)
+    lw $t2, 4($t0)
+    lw $t3, 8($t0)
+    add $t4, $t1, $t2
+    add $t4, $t4, $t3
+    sw $t4, 0($t0)
+    lw $t5, arr
+    li $v0, 4
+    la $a0, msg
+    syscall
+        '''
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'include_memory': True}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        
+        self.assertTrue(data['success'])
+        self.assertEqual(data['data']['registers']['t3'], -30)
+        self.assertEqual(data['data']['registers']['t5'], 0)
+        self.assertEqual(data['data']['console_output'], "ok")
+        # Little-endian bytes: 20 at arr+4, 'o' at msg
+        self.assertEqual(data['data']['memory'][hex(0x10010004)], '20')
+        self.assertEqual(data['data']['memory'][hex(0x1001000C)], str(ord('o')))
+        self.assertNotIn(hex(0x10010000), data['data']['memory'])
+
+    def test_instruction_budget_stops_infinite_loop(self):
+        # Test case: An infinite loop is stopped by the per-request budget
+        test_code = '''
+.text
+loop:
+    addi $t0, $t0, 1
+    j loop
+        '''
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'max_instructions': 1001}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        
+        self.assertTrue(data['success'])
+        self.assertTrue(data['data']['budget_exhausted'])
+        self.assertFalse(data['data']['timed_out'])
+        self.assertEqual(data['data']['instructions_executed'], 1001)
+        self.assertEqual(data['data']['registers']['t0'], 501)
+        self.assertEqual(data['data']['pc'], 4)
+
+    def test_budget_override_is_capped_and_deadline_applies(self):
+        # Test case: Requests cannot raise the server limits; the deadline stops long runs
+        test_code = '''
+.text
+loop:
+    j loop
+        '''
+        saved = app.config['MAX_INSTRUCTIONS']
+        app.config['MAX_INSTRUCTIONS'] = 500
+        try:
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': test_code, 'max_instructions': 10**9}),
+                                   content_type='application/json')
+        finally:
+            app.config['MAX_INSTRUCTIONS'] = saved
+        data = json.loads(response.data)
+        self.assertEqual(data['data']['instructions_executed'], 500)
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'time_limit': 0.001}),
+                               content_type='application/json')
+        data = json.loads(response.data)
+        self.assertTrue(data['data']['timed_out'])
+        self.assertFalse(data['data']['budget_exhausted'])
+        
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'max_instructions': -1}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_program_cache_reuses_assembly_not_state(self):
+        # Test case: Repeat submissions hit the cache but each run gets fresh memory
+        test_code = '''
+.data
+    counter: .word 1
+
+.text
+    lw $t0, counter
+    addi $t0, $t0, 1
+    sw $t0, counter
+        '''
+        program_cache.clear()
+        before = program_cache.stats()
+        
+        for code in (test_code, test_code.replace('\n', '\r\n')):
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': code}),
+                                   content_type='application/json')
+            data = json.loads(response.data)
+            self.assertTrue(data['success'])
+            self.assertEqual(data['data']['registers']['t0'], 2)
+        
+        after = program_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        
+        health = json.loads(self.app.get('/api/health').data)
+        self.assertIn('hits', health['program_cache'])
+
+    def test_compiled_blocks_match_interpreter(self):
+        # Test case: Hot blocks compiled after the threshold give the same results
+        test_code = '''
+.data
+    arr: .word 5, -3, 8, 1
+
+.text
+    li $s0, 0
+outer:
+    la $t0, arr
+    li $t1, 0
+inner:
+    lw $t2, 0($t0)
+    sll $t3, $t2, 2
+    srl $t4, $t3, 1
+    sub $t5, $t4, $t2
+    xor $t6, $t5, $t3
+    nor $t7, $t6, $zero
+    slt $t8, $t2, $zero
+    add $s1, $s1, $t5
+    sw $s1, 0($t0)
+    addi $t0, $t0, 4
+    addi $t1, $t1, 1
+    li $t9, 4
+    bne $t1, $t9, inner
+    jal bump
+    addi $s0, $s0, 1
+    li $t9, 200
+    bne $s0, $t9, outer
+    j end
+bump:
+    mul $s2, $s1, $s1
+    andi $s3, $s2, 255
+    ori $s3, $s3, 4096
+    jr $ra
+end:
+        '''
+        saved = app.config['JIT_THRESHOLD']
+        results = []
+        try:
+            for threshold in (0, 1):
+                app.config['JIT_THRESHOLD'] = threshold
+                program_cache.clear()
+                for budget in (10**6, 1234):
+                    response = self.app.post('/api/simulate',
+                                           data=json.dumps({'code': test_code, 'max_instructions': budget}),
+                                           content_type='application/json')
+                    data = json.loads(response.data)
+                    self.assertTrue(data['success'])
+                    results.append(data['data'])
+        finally:
+            app.config['JIT_THRESHOLD'] = saved
+            program_cache.clear()
+        
+        self.assertFalse(results[0]['budget_exhausted'])
+        self.assertEqual(results[1]['instructions_executed'], 1234)
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[1], results[3])
+
+    def test_simulate_batch_matches_single_endpoint(self):
+        # Test case: Batch results on the process pool equal single-endpoint results
+        programs = [
+            ".text\n    addi $t0, $zero, 5\n    addi $t1, $t0, 3",
+            {'code': ".text\nloop:\n    addi $t0, $t0, 1\n    j loop", 'max_instructions': 100},
+            ".text\n    invalid_instruction $t0, $t1",
+        ]
+        
+        response = self.app.post('/api/simulate-batch',
+                               data=json.dumps({'programs': programs}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        results = data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertEqual([result['status'] for result in results], [200, 200, 400])
+        self.assertTrue(results[1]['data']['budget_exhausted'])
+        
+        single = json.loads(self.app.post('/api/simulate',
+                                          data=json.dumps({'code': programs[0]}),
+                                          content_type='application/json').data)
+        self.assertEqual(results[0]['data'], single['data'])
+        
+        # Streaming returns one JSON line per program as each completes
+        response = self.app.post('/api/simulate-batch',
+                               data=json.dumps({'programs': programs[:2], 'stream': True}),
+                               content_type='application/json')
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1])
+        
+        response = self.app.post('/api/simulate-batch',
+                               data=json.dumps({'programs': []}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def poll_job(self, job_id, done):
+        for _ in range(500):
+            job = json.loads(self.app.get(f'/api/jobs/{job_id}').data)['job']
+            if done(job):
+                return job
+            time.sleep(0.01)
+        self.fail(f"Job {job_id} never reached the expected state")
+
+    def test_job_submit_poll_and_cancel(self):
+        # Test case: Jobs run in the background, report progress and can be cancelled
+        response = self.app.post('/api/jobs',
+                               data=json.dumps({'code': ".text\n    li $t0, 9\n    addi $t1, $t0, 1"}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.data)['job']['id']
+        job = self.poll_job(job_id, lambda job: job['status'] == 'completed')
+        self.assertEqual(job['result']['data']['registers']['t1'], 10)
+        self.assertEqual(job['instructions_executed'], 2)
+        
+        infinite_loop = ".text\nloop:\n    addi $t0, $t0, 1\n    j loop"
+        response = self.app.post('/api/jobs',
+                               data=json.dumps({'code': infinite_loop}),
+                               content_type='application/json')
+        job_id = json.loads(response.data)['job']['id']
+        self.poll_job(job_id, lambda job: job['instructions_executed'] > 0)
+        
+        response = self.app.delete(f'/api/jobs/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        job = self.poll_job(job_id, lambda job: job['status'] == 'cancelled')
+        self.assertTrue(job['result']['data']['cancelled'])
+        self.assertEqual(job['result']['data']['instructions_executed'], job['instructions_executed'])
+        
+        response = self.app.get('/api/jobs/unknown')
+        self.assertEqual(response.status_code, 404)
+
+    def step(self, session_id):
+        response = self.app.post('/api/step',
+                               data=json.dumps({'session_id': session_id}),
+                               content_type='application/json')
+        return response.status_code, json.loads(response.data)
+
+    def test_session_store_hibernates_restores_and_expires(self):
+        # Test case: Over-budget sessions hibernate to disk and come back intact; idle ones expire
+        test_code = '''
+.data
+    value: .word 7
+
+.text
+    lw $t0, value
+    addi $t0, $t0, 1
+    sw $t0, value
+    lw $t1, value
+        '''
+        now = [0.0]
+        saved = api.execution_states
+        with tempfile.TemporaryDirectory() as hibernate_dir:
+            api.execution_states = SessionStore(
+                api.serialize_session, api.deserialize_session, api.session_size,
+                ttl=60, memory_budget=1, hibernate_dir=hibernate_dir,
+                hibernate_after=30, clock=lambda: now[0])
+            try:
+                first = json.loads(self.app.post('/api/init-step',
+                                                 data=json.dumps({'code': test_code}),
+                                                 content_type='application/json').data)['session_id']
+                self.step(first)
+                self.step(first)
+                self.step(first)
+                
+                # A second session pushes the first one out to disk
+                second = json.loads(self.app.post('/api/init-step',
+                                                  data=json.dumps({'code': test_code}),
+                                                  content_type='application/json').data)['session_id']
+                stats = api.execution_states.stats()
+                self.assertEqual((stats['live'], stats['hibernated']), (1, 1))
+                
+                status, data = self.step(first)
+                self.assertEqual(status, 200)
+                self.assertEqual(data['data']['registers']['t0'], 8)
+                self.assertEqual(data['data']['registers']['t1'], 8)
+                self.assertEqual(data['data']['pc'], 16)
+                self.assertEqual(api.execution_states.stats()['restores'], 1)
+                
+                # Idle past the TTL: both sessions are gone
+                now[0] = 120.0
+                api.execution_states.sweep(force=True)
+                self.assertEqual(len(api.execution_states), 0)
+                self.assertEqual(api.execution_states.stats()['expired'], 2)
+                status, data = self.step(second)
+                self.assertEqual(status, 400)
+                self.assertEqual(data['error'], 'Invalid session')
+            finally:
+                api.execution_states = saved
+
+    def test_step_delta_responses(self):
+        # Test case: Steps carrying the current seq return only what changed; stale seqs get a snapshot
+        test_code = '''
+.data
+    value: .word 0
+
+.text
+main:
+    li $t0, 258
+    la $t1, value
+    sw $t0, 0($t1)
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        init = json.loads(response.data)
+        session_id = init['session_id']
+        self.assertEqual(init['seq'], 0)
+
+        def step(seq):
+            response = self.app.post('/api/step',
+                                   data=json.dumps({'session_id': session_id, 'seq': seq,
+                                                    'include_memory': True}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+        first = step(0)
+        self.assertTrue(first['delta'])
+        self.assertEqual(first['seq'], 1)
+        self.assertEqual(first['data']['registers'], {'t0': 258})
+        self.assertEqual(first['data']['memory'], {})
+
+        second = step(1)
+        self.assertEqual(second['data']['registers'], {'t1': 0x10010000})
+
+        third = step(2)
+        self.assertEqual(third['data']['registers'], {})
+        self.assertEqual(third['data']['memory'], {str(0x10010000): 2, str(0x10010001): 1})
+
+        # A client that missed a response is resynchronised with a full snapshot
+        fourth = step(2)
+        self.assertFalse(fourth['delta'])
+        self.assertEqual(fourth['seq'], 4)
+        self.assertEqual(fourth['data']['registers']['t0'], 258)
+        self.assertEqual(fourth['data']['registers']['v0'], 10)
+        self.assertEqual(fourth['data']['memory'][str(0x10010000)], 2)
+
+    def test_run_to_breakpoints_and_watchpoints(self):
+        # Test case: /api/run stops at breakpoints, on watched changes, and after N steps
+        test_code = '''
+.data
+    total: .word 0
+
+.text
+main:
+    li $t0, 0
+    li $t1, 5
+    la $t2, total
+loop:
+    addi $t0, $t0, 1
+    bne $t0, $t1, loop
+    sw $t0, 0($t2)
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+
+        def run(**options):
+            response = self.app.post('/api/run',
+                                   data=json.dumps(dict(session_id=session_id, **options)),
+                                   content_type='application/json')
+            return response.status_code, json.loads(response.data)
+
+        status, data = run(breakpoints=['nowhere'])
+        self.assertEqual(status, 400)
+
+        status, data = run(breakpoints=['loop'])
+        self.assertEqual(status, 200)
+        self.assertEqual(data['stop_reason'], 'breakpoint')
+        self.assertEqual(data['data']['pc'], 12)
+        self.assertEqual(data['instructions_executed'], 3)
+        self.assertEqual(data['data']['next_instruction'], 'addi $t0, $t0, 1')
+
+        # Resuming from a breakpoint executes it and stops on the next pass
+        status, data = run(breakpoints=['loop'])
+        self.assertEqual(data['instructions_executed'], 2)
+        self.assertEqual(data['data']['registers']['t0'], 1)
+
+        status, data = run(steps=3)
+        self.assertEqual(data['stop_reason'], 'steps')
+        self.assertEqual(data['data']['registers']['t0'], 3)
+
+        status, data = run(watch_registers=['$t0'])
+        self.assertEqual(data['stop_reason'], 'watchpoint')
+        self.assertEqual(data['watch'], {'register': 't0', 'old': 3, 'new': 4})
+
+        status, data = run(watch_memory=['total'], include_memory=True)
+        self.assertEqual(data['stop_reason'], 'watchpoint')
+        self.assertEqual(data['watch'], {'address': 0x10010000, 'length': 4})
+        self.assertEqual(data['data']['memory'][str(0x10010000)], 5)
+
+        status, data = run()
+        self.assertEqual(data['stop_reason'], 'completed')
+        self.assertIn('Program exit', data['data']['console_output'])
+
+        status, data = run()
+        self.assertTrue(data['completed'])
+
+    def test_step_back_through_steps_and_runs(self):
+        # Test case: /api/step-back undoes single steps and rewinds into runs
+        test_code = '''
+.data
+    total: .word 0
+
+.text
+main:
+    li $t0, 0
+    li $t1, 50
+    la $t2, total
+loop:
+    addi $t0, $t0, 1
+    sw $t0, 0($t2)
+    bne $t0, $t1, loop
+    li $v0, 1
+    move $a0, $t0
+    syscall
+    li $v0, 10
+    syscall
+'''
+        def post(url, **body):
+            response = self.app.post(url, data=json.dumps(body),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+        session_id = post('/api/init-step', code=test_code)['session_id']
+        for _ in range(5):
+            post('/api/step', session_id=session_id)
+        data = post('/api/step-back', session_id=session_id, steps=2, include_memory=True)
+        self.assertEqual(data['rewound'], 2)
+        self.assertEqual(data['data']['pc'], 12)
+        self.assertEqual(data['data']['registers']['t0'], 0)
+        self.assertEqual(data['data']['memory'], {})
+
+        data = post('/api/run', session_id=session_id)
+        self.assertEqual(data['stop_reason'], 'completed')
+        self.assertEqual(api.execution_states.get(session_id)['output_buffer'],
+                         '50Program exit\n')
+
+        # Back into the run: the loop's last store and the print are undone
+        data = post('/api/step-back', session_id=session_id, steps=7, include_memory=True)
+        self.assertFalse(data['completed'])
+        self.assertEqual(data['data']['next_instruction'], 'sw $t0, 0($t2)')
+        self.assertEqual(data['data']['registers']['t0'], 50)
+        self.assertEqual(data['data']['memory'][str(0x10010000)], 49)
+        self.assertEqual(data['data']['console_output'], '')
+
+        data = post('/api/step-back', session_id=session_id, steps=10 ** 6)
+        self.assertEqual(data['instructions_executed'], 0)
+        self.assertEqual(data['data']['pc'], 0)
+        self.assertEqual(data['data']['registers']['t0'], 0)
+
+        # History is linear: running again replays the same program
+        data = post('/api/run', session_id=session_id)
+        self.assertEqual(data['data']['console_output'], '50Program exit\n')
+
+    def test_simulate_stream_events(self):
+        # Test case: Output arrives as SSE events and the run ends with a result event
+        test_code = '''
+.text
+main:
+    li $t0, 0
+    li $t1, 3
+loop:
+    addi $t0, $t0, 1
+    li $v0, 1
+    move $a0, $t0
+    syscall
+    bne $t0, $t1, loop
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/simulate-stream',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/event-stream'))
+        events = []
+        for message in response.get_data(as_text=True).split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in message.splitlines() if line)
+            if 'event' in lines:
+                events.append((lines['event'], json.loads(lines['data'])))
+        output = ''.join(data['text'] for event, data in events if event == 'output')
+        self.assertEqual(output, '123Program exit\n')
+        event, result = events[-1]
+        self.assertEqual(event, 'result')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['data']['registers']['t0'], 3)
+        self.assertNotIn('console_output', result['data'])
+
+        # A full queue blocks the producer until the consumer goes away
+        stream = api.EventStream(maxsize=2)
+        writer = threading.Thread(target=lambda: [stream.write('x') for _ in range(10)])
+        writer.start()
+        writer.join(0.3)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(stream.queue.qsize(), 2)
+        stream.cancel_event.set()
+        writer.join(2)
+        self.assertFalse(writer.is_alive())
+
+        response = self.app.post('/api/simulate-stream',
+                               data=json.dumps({'code': '.text\n    bogus $t0'}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # Requests without source code are rejected like /api/simulate does
+        for url, body in (('/api/simulate-stream', {'code': 42}),
+                          ('/api/simulate-stream', {'code': None}),
+                          ('/api/simulate-stream', {'binary': {'format': 'hex'}}),
+                          ('/api/simulate', {'code': 42}),
+                          ('/api/simulate', {'binary': 5})):
+            response = self.app.post(url, data=json.dumps(body),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400, (url, body))
+
+    def test_assemble_machine_code(self):
+        # Test case: /api/assemble encodes MIPS words and maps them back to source lines
+        test_code = '''.data
+    msg: .word 1
+.text
+main:
+    add $t0, $t1, $t2
+    addi $t0, $zero, 5
+    la $a0, msg
+loop:
+    lw $t0, 4($sp)
+    beq $t0, $t1, loop   # branches back over the expanded la
+    li $t2, 100000
+    j main
+    syscall
+'''
+        response = self.app.post('/api/assemble',
+                               data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['image'], [
+            '012a4020', '20080005', '3c041001', '34840000', '8fa80004',
+            '1109fffe', '3c0a0001', '354a86a0', '08000000', '0000000c'])
+        self.assertEqual(data['source_lines'], [5, 6, 7, 7, 9, 10, 11, 11, 12, 13])
+        self.assertEqual(data['labels']['loop'], 16)
+        self.assertEqual(data['labels']['msg'], 0x10010000)
+
+        response = self.app.post('/api/assemble',
+                               data=json.dumps({'code': test_code, 'format': 'base64'}),
+                               content_type='application/json')
+        image = base64.b64decode(json.loads(response.data)['data']['image'])
+        self.assertEqual(image[:4], bytes.fromhex('20402a01'))
+        self.assertEqual(len(image), 40)
+
+    def test_simulate_pre_assembled_binary(self):
+        # Test case: A program assembled by /api/assemble runs from its machine code
+        test_code = '''
+.data
+    msg: .asciiz "sum="
+    values: .word 3, -4, 70000
+
+.text
+main:
+    la $t0, values
+    li $t1, 3
+    li $t2, 0
+loop:
+    lw $t3, 0($t0)
+    add $t2, $t2, $t3
+    addi $t0, $t0, 4
+    addi $t1, $t1, -1
+    bne $t1, $zero, loop
+    li $v0, 4
+    la $a0, msg
+    syscall
+    li $v0, 1
+    move $a0, $t2
+    syscall
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'include_memory': True}),
+                               content_type='application/json')
+        expected = json.loads(response.data)['data']
+        self.assertIn('sum=69999', expected['console_output'])
+
+        for output_format in ('hex', 'base64'):
+            response = self.app.post('/api/assemble',
+                                   data=json.dumps({'code': test_code, 'format': output_format}),
+                                   content_type='application/json')
+            binary = json.loads(response.data)['data']
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'binary': binary, 'include_memory': True}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            result = json.loads(response.data)['data']
+            self.assertEqual(result['console_output'], expected['console_output'])
+            self.assertEqual(result['registers'], expected['registers'])
+            self.assertEqual(result['memory'], expected['memory'])
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'binary': {'format': 'hex', 'image': ['zz']}}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sqlite_sessions_shared_between_stores(self):
+        # Test case: Two stores over one database (two server processes) serve the same session
+        test_code = '''
+.data
+    value: .word 7
+
+.text
+    lw $t0, value
+    addi $t0, $t0, 1
+    sw $t0, value
+    lw $t1, value
+'''
+        saved = api.execution_states
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.sqlite3')
+            workers = [SQLiteSessionStore(path, api.serialize_session, api.deserialize_session,
+                                          api.session_size, lambda state: state['seq'],
+                                          ttl=60, memory_budget=1 << 20)
+                       for _ in range(2)]
+            try:
+                api.execution_states = workers[0]
+                session_id = json.loads(self.app.post('/api/init-step',
+                                                      data=json.dumps({'code': test_code}),
+                                                      content_type='application/json').data)['session_id']
+                for worker in (1, 0, 1, 1):
+                    api.execution_states = workers[worker]
+                    status, data = self.step(session_id)
+                    self.assertEqual(status, 200)
+                self.assertEqual(data['data']['registers']['t0'], 8)
+                self.assertEqual(data['data']['registers']['t1'], 8)
+                self.assertEqual(data['data']['pc'], 16)
+                self.assertEqual(data['seq'], 4)
+
+                # Each worker reloads only what the other one changed
+                self.assertEqual(workers[0].stats()['loads'], 1)
+                self.assertEqual(workers[1].stats()['loads'], 2)
+                self.assertEqual(workers[1].stats()['cache_hits'], 1)
+                self.assertEqual(workers[0].stats()['sessions'], 1)
+
+                workers[1].delete(session_id)
+                api.execution_states = workers[0]
+                status, data = self.step(session_id)
+                self.assertEqual(status, 400)
+            finally:
+                api.execution_states = saved
+
+    def test_server_timing_and_metrics(self):
+        # Test case: Responses carry per-phase Server-Timing and /api/metrics aggregates them
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': '.text\n    li $t0, 1\n    addi $t0, $t0, 2'}),
+                               content_type='application/json')
+        timings = dict(entry.split(';dur=') for entry in response.headers['Server-Timing'].split(', '))
+        for name in ('assemble', 'execute', 'serialize', 'total'):
+            self.assertGreaterEqual(float(timings[name]), 0.0)
+
+        response = self.app.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE mips_request_duration_seconds histogram', text)
+        self.assertIn('mips_request_duration_seconds_bucket{endpoint="/api/simulate",phase="execute",le="+Inf"}', text)
+        self.assertIn('mips_requests_total{endpoint="/api/simulate",status="200"}', text)
+        self.assertIn('mips_program_cache_hit_ratio ', text)
+        self.assertIn('mips_sessions ', text)
+        executed = [line for line in text.splitlines()
+                    if line.startswith('mips_instructions_executed_total ')]
+        self.assertGreaterEqual(float(executed[0].split()[1]), 2)
+
+    def test_benchmark_workloads_are_correct(self):
+        # Test case: Every benchmark workload runs to completion with its expected output
+        for name, (source, expected) in benchmark.workloads(scale=0.01).items():
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': source}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200, name)
+            data = json.loads(response.data)['data']
+            self.assertEqual(data['console_output'], expected, name)
+            self.assertFalse(data['budget_exhausted'], name)
+
+    def test_pipeline_timing_model(self):
+        # Test case: Cycle accounting with a load-use stall, forwarding and taken-branch flushes
+        code = '''
+.data
+    x: .word 5
+.text
+main:
+    la $t0, x
+    lw $t1, 0($t0)
+    add $t2, $t1, $t1
+    li $t4, 100
+loop:
+    addi $t4, $t4, -1
+    bne $t4, $zero, loop
+    li $v0, 10
+    syscall
+'''
+        reports = []
+        for threshold in (api.app.config['JIT_THRESHOLD'], 0):
+            saved = api.app.config['JIT_THRESHOLD']
+            api.app.config['JIT_THRESHOLD'] = threshold
+            program_cache.clear()
+            try:
+                response = self.app.post('/api/simulate',
+                                       data=json.dumps({'code': code, 'pipeline': True}),
+                                       content_type='application/json')
+            finally:
+                api.app.config['JIT_THRESHOLD'] = saved
+                program_cache.clear()
+            self.assertEqual(response.status_code, 200)
+            reports.append(json.loads(response.data)['data']['pipeline'])
+        # Compiled blocks and the interpreter produce the same trace
+        self.assertEqual(reports[0], reports[1])
+
+        pipeline = reports[0]
+        self.assertEqual(pipeline['instructions'], 206)
+        self.assertEqual(pipeline['load_use_stalls'], 1)
+        self.assertEqual(pipeline['flushes'], 99)
+        self.assertEqual(pipeline['flush_cycles'], 198)
+        self.assertEqual(pipeline['forwards'], {'ex_mem': 103, 'mem_wb': 1})
+        self.assertEqual(pipeline['cycles'], 206 + 4 + 1 + 198)
+        self.assertAlmostEqual(pipeline['cpi'], 409 / 206)
+        per_pc = {row['pc']: row for row in pipeline['per_instruction']}
+        self.assertEqual(per_pc[8]['stalls'], 1)
+        self.assertEqual(per_pc[20]['executions'], 100)
+        self.assertEqual(per_pc[20]['flush_cycles'], 198)
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'pipeline': {'branch_penalty': -1}}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_model(self):
+        # Test case: Cache statistics from one simulate pass, including stack-distance sizes
+        code = '''
+.data
+    array: .word 1, 2, 3, 4, 5, 6, 7, 8
+.text
+main:
+    li $s0, 2
+outer:
+    la $t0, array
+    li $t1, 8
+inner:
+    lw $t2, 0($t0)
+    sw $t2, 0($t0)
+    addi $t0, $t0, 4
+    addi $t1, $t1, -1
+    bne $t1, $zero, inner
+    addi $s0, $s0, -1
+    bne $s0, $zero, outer
+    li $v0, 10
+    syscall
+'''
+        cache = {'size': 16, 'block_size': 16, 'sizes': [16, 32]}
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'cache': cache}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        report = json.loads(response.data)['data']['cache']
+        # One block: each pass misses on both halves of the array
+        self.assertEqual(report['accesses'], 32)
+        self.assertEqual((report['reads'], report['writes']), (16, 16))
+        self.assertEqual(report['misses'], 4)
+        self.assertEqual(report['read_misses'], 4)
+        self.assertEqual(report['evictions'], 3)
+        self.assertEqual(report['writebacks'], 3)
+        self.assertEqual(report['per_pc'][0], {
+            'pc': 12, 'instruction': 'lw $t2, 0($t0)', 'accesses': 16, 'misses': 4})
+        self.assertEqual(report['sizes'], [
+            {'size': 16, 'misses': 4, 'hit_rate': 28 / 32},
+            {'size': 32, 'misses': 2, 'hit_rate': 30 / 32}])
+
+        # The same probe on a step session sees the same accesses
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': code, 'cache': cache}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        response = self.app.post('/api/step',
+                               data=json.dumps({'session_id': session_id}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['cache']['accesses'], 0)
+        response = self.app.post('/api/run',
+                               data=json.dumps({'session_id': session_id}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['cache'], report)
+
+        for cache in ({'replacement': 'random'}, {'size': 2 ** 27},
+                      {'sizes': [1024, 2 ** 24]}):
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': code, 'cache': cache}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_branch_prediction_model(self):
+        # Test case: Per-branch predictor statistics and return-address stack accuracy
+        code = '''
+.text
+main:
+    li $t0, 10
+outer:
+    li $t1, 100
+inner:
+    addi $t1, $t1, -1
+    bne $t1, $zero, inner
+    jal leaf
+    addi $t0, $t0, -1
+    bne $t0, $zero, outer
+    li $v0, 10
+    syscall
+leaf:
+    jr $ra
+'''
+        reports = []
+        for threshold in (api.app.config['JIT_THRESHOLD'], 0):
+            saved = api.app.config['JIT_THRESHOLD']
+            api.app.config['JIT_THRESHOLD'] = threshold
+            program_cache.clear()
+            try:
+                response = self.app.post('/api/simulate',
+                                       data=json.dumps({'code': code, 'branch_prediction': True}),
+                                       content_type='application/json')
+            finally:
+                api.app.config['JIT_THRESHOLD'] = saved
+                program_cache.clear()
+            self.assertEqual(response.status_code, 200)
+            reports.append(json.loads(response.data)['data']['branch_prediction'])
+        # Compiled loops are accounted for exactly like interpreted ones
+        self.assertEqual(reports[0], reports[1])
+
+        report = reports[0]
+        self.assertEqual(report['branches'], 1010)
+        self.assertEqual(report['taken'], 999)
+        inner, outer = report['per_branch']
+        self.assertEqual((inner['pc'], inner['executions'], inner['taken']), (12, 1000, 990))
+        self.assertEqual(inner['mispredicts']['static_not_taken'], 990)
+        # 1-bit: wrong on entry and exit; 2-bit: only the first entry and each exit
+        self.assertEqual(inner['mispredicts']['one_bit'], 20)
+        self.assertEqual(inner['mispredicts']['two_bit'], 11)
+        self.assertEqual(outer['mispredicts']['one_bit'], 2)
+        self.assertEqual(report['predictors']['two_bit']['mispredicts'], 13)
+        self.assertEqual(report['returns'], {'executions': 10, 'mispredicts': 0, 'accuracy': 1.0})
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'branch_prediction': {'ras_depth': 0}}),
+                               content_type='application/json')
+        report = json.loads(response.data)['data']['branch_prediction']
+        self.assertEqual(report['returns']['mispredicts'], 10)
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code,
+                                                'branch_prediction': {'table_bits': 4, 'history_bits': 8}}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # A loop that ends the program: its exit falls off the text segment
+        code = '''
+main:
+    li $t0, 10
+loop:
+    addi $t0, $t0, -1
+    bne $t0, $zero, loop
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'branch_prediction': True}),
+                               content_type='application/json')
+        reports = [json.loads(response.data)['data']['branch_prediction']]
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': code, 'branch_prediction': True}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        response = self.app.post('/api/run',
+                               data=json.dumps({'session_id': session_id}),
+                               content_type='application/json')
+        reports.append(json.loads(response.data)['data']['branch_prediction'])
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': code, 'branch_prediction': True}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        for _ in range(21):
+            response = self.app.post('/api/step',
+                                   data=json.dumps({'session_id': session_id}),
+                                   content_type='application/json')
+        reports.append(json.loads(response.data)['data']['branch_prediction'])
+        for report in reports:
+            self.assertEqual((report['branches'], report['taken']), (10, 9))
+            self.assertEqual(report['per_branch'][0]['mispredicts']['static_not_taken'], 9)
+
+    # Test case: Read syscalls consume the supplied stdin and output is capped
+    def test_input_syscalls_and_output_limit(self):
+        code = '''
+.data
+    buf: .word 0, 0, 0, 0
+.text
+main:
+    li $v0, 5
+    syscall
+    move $t0, $v0
+    li $v0, 5
+    syscall
+    add $a0, $t0, $v0
+    li $v0, 1
+    syscall
+    li $v0, 8
+    la $a0, buf
+    li $a1, 6
+    syscall
+    li $v0, 4
+    syscall
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'stdin': '3\n-10\nhello world\n'}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        # read_string stores at most $a1 - 1 characters plus the terminator
+        self.assertEqual(data['console_output'], '-7helloProgram exit\n')
+        self.assertFalse(data['output_truncated'])
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'stdin': '3\n'}),
+                               content_type='application/json')
+        self.assertIn('read_int: no input left',
+                      json.loads(response.data)['data']['console_output'])
+
+        # Stepping back over a read rewinds the input as well
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': code, 'stdin': '3\n-10\nhello world\n'}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        self.app.post('/api/run', data=json.dumps({'session_id': session_id}),
+                      content_type='application/json')
+        response = self.app.post('/api/step-back',
+                               data=json.dumps({'session_id': session_id, 'steps': 11}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['console_output'], '')
+        response = self.app.post('/api/run', data=json.dumps({'session_id': session_id}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['console_output'],
+                         '-7helloProgram exit\n')
+
+        loop = '''
+.data
+    digits: .asciiz "0123456789"
+.text
+main:
+    li $t0, 100
+    la $a0, digits
+    li $v0, 4
+loop:
+    syscall
+    addi $t0, $t0, -1
+    bne $t0, $zero, loop
+    li $v0, 10
+    syscall
+'''
+        saved = api.app.config['OUTPUT_LIMIT']
+        api.app.config['OUTPUT_LIMIT'] = 50
+        try:
+            response = self.app.post('/api/simulate', data=json.dumps({'code': loop}),
+                                   content_type='application/json')
+        finally:
+            api.app.config['OUTPUT_LIMIT'] = saved
+        data = json.loads(response.data)['data']
+        self.assertTrue(data['output_truncated'])
+        self.assertEqual(data['console_output'],
+                         '0123456789' * 5 + '\n[Output truncated: 963 more characters]\n')
+
+    # Test case: /api/memory returns windows of a session's memory; responses omit it by default
+    def test_memory_window_queries(self):
+        test_code = '''
+.data
+    values: .word 1, -2, 0, 4
+    text: .asciiz "hi"
+
+.text
+main:
+    la $t0, values
+    li $t1, 127
+    sw $t1, 8($t0)
+    sw $t1, 8192($t0)
+    li $v0, 10
+    syscall
+'''
+        response = self.app.post('/api/simulate', data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        self.assertNotIn('memory', json.loads(response.data)['data'])
+
+        def post(url, **body):
+            response = self.app.post(url, data=json.dumps(body),
+                                   content_type='application/json')
+            return response.status_code, json.loads(response.data)
+
+        status, data = post('/api/init-step', code=test_code)
+        session_id = data['session_id']
+        status, data = post('/api/run', session_id=session_id)
+        self.assertNotIn('memory', data['data'])
+
+        status, data = post('/api/memory', session_id=session_id, start='values',
+                            length=16, format='word')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['data']['values'], [1, -2, 0x7f, 4])
+        self.assertEqual(data['data']['next'], 0x10010010)
+
+        status, data = post('/api/memory', session_id=session_id, start='text', length=4)
+        self.assertEqual(data['data']['values'], [ord('h'), ord('i'), 0, 0])
+
+        # Non-zero bytes across the whole .data range, two at a time
+        status, data = post('/api/memory', session_id=session_id, nonzero=True, limit=2)
+        self.assertEqual(data['data']['entries'], {str(0x10010000): 1, str(0x10010004): 0xfe})
+        self.assertEqual(data['data']['next'], 0x10010005)
+        status, data = post('/api/memory', session_id=session_id, nonzero=True,
+                            format='word', start=0x10010008)
+        self.assertEqual(data['data']['entries'], {str(0x10010008): 0x7f, str(0x1001000c): 4,
+                                                   str(0x10010010): ord('h') | ord('i') << 8,
+                                                   str(0x10012000): 0x7f})
+        self.assertIsNone(data['data']['next'])
+
+        status, data = post('/api/memory', session_id=session_id, start=0x10010002,
+                            length=4, format='word')
+        self.assertEqual(status, 400)
+        status, data = post('/api/memory', session_id=session_id, length=1 << 20)
+        self.assertEqual(status, 400)
+
+    # Test case: Field projection, MessagePack and packed state responses, gzip and session ETags
+    def test_response_formats(self):
+        test_code = '''
+.data
+    value: .word 7
+
+.text
+main:
+    li $t0, 5
+    la $t1, value
+    sw $t0, 0($t1)
+    li $v0, 1
+    move $a0, $t0
+    syscall
+    li $v0, 10
+    syscall
+'''
+        url = '/api/simulate?fields=console_output,registers.a0'
+        response = self.app.post(url, data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data),
+                         {'success': True,
+                          'data': {'console_output': '5Program exit\n', 'registers': {'a0': 5}}})
+
+        response = self.app.post(url, data=json.dumps({'code': test_code}),
+                               content_type='application/json',
+                               headers={'Accept': 'application/msgpack'})
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        self.assertEqual(response.data,
+                         b'\x82\xa7success\xc3\xa4data\x82\xaeconsole_output\xae5Program exit\n'
+                         b'\xa9registers\x81\xa2a0\x05')
+
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': test_code, 'include_memory': True}),
+                               content_type='application/json',
+                               headers={'Accept': 'application/vnd.mips-state'})
+        body = response.data
+        magic, flags, seq, pc, mask, runs = struct.unpack_from('<4sIIIII', body)
+        self.assertEqual((magic, pc, mask, runs), (b'MST1', 28, 0xFFFFFFFF, 1))
+        registers = struct.unpack_from('<32i', body, 24)
+        self.assertEqual((registers[4], registers[8], registers[29]), (5, 5, 0x7FFFFFFC))
+        self.assertEqual(struct.unpack_from('<II', body, 152), (0x10010000, 1))
+        self.assertEqual(body[160:], b'\x055Program exit\n')
+
+        # Errors have no state to pack and stay JSON
+        response = self.app.post('/api/simulate', data=json.dumps({'code': 'nonsense'}),
+                               content_type='application/json',
+                               headers={'Accept': 'application/vnd.mips-state'})
+        self.assertEqual(response.mimetype, 'application/json')
+
+        big = '.text\nmain:\n' + '    addi $t0, $t0, 1\n' * 2000
+        response = self.app.post('/api/assemble', data=json.dumps({'code': big}),
+                               content_type='application/json',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(json.loads(gzip.decompress(response.data))['success'])
+        response = self.app.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.app.post('/api/init-step', data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        url = f'/api/sessions/{session_id}?fields=pc,registers.t0'
+        response = self.app.get(url)
+        etag = response.headers['ETag']
+        self.assertEqual(json.loads(response.data)['data'], {'pc': 0, 'registers': {'t0': 0}})
+        response = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        self.app.post('/api/step', data=json.dumps({'session_id': session_id}),
+                      content_type='application/json')
+        response = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['data'], {'pc': 4, 'registers': {'t0': 5}})
+
+    # Test case: .byte/.half/.space/.align directives, alignment and lazily zero-filled data
+    def test_data_directives(self):
+        test_code = '''
+.data
+    flag: .byte 1
+    halves: .half 0x1234, -1
+    odd: .byte 7, 8, 9
+    table:
+    .word 10, 0x20, 3:2
+    buffer: .space 400000
+    .align 3
+    after: .word 5
+    zeros: .word 0:1000000
+    msg: .ascii "ab"
+    end: .asciiz "c"
+
+.text
+main:
+    la $t0, table
+    lw $t1, 12($t0)
+    la $t0, buffer
+    li $t2, 99
+    sw $t2, 396($t0)
+    lw $t3, 396($t0)
+    li $v0, 4
+    la $a0, msg
+    syscall
+    li $v0, 10
+    syscall
+'''
+        assembled = api.assemble(test_code)
+        labels = {label: address - 0x10010000 for label, address in assembled.labels.items()
+                  if address >= 0x10010000}
+        # Words and halves are aligned to their size, labels on their own line move along
+        self.assertEqual(labels, {'flag': 0, 'halves': 2, 'odd': 6, 'table': 12, 'buffer': 28,
+                                  'after': 400032, 'zeros': 400036, 'msg': 4400036,
+                                  'end': 4400038})
+        self.assertEqual(assembled.memory.read(0x10010000, 28).hex(),
+                         '01003412ffff0708090000000a000000200000000300000003000000')
+        # Only the pages holding initialised data are allocated
+        self.assertEqual(len(assembled.memory.pages), 3)
+
+        response = self.app.post('/api/simulate', data=json.dumps({'code': test_code}),
+                               content_type='application/json')
+        data = json.loads(response.data)['data']
+        self.assertEqual((data['registers']['t1'], data['registers']['t3']), (3, 99))
+        self.assertEqual(data['console_output'], 'abcProgram exit\n')
+
+        # Repeats spanning pages are filled one page at a time
+        assembled = api.assemble('.data\n    .byte 9\n    .half 0x1234:5000\n.text\nmain:\n    syscall')
+        self.assertEqual(assembled.memory.read(0x10010000, 10002),
+                         b'\x09\x00' + b'\x34\x12' * 5000)
+
+        # Oversized repeats fail before anything is allocated
+        for directive in ('.space -1', '.align 20', '.word x', '.byte 1:-2', '.word 1:1000000000',
+                          '.space 4000000000\n    .word 1:10000000'):
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': f'.data\n    {directive}\n.text\nmain:\n    syscall'}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Invalid data directive', json.loads(response.data)['error'])
+
+    # Test case: Shift amounts outside 0..31 are rejected when the program is loaded
+    def test_shift_amount_out_of_range(self):
+        for shift in ('32', '500000000', '-1'):
+            response = self.app.post('/api/simulate',
+                                   data=json.dumps({'code': f'.text\nmain:\n    sll $t0, $t1, {shift}',
+                                                    'time_limit': 1}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Shift amount', json.loads(response.data)['error'])
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': '.text\nmain:\n    li $t1, 5\n    srl $t0, $t1, 31'}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['registers']['t0'], 0)
+
+    # Test case: Compiled blocks run syscalls and report the failing instruction
+    def test_compiled_block_syscalls_and_errors(self):
+        code = '''
+main:
+    li $t0, 0
+loop:
+    li $v0, 5
+    syscall
+    add $t0, $t0, $v0
+    move $a0, $t0
+    li $v0, 1
+    syscall
+    j loop
+'''
+        saved = app.config['JIT_THRESHOLD']
+        results = []
+        try:
+            for threshold in (0, 1):
+                app.config['JIT_THRESHOLD'] = threshold
+                program_cache.clear()
+                for probes in ({}, {'pipeline': True}):
+                    request = dict(code=code, stdin='1\n2\n3\n', **probes)
+                    response = self.app.post('/api/simulate',
+                                           data=json.dumps(request),
+                                           content_type='application/json')
+                    results.append(json.loads(response.data)['data'])
+        finally:
+            app.config['JIT_THRESHOLD'] = saved
+            program_cache.clear()
+        for data in results:
+            # The fourth read fails inside the loop: its pc is reported and
+            # the registers written earlier in the block are kept
+            self.assertTrue(data['console_output'].startswith('136Error executing instruction: syscall'))
+            self.assertEqual(data['pc'], 8)
+            self.assertEqual(data['registers']['t0'], 6)
+            self.assertEqual(data['registers']['v0'], 5)
+            self.assertEqual(data['instructions_executed'], 24)
+        self.assertEqual(results[1]['pipeline'], results[3]['pipeline'])
+
+    # Test case: Stepping back to a journal checkpoint restores the state after that step
+    def test_step_back_to_journal_checkpoint(self):
+        code = '''
+main:
+    li $v0, 1
+    li $a0, 7
+loop:
+    addi $t0, $t0, 1
+    syscall
+    j loop
+'''
+        def post(url, **body):
+            response = self.app.post(url, data=json.dumps(body),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+        session_id = post('/api/init-step', code=code)['session_id']
+        # The last of these steps takes a checkpoint; it is the syscall of
+        # the 341st iteration
+        for _ in range(api.JOURNAL_CHECKPOINT_INTERVAL):
+            data = post('/api/step', session_id=session_id)
+        self.assertEqual(data['data']['pc'], 16)
+
+        post('/api/run', session_id=session_id, steps=10)
+        data = post('/api/step-back', session_id=session_id, steps=10)
+        self.assertEqual(data['rewound'], 10)
+        self.assertEqual(data['data']['pc'], 16)
+        self.assertEqual(data['data']['registers']['t0'], 341)
+        self.assertEqual(data['data']['console_output'], '7' * 341)
+
+    # Test case: Shifts give the same result from source and from the assembled image
+    def test_shift_source_matches_binary(self):
+        code = '''
+main:
+    li $t1, -8
+    sll $t2, $t1, 31
+    srl $t3, $t1, 31
+    sll $t4, $t1, 0
+    srl $t5, $t1, 3
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code}),
+                               content_type='application/json')
+        expected = json.loads(response.data)['data']['registers']
+        self.assertEqual(expected['t3'], 1)
+        self.assertEqual(expected['t5'], 0x1FFFFFFF)
+
+        response = self.app.post('/api/assemble',
+                               data=json.dumps({'code': code}),
+                               content_type='application/json')
+        binary = json.loads(response.data)['data']
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'binary': binary}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['registers'], expected)
+
+        # The shamt field holds five bits; larger amounts are rejected, not masked
+        for amount in (32, 33):
+            response = self.app.post('/api/assemble',
+                                   data=json.dumps({'code': f'sll $t0, $t1, {amount}'}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Shift amount', json.loads(response.data)['error'])
+
+        for body in ({'code': 42}, {'code': ['sll $t0, $t1, 1']}, {}):
+            response = self.app.post('/api/assemble', data=json.dumps(body),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    # Test case: A stream whose client stops reading gives up at the deadline
+    def test_event_stream_stalled_client(self):
+        stream = api.EventStream(maxsize=1, deadline=time.monotonic() + 0.3)
+        stream.write('a')
+        started = time.monotonic()
+        # The queue stays full: the put returns once the deadline has passed
+        stream.write('b')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertTrue(stream.cancel_event.is_set())
+        stream.put('result', {'success': True})
+        self.assertEqual(stream.queue.get_nowait(), ('output', 'a'))
+        self.assertTrue(stream.queue.empty())
+
+    # Test case: A restored session keeps its instruction count and probe state
+    def test_session_blob_keeps_history_time_and_probes(self):
+        code = '''
+main:
+    li $t0, 3
+loop:
+    sw $t0, 0($sp)
+    addi $t0, $t0, -1
+    bne $t0, $zero, loop
+'''
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': code, 'cache': True, 'pipeline': True,
+                                                'branch_prediction': True}),
+                               content_type='application/json')
+        session_id = json.loads(response.data)['session_id']
+        for _ in range(5):
+            self.step(session_id)
+        state = api.execution_states.get(session_id)
+        restored = api.deserialize_session(api.serialize_session(state))
+        self.assertEqual(restored['history'].time, 5)
+        self.assertEqual([probe.report() for probe in restored['probes']],
+                         [probe.report() for probe in state['probes']])
+
+        # Stepping on from the restored state counts on from there
+        api.execution_states.save(session_id, restored)
+        for _ in range(3):
+            status, data = self.step(session_id)
+        self.assertEqual(data['data']['branch_prediction']['branches'], 2)
+        # History restarts at the restore: only the new steps can be undone
+        response = self.app.post('/api/step-back',
+                               data=json.dumps({'session_id': session_id, 'steps': 5}),
+                               content_type='application/json')
+        data = json.loads(response.data)
+        self.assertEqual((data['rewound'], data['instructions_executed'], data['history_start']),
+                         (3, 5, 5))
+
+        # Probe state is only ever read back as probe objects
+        state['probes'] = [collections.OrderedDict()]
+        with self.assertRaises(pickle.UnpicklingError):
+            api.deserialize_session(api.serialize_session(state))
+
+    # Test case: /api/run reports completion and the pc the program stopped at
+    def test_run_to_completion(self):
+        def run(code):
+            response = self.app.post('/api/init-step',
+                                   data=json.dumps({'code': code}),
+                                   content_type='application/json')
+            session_id = json.loads(response.data)['session_id']
+            response = self.app.post('/api/run',
+                                   data=json.dumps({'session_id': session_id}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.data)
+
+        # Past the last instruction
+        data = run('li $t0, 1\nli $t1, 2\nadd $t2, $t0, $t1')
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['stop_reason'], 'completed')
+        self.assertEqual(data['data']['pc'], 12)
+
+        # A jump out of the text segment
+        data = run('li $t0, 64\njr $t0\nli $t1, 1')
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['data']['pc'], 64)
+
+        # The exit syscall: the pc moves past it, as with /api/step
+        data = run('li $v0, 10\nsyscall\nli $t1, 1\nli $t1, 2')
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['stop_reason'], 'completed')
+        self.assertEqual(data['data']['pc'], 8)
+
+    # Test case: A session's console stays within OUTPUT_LIMIT across calls
+    def test_session_output_limit(self):
+        code = '''
+.data
+    msg: .asciiz "0123456789"
+.text
+main:
+    la $a0, msg
+    li $v0, 4
+loop:
+    syscall
+    j loop
+'''
+        saved = app.config['OUTPUT_LIMIT']
+        app.config['OUTPUT_LIMIT'] = 1000
+        try:
+            response = self.app.post('/api/init-step',
+                                   data=json.dumps({'code': code}),
+                                   content_type='application/json')
+            session_id = json.loads(response.data)['session_id']
+            for _ in range(5):
+                self.app.post('/api/run',
+                              data=json.dumps({'session_id': session_id, 'steps': 300}),
+                              content_type='application/json')
+            for _ in range(4):
+                self.step(session_id)
+        finally:
+            app.config['OUTPUT_LIMIT'] = saved
+        output = api.execution_states.get(session_id)['output_buffer']
+        self.assertEqual(output, '0123456789' * 100 + api.SESSION_OUTPUT_TRUNCATED)
+
+        # Rewinding below the limit brings back the uncapped console
+        response = self.app.post('/api/step-back',
+                               data=json.dumps({'session_id': session_id, 'steps': 1504 - 42}),
+                               content_type='application/json')
+        data = json.loads(response.data)
+        self.assertEqual(data['instructions_executed'], 42)
+        self.assertEqual(data['data']['console_output'], '0123456789' * 20)
+
+    # Test case: A session's console output counts towards its size
+    def test_session_size_counts_output(self):
+        response = self.app.post('/api/init-step',
+                               data=json.dumps({'code': 'li $t0, 1'}),
+                               content_type='application/json')
+        state = api.execution_states.get(json.loads(response.data)['session_id'])
+        size = api.session_size(state)
+        api.append_session_output(state, 'x' * 5000)
+        self.assertEqual(api.session_size(state), size + 5000)
+
+    # Test case: 16-bit immediates round-trip through the image; wider ones are rejected
+    def test_immediate_source_matches_binary(self):
+        code = '''
+main:
+    addi $t0, $zero, 32767
+    addi $t1, $t0, -32768
+    ori $t2, $zero, 65535
+    andi $t3, $t1, 65535
+    addi $sp, $sp, -64
+    sw $t1, 32($sp)
+    lw $t4, 32($sp)
+    sw $t2, -4($sp)
+    lw $t5, -4($sp)
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code}),
+                               content_type='application/json')
+        expected = json.loads(response.data)['data']['registers']
+        self.assertEqual((expected['t1'], expected['t2'], expected['t3']), (-1, 65535, 65535))
+
+        response = self.app.post('/api/assemble',
+                               data=json.dumps({'code': code}),
+                               content_type='application/json')
+        binary = json.loads(response.data)['data']
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'binary': binary}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['registers'], expected)
+
+        for line in ('addi $t0, $zero, 40000', 'addi $t0, $zero, -32769',
+                     'ori $t0, $zero, 65536', 'lw $t0, 40000($sp)', 'sw $t0, -32772($sp)'):
+            response = self.app.post('/api/assemble',
+                                   data=json.dumps({'code': line}),
+                                   content_type='application/json')
+            self.assertEqual(response.status_code, 400, line)
+            self.assertIn('out of range', json.loads(response.data)['error'])
+
+    # Test case: andi/ori immediates are zero-extended from source and from machine code
+    def test_logical_immediates_zero_extend(self):
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': 'ori $t0, $zero, 65535\nandi $t1, $t0, 32768'}),
+                               content_type='application/json')
+        registers = json.loads(response.data)['data']['registers']
+        self.assertEqual((registers['t0'], registers['t1']), (65535, 32768))
+
+        # The same words written by hand: the immediates' top bits are set
+        image = [f'{0x0D << 26 | 8 << 16 | 0xFFFF:08x}', f'{0x0C << 26 | 8 << 21 | 9 << 16 | 0x8000:08x}']
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'binary': {'format': 'hex', 'image': image}}),
+                               content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['registers'], registers)
+
+        for line in ('ori $t0, $zero, -1', 'andi $t0, $t0, -32768'):
+            for url in ('/api/simulate', '/api/assemble'):
+                response = self.app.post(url, data=json.dumps({'code': line}),
+                                       content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Logical immediate', json.loads(response.data)['error'])
+
+    # Test case: Strings outside Latin-1 are stored and printed as UTF-8
+    def test_utf8_strings(self):
+        code = '''
+.data
+    msg: .asciiz "π ≈ 3.14 ✓\\n"
+    buf: .space 16
+.text
+main:
+    li $v0, 4
+    la $a0, msg
+    syscall
+    li $v0, 8
+    la $a0, buf
+    li $a1, 6
+    syscall
+    li $v0, 4
+    syscall
+    li $v0, 8
+    li $a1, 16
+    syscall
+    li $v0, 4
+    syscall
+'''
+        response = self.app.post('/api/simulate',
+                               data=json.dumps({'code': code, 'stdin': '日本語\n'}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # A 6-byte buffer holds one three-byte character; the rest is read next
+        self.assertEqual(json.loads(response.data)['data']['console_output'],
+                         'π ≈ 3.14 ✓\n日本語\n')
+        memory = api.assemble(code).memory
+        self.assertEqual(memory.read_cstring(0x10010000), 'π ≈ 3.14 ✓\n'.encode('utf-8'))
+
+    # Test case: Stack distances give the misses of fully associative LRU caches
+    def test_cache_stack_distances(self):
+        blocks = [(i * 7919) % 97 if i % 3 else i % 40 for i in range(5000)]
+        model = api.CacheModel([(api.OP_LW, 8, 9, 0)], ['lw $t0, 0($t1)'],
+                               sizes=[64, 256, 1024])
+        model.consume([], [(0, block * 16) for block in blocks])
+        expected = []
+        for size in (64, 256, 1024):
+            lru = collections.OrderedDict()
+            misses = 0
+            for block in blocks:
+                if block in lru:
+                    lru.move_to_end(block)
+                    continue
+                misses += 1
+                lru[block] = True
+                if len(lru) > size // 16:
+                    lru.popitem(last=False)
+            expected.append(misses)
+        self.assertEqual([row['misses'] for row in model.report()['sizes']], expected)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -93,7 +93,8 @@ const Index = () => {
       setIsLoading(true);
       
       const response = await axios.post('https://anujpatil.pythonanywhere.com/api/step', {
-        session_id: sessionId
+        session_id: sessionId,
+        include_memory: true
       });
 
       if (response.data.success) {
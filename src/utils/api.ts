@@ -28,7 +28,8 @@ const API_BASE_URL ='https://anujpatil.pythonanywhere.com'  // Replace with your
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({ 
-        code: normalizedCode 
+        code: normalizedCode,
+        include_memory: true
       }),
     });
 